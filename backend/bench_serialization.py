@@ -0,0 +1,102 @@
+"""
+Benchmark: response serialization for list endpoints
+
+Compares the previous path for GET /api/activation-requests (parse ISO dates per row,
+validate against List[ActivationRequest], JSON encode) with the trusted-document path
+(TrustedDocumentAdapter + FastJSONResponse). No database needed.
+
+Usage: python bench_serialization.py [rows ...]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+from pydantic import TypeAdapter  # noqa: E402
+
+import server  # noqa: E402
+
+
+def make_documents(count: int) -> List[dict]:
+    """Documents shaped like what activation_requests stores today"""
+    now = datetime.now(timezone.utc)
+    docs = []
+    for i in range(count):
+        created = (now - timedelta(minutes=i)).isoformat()
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "dealer_name": f"Dealer {i}",
+            "dealer_mobile": "9876543210",
+            "dealer_email": f"dealer{i}@example.com",
+            "customer_name": f"Customer {i}",
+            "customer_mobile": "9123456789",
+            "customer_email": f"customer{i}@example.com",
+            "model_id": "iPhone 15 Pro",
+            "serial_number": f"SERIAL{i:08d}",
+            "plan_id": str(uuid.uuid4()),
+            "plan_name": "AppleCare+ for iPhone 15 Pro",
+            "plan_part_code": "SR183HN/A",
+            "plan_sku": "S9733ZM/A",
+            "plan_mrp": 23900.0,
+            "plan_product_key": "iphone pro",
+            "device_activation_date": "2026-01-15",
+            "billing_location": "F9B4869273B7",
+            "payment_type": "Insta",
+            "invoice_path": f"/app/backend/invoices/invoice_{i}.pdf",
+            "status": "pending_approval",
+            "tgme_ticket_id": None,
+            "email_sent": False,
+            "created_at": created,
+            "updated_at": created,
+        })
+    return docs
+
+
+list_adapter = TypeAdapter(List[server.ActivationRequest])
+
+
+def validated_path(docs: List[dict]) -> bytes:
+    """What the endpoint used to do: parse dates, validate via response_model, encode"""
+    for req in docs:
+        if isinstance(req.get('created_at'), str):
+            req['created_at'] = datetime.fromisoformat(req['created_at'])
+        if isinstance(req.get('updated_at'), str):
+            req['updated_at'] = datetime.fromisoformat(req['updated_at'])
+    content = list_adapter.dump_python(list_adapter.validate_python(docs), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def trusted_path(docs: List[dict]) -> bytes:
+    shaped = server.activation_request_documents.shape_many(docs)
+    return server.FastJSONResponse(shaped).body
+
+
+def measure(func, rows: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        docs = make_documents(rows)  # fresh copy - the validated path mutates documents
+        start = time.perf_counter()
+        func(docs)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    print(f"encoder: {'orjson' if server.orjson else 'json (orjson not installed)'}")
+    print(f"{'rows':>8} {'validated ms':>14} {'trusted ms':>12} {'speedup':>9}")
+    for rows in sizes:
+        repeat = 7 if rows <= 1000 else 3
+        old = measure(validated_path, rows, repeat)
+        new = measure(trusted_path, rows, repeat)
+        print(f"{rows:>8} {old:>14.2f} {new:>12.2f} {old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
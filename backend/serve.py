@@ -0,0 +1,43 @@
+"""
+Production launcher for the API
+
+Runs server:app under uvicorn with one worker process per core (override with WEB_CONCURRENCY),
+uvloop / httptools when installed, keep-alive tuned for a proxy in front, and a bounded
+graceful shutdown so in-flight requests finish on deploys. Startup is multi-worker safe:
+one worker seeds and migrates under a Mongo lease while the others wait for it.
+
+Usage: python serve.py
+"""
+import os
+import importlib.util
+
+import uvicorn
+
+
+def available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main():
+    workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '8001')),
+        workers=workers,
+        loop="uvloop" if available("uvloop") else "asyncio",
+        http="httptools" if available("httptools") else "h11",
+        # Longer than the proxy's upstream keep-alive so the proxy, not us, closes idle connections
+        timeout_keep_alive=int(os.environ.get('KEEP_ALIVE_TIMEOUT', '75')),
+        timeout_graceful_shutdown=int(os.environ.get('GRACEFUL_SHUTDOWN_TIMEOUT', '30')),
+        # uvicorn takes the client address from X-Forwarded-For only when the peer is in FORWARDED_ALLOW_IPS.
+        # Rate limits key on that address (server.client_ip) and leave the header alone unless TRUSTED_PROXY_HOPS is set.
+        proxy_headers=True,
+        forwarded_allow_ips=os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1'),
+        backlog=int(os.environ.get('BACKLOG', '2048')),
+        access_log=os.environ.get('ACCESS_LOG', '0') == '1',
+    )
+
+
+if __name__ == "__main__":
+    main()
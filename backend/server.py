@@ -1,42 +1,69 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, BackgroundTasks, Header, Query, Request
-from fastapi.responses import FileResponse, StreamingResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, RedirectResponse, Response, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import List, Optional
+from urllib.parse import urlencode
+from pydantic import BaseModel, Field, EmailStr, ConfigDict, ValidationError
+from typing import TYPE_CHECKING, List, Optional, Union
 import uuid
 from datetime import datetime, timezone, timedelta
-import bcrypt
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import jwt
 from jwt.exceptions import InvalidTokenError
-import aiosmtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
-import httpx
 import aiofiles
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+import aiofiles.os
 import io
-import openpyxl
-from openpyxl import Workbook
+import csv
+import tempfile
+import socket
 import hashlib
+import hmac
+import gzip
+import re
+import time
+import math
+import asyncio
+from collections import Counter, OrderedDict, defaultdict, deque
+import heapq
+import functools
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from starlette.datastructures import Headers, MutableHeaders
+
+if TYPE_CHECKING:
+    from email.mime.multipart import MIMEMultipart
+
+import json
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+try:
+    import brotli  # Optional - enables "br" content encoding when installed
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder on hosts without orjson
+    orjson = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection, opened in startup so each worker process gets its own client after fork
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+client = None
+db = None
+
+def connect_db():
+    global client, db
+    if client is None:
+        # tz_aware: timestamps are stored as native BSON dates and read back as UTC-aware datetimes
+        client = AsyncIOMotorClient(mongo_url, tz_aware=True)
+        db = client[os.environ['DB_NAME']]
 
 # JWT Secret
 JWT_SECRET = os.environ.get('JWT_SECRET', 'applecare-activation-secret-key-2025')
@@ -45,11 +72,10 @@ JWT_ALGORITHM = "HS256"
 # Default approval email recipient (fallback if not configured in settings)
 DEFAULT_APPROVAL_EMAIL = "contact@thegoodmen.in"
 
-# Upload directory
+# Flat-file invoice directories from before invoice storage; only read by the invoice migration
 UPLOAD_DIR = ROOT_DIR / 'uploads'
-UPLOAD_DIR.mkdir(exist_ok=True)
 INVOICE_DIR = ROOT_DIR / 'invoices'
-INVOICE_DIR.mkdir(exist_ok=True)
+TEMPLATE_DIR = ROOT_DIR / 'templates'
 
 app = FastAPI(title="AppleCare+ Activation System")
 api_router = APIRouter(prefix="/api")
@@ -92,6 +118,7 @@ class AppleCarePlan(BaseModel):
     sku: str = ""
     description: str = ""
     mrp: Optional[float] = None
+    product_key: str = ""  # Key into PRODUCT_PRICING, precomputed by classify_product
     active: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -102,6 +129,15 @@ class AppleCarePlanCreate(BaseModel):
     description: str = ""
     mrp: Optional[float] = None
 
+class PlanSearchResult(BaseModel):
+    id: str
+    name: str = ""
+    part_code: str = ""
+    sku: str = ""
+    description: str = ""
+    mrp: Optional[float] = None
+    score: float = 0
+
 class ActivationRequestCreate(BaseModel):
     dealer_name: str
     dealer_mobile: str
@@ -130,6 +166,7 @@ class ActivationRequest(BaseModel):
     plan_part_code: Optional[str] = ""
     plan_sku: Optional[str] = ""
     plan_mrp: Optional[float] = None
+    plan_product_key: Optional[str] = ""
     device_activation_date: str
     billing_location: str = "F9B4869273B7"  # Hardcoded as per requirement
     payment_type: str = "Insta"  # Hardcoded as per requirement
@@ -137,14 +174,27 @@ class ActivationRequest(BaseModel):
     status: str = "pending_approval"  # Default to pending_approval for new workflow
     tgme_ticket_id: Optional[str] = None  # Renamed from osticket_id
     email_sent: bool = False
+    duplicate_of: Optional[str] = None  # Earlier request for the same serial number, flagged for review
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class SubmissionReceipt(BaseModel):
+    """What a replayed or duplicate public submission gets back: no customer or dealer details"""
+    id: str
+    status: str
+    created_at: datetime
+    duplicate_of: Optional[str] = None
+
 class SettingsModel(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = "main_settings"
     apple_email: str = ""  # Now supports comma-separated emails
     approval_email: str = ""  # Email for approval notifications (configurable)
+    approval_digest_enabled: bool = False  # Batch approval emails into one digest per window
+    approval_digest_minutes: int = 15
+    apple_batch_enabled: bool = False  # Send approved requests to Apple as one multi-row email per window
+    apple_batch_minutes: int = 15
+    apple_batch_max_rows: int = 25
     smtp_host: str = "smtp.gmail.com"
     smtp_port: int = 587
     smtp_email: str = ""
@@ -160,6 +210,11 @@ class SettingsModel(BaseModel):
 class SettingsUpdate(BaseModel):
     apple_email: Optional[str] = None
     approval_email: Optional[str] = None
+    approval_digest_enabled: Optional[bool] = None
+    approval_digest_minutes: Optional[int] = Field(None, ge=1, le=1440)
+    apple_batch_enabled: Optional[bool] = None
+    apple_batch_minutes: Optional[int] = Field(None, ge=1, le=1440)
+    apple_batch_max_rows: Optional[int] = Field(None, ge=1, le=200)
     smtp_host: Optional[str] = None
     smtp_port: Optional[int] = None
     smtp_email: Optional[str] = None
@@ -170,12 +225,155 @@ class SettingsUpdate(BaseModel):
     osticket_api_key: Optional[str] = None
     partner_name: Optional[str] = None
 
+# ==================== BLOCKING CALL OFFLOAD ====================
+
+# Thread pools per kind of blocking work, so a burst of PDF renders can't starve logins of bcrypt threads.
+# Threads rather than processes: bcrypt and file I/O release the GIL, and openpyxl / reportlab work
+# holds plain dicts and closures that wouldn't pickle.
+OFFLOAD_WORKERS = {
+    "cpu": int(os.environ.get('OFFLOAD_CPU_WORKERS', str(min(4, os.cpu_count() or 1)))),  # PDF rendering, Excel, MIME encoding
+    "io": int(os.environ.get('OFFLOAD_IO_WORKERS', '16')),  # blocking file / SDK calls
+    "crypto": int(os.environ.get('OFFLOAD_CRYPTO_WORKERS', '2')),  # bcrypt
+}
+# Debug mode: warn about known blocking calls made on the event loop thread, and let asyncio log slow callbacks
+OFFLOAD_DEBUG = os.environ.get('OFFLOAD_DEBUG', '').lower() in ('1', 'true', 'yes')
+OFFLOAD_SLOW_CALLBACK_MS = float(os.environ.get('OFFLOAD_SLOW_CALLBACK_MS', '100'))
+# module:attribute of calls that must never run on the loop; patched only in debug mode
+BLOCKING_CALLS = (
+    "bcrypt:hashpw",
+    "bcrypt:checkpw",
+    "openpyxl:load_workbook",
+    "openpyxl:Workbook.save",
+    "reportlab.platypus.doctemplate:SimpleDocTemplate.build",
+    "time:sleep",
+)
+
+class OffloadPool:
+    """A named thread pool with queue-depth and wait-time counters, all updated on the loop thread"""
+
+    def __init__(self, name: str, workers: int):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"offload-{name}")
+        self.in_flight = 0  # submitted and not finished; anything beyond `workers` is waiting for a thread
+        self.max_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+        timing = {}
+
+        def call():
+            timing["started"] = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timing["finished"] = time.perf_counter()
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            if "started" in timing:
+                wait = timing["started"] - submitted
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+                self.run_total += timing.get("finished", timing["started"]) - timing["started"]
+                self.completed += 1
+
+    def report(self) -> dict:
+        done = self.completed or 1
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "max_queue_depth": max(0, self.max_in_flight - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.wait_total / done * 1000, 2),
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+            "avg_run_ms": round(self.run_total / done * 1000, 2),
+        }
+
+offload_pools = {name: OffloadPool(name, workers) for name, workers in OFFLOAD_WORKERS.items()}
+blocking_call_counts = Counter()
+
+async def offload(pool: str, fn, *args, **kwargs):
+    """Run a blocking callable on the named pool and await its result"""
+    return await offload_pools[pool].run(fn, *args, **kwargs)
+
+def offloaded(pool: str):
+    """Decorator turning a blocking function into a coroutine that runs on the named pool"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await offload(pool, fn, *args, **kwargs)
+        return wrapper
+    return decorate
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def guard_blocking_call(spec: str):
+    """Wrap module:attr so calling it from the event loop thread logs a warning with the caller"""
+    import importlib
+    import traceback
+
+    module_name, _, path = spec.partition(":")
+    try:
+        owner = importlib.import_module(module_name)
+    except ImportError:
+        return
+    *parents, name = path.split(".")
+    for parent in parents:
+        owner = getattr(owner, parent)
+    original = getattr(owner, name)
+
+    @functools.wraps(original)
+    def guarded(*args, **kwargs):
+        if on_event_loop():
+            blocking_call_counts[spec] += 1
+            caller = "".join(traceback.format_stack(limit=4)[:-1])
+            logger.warning(f"Blocking call {spec} on the event loop; use offload()\n{caller}")
+        return original(*args, **kwargs)
+
+    setattr(owner, name, guarded)
+
+def enable_offload_debug():
+    for spec in BLOCKING_CALLS:
+        guard_blocking_call(spec)
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True)
+    loop.slow_callback_duration = OFFLOAD_SLOW_CALLBACK_MS / 1000
+    logger.warning("Offload debug mode on: blocking calls on the event loop will be logged")
+
 # ==================== AUTH HELPERS ====================
 
+@offloaded("crypto")
 def hash_password(password: str) -> str:
+    import bcrypt  # loaded on the first login or password change instead of at worker boot
+    
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
+@offloaded("crypto")
 def verify_password(password: str, hashed: str) -> bool:
+    import bcrypt
+    
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
 def create_token(user_id: str, email: str) -> str:
@@ -200,6 +398,250 @@ async def get_current_user(authorization: str = Header(None)):
     except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+# ==================== HTTP CACHING ====================
+
+# Minimum JSON body size (bytes) before we bother compressing
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+# Bodies this large are compressed on the cpu offload pool rather than on the event loop
+COMPRESS_OFFLOAD_SIZE = int(os.environ.get('COMPRESS_OFFLOAD_SIZE', str(256 * 1024)))
+# How long (seconds) a worker trusts its cached collection versions before re-reading them
+CACHE_VERSION_TTL = float(os.environ.get('CACHE_VERSION_TTL', '2'))
+
+# Cacheable read endpoints: which collections the response depends on and how clients may cache it.
+# Only responses fully determined by those versions belong here; /api/stats/timeline defaults to a
+# window relative to now, so it isn't listed.
+CACHE_RULES = {
+    "/api/plans": {"collections": ("plans",), "cache_control": "public, no-cache", "private": False},
+    "/api/plans/search": {"collections": ("plans",), "cache_control": "public, no-cache", "private": False},
+    "/api/activation-requests": {"collections": ("activation_requests",), "cache_control": "private, no-cache", "private": True},
+    "/api/stats": {"collections": ("activation_requests",), "cache_control": "private, no-cache", "private": True},
+    "/api/settings": {"collections": ("settings",), "cache_control": "private, no-cache", "private": True},
+}
+
+# Collection name -> version counter (mirrors db.collection_versions, shared across workers)
+collection_versions = {}
+_collection_versions_synced_at = 0.0
+
+# Fully encoded responses for public routes, keyed by (etag, content-encoding)
+_shared_response_cache = OrderedDict()
+SHARED_RESPONSE_CACHE_SIZE = 32
+
+async def get_collection_versions() -> dict:
+    """Return collection versions, re-reading them from MongoDB at most every CACHE_VERSION_TTL seconds"""
+    global _collection_versions_synced_at
+    now = time.monotonic()
+    if now - _collection_versions_synced_at >= CACHE_VERSION_TTL:
+        async for doc in db.collection_versions.find({}, {"_id": 0}):
+            # Versions only move forward - never let a slow read roll back a local bump
+            name = doc.get("collection")
+            collection_versions[name] = max(collection_versions.get(name, 0), doc.get("version", 0))
+        _collection_versions_synced_at = now
+    return collection_versions
+
+async def bump_collection_version(*collections: str):
+    """Mark collections as changed so cached ETags for dependent routes are invalidated"""
+    for name in collections:
+        doc = await db.collection_versions.find_one_and_update(
+            {"collection": name},
+            {"$inc": {"version": 1}},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        collection_versions[name] = max(collection_versions.get(name, 0), doc.get("version", 0))
+
+def choose_content_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header"""
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        parts = item.strip().split(';')
+        q = 1.0
+        for param in parts[1:]:
+            if param.strip().startswith('q='):
+                try:
+                    q = float(param.strip()[2:])
+                except ValueError:
+                    q = 0.0
+        if parts[0]:
+            accepted[parts[0]] = q
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110 13.1.2)"""
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+def add_vary(headers: MutableHeaders, field: str):
+    existing = [v.strip().lower() for v in headers.get("vary", "").split(",") if v.strip()]
+    if field.lower() not in existing:
+        headers.add_vary_header(field)
+
+async def compute_etag(scope, rule: dict, headers: Headers) -> str:
+    versions = await get_collection_versions()
+    parts = [scope["path"], scope.get("query_string", b"").decode("latin-1")]
+    parts += [f"{name}:{versions.get(name, 0)}" for name in rule["collections"]]
+    if rule["private"]:
+        # Tie private ETags to the caller's token so a 304 can't be obtained without it
+        parts.append(hashlib.sha256(headers.get("authorization", "").encode()).hexdigest())
+    return '"' + hashlib.sha256("|".join(parts).encode()).hexdigest()[:32] + '"'
+
+class HTTPCacheMiddleware:
+    """Conditional GET (ETag / If-None-Match) for CACHE_RULES routes plus gzip/brotli for JSON bodies.
+
+    ETags are derived from collection versions, so a matching If-None-Match is answered
+    with 304 before the route (and MongoDB) is ever called.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = choose_content_encoding(headers.get("accept-encoding", ""))
+        rule = CACHE_RULES.get(scope["path"]) if scope["method"] in ("GET", "HEAD") else None
+        etag = None
+
+        if rule:
+            etag = await compute_etag(scope, rule, headers)
+            vary = "Accept-Encoding, Authorization" if rule["private"] else "Accept-Encoding"
+            if etag_matches(headers.get("if-none-match", ""), etag):
+                await send({
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [
+                        (b"etag", etag.encode()),
+                        (b"cache-control", rule["cache_control"].encode()),
+                        (b"vary", vary.encode()),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if not rule["private"]:
+                cached = _shared_response_cache.get((etag, encoding))
+                if cached:
+                    _shared_response_cache.move_to_end((etag, encoding))
+                    status, raw_headers, body = cached
+                    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+                    await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+                    return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            response_headers = MutableHeaders(raw=start_message["headers"])
+            body = message.get("body", b"")
+            if rule and start_message["status"] == 200:
+                response_headers["ETag"] = etag
+                response_headers["Cache-Control"] = rule["cache_control"]
+                add_vary(response_headers, "Accept-Encoding")
+                if rule["private"]:
+                    add_vary(response_headers, "Authorization")
+
+            if message.get("more_body", False):
+                # Streaming response - pass through untouched to keep memory bounded
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            if (
+                encoding
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in response_headers
+                and response_headers.get("content-type", "").startswith("application/json")
+            ):
+                if len(body) >= COMPRESS_OFFLOAD_SIZE:
+                    body = await offload("cpu", compress_body, body, encoding)
+                else:
+                    body = compress_body(body, encoding)
+                response_headers["Content-Encoding"] = encoding
+                response_headers["Content-Length"] = str(len(body))
+                add_vary(response_headers, "Accept-Encoding")
+
+            if rule and not rule["private"] and start_message["status"] == 200 and scope["method"] == "GET":
+                _shared_response_cache[(etag, encoding)] = (200, list(start_message["headers"]), body)
+                while len(_shared_response_cache) > SHARED_RESPONSE_CACHE_SIZE:
+                    _shared_response_cache.popitem(last=False)
+
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+# ==================== FAST SERIALIZATION ====================
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dump_json(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(Response):
+    """JSON response encoded with orjson; datetimes are written directly (UTC as "Z", like pydantic)"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dump_json(content)
+
+class TrustedDocumentAdapter:
+    """Shape documents from our own collections like `model` would, without re-validating them.
+
+    The Mongo projection drops fields the model doesn't expose and missing optional fields are
+    filled from the model defaults - the same output response_model gives, minus the per-row
+    validation and datetime parsing. Only use this for documents this app wrote itself.
+    """
+
+    def __init__(self, model):
+        self.projection = {"_id": 0, **{name: 1 for name in model.model_fields}}
+        self.defaults = {
+            name: field.default
+            for name, field in model.model_fields.items()
+            if not field.is_required() and field.default_factory is None
+        }
+
+    def shape(self, doc: dict) -> dict:
+        return {**self.defaults, **doc}
+
+    def shape_many(self, docs: List[dict]) -> List[dict]:
+        defaults = self.defaults
+        return [{**defaults, **doc} for doc in docs]
+
+plan_documents = TrustedDocumentAdapter(AppleCarePlan)
+activation_request_documents = TrustedDocumentAdapter(ActivationRequest)
+
 # ==================== AUTH ROUTES ====================
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -213,8 +655,8 @@ async def register(data: UserCreate):
         "id": user_id,
         "email": data.email,
         "name": data.name,
-        "password": hash_password(data.password),
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "password": await hash_password(data.password),
+        "created_at": datetime.now(timezone.utc)
     }
     await db.users.insert_one(user)
     token = create_token(user_id, data.email)
@@ -227,7 +669,7 @@ async def register(data: UserCreate):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(data: UserLogin):
     user = await db.users.find_one({"email": data.email}, {"_id": 0})
-    if not user or not verify_password(data.password, user["password"]):
+    if not user or not await verify_password(data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(user["id"], user["email"])
@@ -240,12 +682,12 @@ async def login(data: UserLogin):
 async def change_password(data: PasswordChange, user: dict = Depends(get_current_user)):
     user_doc = await db.users.find_one({"id": user["id"]}, {"_id": 0})
     
-    if not verify_password(data.current_password, user_doc["password"]):
+    if not await verify_password(data.current_password, user_doc["password"]):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
     
     await db.users.update_one(
         {"id": user["id"]},
-        {"$set": {"password": hash_password(data.new_password)}}
+        {"$set": {"password": await hash_password(data.new_password)}}
     )
     return {"message": "Password changed successfully"}
 
@@ -253,35 +695,322 @@ async def change_password(data: PasswordChange, user: dict = Depends(get_current
 async def get_me(user: dict = Depends(get_current_user)):
     return UserResponse(id=user["id"], email=user["email"], name=user["name"])
 
+# ==================== PLAN SEARCH ====================
+
+# Field weights for ranking - codes are what dealers usually type, so they rank highest
+PLAN_SEARCH_FIELDS = {"sku": 6, "part_code": 6, "name": 4, "description": 2}
+PLAN_SEARCH_MAX_PREFIX = 16
+_search_token_re = re.compile(r"[a-z0-9]+")
+
+def search_tokens(text: str) -> List[str]:
+    return _search_token_re.findall((text or "").lower())
+
+def trigrams(token: str) -> set:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class PlanSearchIndex:
+    """In-memory prefix + trigram index over active plans for typeahead search.
+
+    Prefix postings map each token prefix to {plan_id: weight}; trigram postings catch
+    infix matches and typos when no prefix matches. It is kept in step with plan_catalog.
+    """
+
+    def __init__(self):
+        self.plans = {}
+        self.prefixes = defaultdict(dict)
+        self.trigrams = defaultdict(set)
+        self._keys = {}  # plan_id -> (prefix keys, trigram keys) for cheap removal
+
+    def build(self, plans: List[dict]):
+        self.plans.clear()
+        self.prefixes.clear()
+        self.trigrams.clear()
+        self._keys.clear()
+        for plan in plans:
+            self.upsert(plan)
+
+    def remove(self, plan_id: str):
+        keys = self._keys.pop(plan_id, None)
+        self.plans.pop(plan_id, None)
+        if not keys:
+            return
+        prefix_keys, trigram_keys = keys
+        for key in prefix_keys:
+            postings = self.prefixes.get(key)
+            if postings is not None:
+                postings.pop(plan_id, None)
+                if not postings:
+                    del self.prefixes[key]
+        for key in trigram_keys:
+            postings = self.trigrams.get(key)
+            if postings is not None:
+                postings.discard(plan_id)
+                if not postings:
+                    del self.trigrams[key]
+
+    def upsert(self, plan: dict):
+        plan_id = plan["id"]
+        self.remove(plan_id)
+        if not plan.get("active", True):
+            return
+
+        prefix_weights = {}
+        trigram_keys = set()
+        for field, weight in PLAN_SEARCH_FIELDS.items():
+            value = str(plan.get(field) or "")
+            tokens = search_tokens(value)
+            if field in ("sku", "part_code") and len(tokens) > 1:
+                # "S9732ZM/A" should also match when typed as "s9732zma"
+                tokens.append("".join(tokens))
+            for token in tokens:
+                for end in range(1, min(len(token), PLAN_SEARCH_MAX_PREFIX) + 1):
+                    key = token[:end]
+                    # A complete word scores double a partial prefix
+                    score = weight * 2 if end == len(token) else weight
+                    if score > prefix_weights.get(key, 0):
+                        prefix_weights[key] = score
+                trigram_keys |= trigrams(token)
+
+        for key, score in prefix_weights.items():
+            self.prefixes[key][plan_id] = score
+        for key in trigram_keys:
+            self.trigrams[key].add(plan_id)
+        self._keys[plan_id] = (tuple(prefix_weights), tuple(trigram_keys))
+        self.plans[plan_id] = {
+            "id": plan_id,
+            "name": plan.get("name", "") or "",
+            "part_code": plan.get("part_code", "") or "",
+            "sku": plan.get("sku", "") or "",
+            "description": plan.get("description", "") or "",
+            "mrp": plan.get("mrp"),
+        }
+
+    def _token_scores(self, token: str) -> dict:
+        postings = self.prefixes.get(token[:PLAN_SEARCH_MAX_PREFIX])
+        if postings:
+            return postings
+        # No prefix hit - fall back to trigram overlap (infix / typo tolerant)
+        grams = trigrams(token)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.trigrams.get(gram, ()))
+        threshold = max(1, len(grams) // 2)
+        return {plan_id: count / len(grams) for plan_id, count in counts.items() if count >= threshold}
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        tokens = search_tokens(query)
+        if not tokens:
+            ranked = sorted(self.plans.values(), key=lambda p: (p["description"] or p["name"]).lower())
+            return [{**plan, "score": 0} for plan in ranked[:limit]]
+
+        per_token = sorted((self._token_scores(token) for token in tokens), key=len)
+        scores = dict(per_token[0])
+        for postings in per_token[1:]:
+            scores = {plan_id: score + postings[plan_id] for plan_id, score in scores.items() if plan_id in postings}
+            if not scores:
+                return []
+
+        # Top-k selection instead of a full sort - broad prefixes like "a" can match the whole catalog
+        plans = self.plans
+        ranked = heapq.nsmallest(
+            limit,
+            scores.items(),
+            key=lambda item: (-item[1], len(plans[item[0]]["name"]), plans[item[0]]["name"])
+        )
+        return [{**plans[plan_id], "score": score} for plan_id, score in ranked]
+
+plan_search_index = PlanSearchIndex()
+
+# ==================== PLAN CATALOG ====================
+
+_plan_code_re = re.compile(r"[^A-Z0-9]")
+
+def normalize_plan_code(value) -> str:
+    """Canonical form of a SKU / part code for lookups ("s9732zm/a " -> "S9732ZMA")"""
+    return _plan_code_re.sub("", str(value or "").upper())
+
+def repair_part_code(part_code, sku):
+    """Excel uploads sometimes put a number (e.g. the MRP) in part_code - fall back to the SKU then"""
+    try:
+        float(part_code)
+        return sku
+    except (ValueError, TypeError):
+        return part_code
+
+class PlanRecord:
+    """Immutable, precomputed view of one plan document as submissions need it"""
+
+    __slots__ = (
+        "id", "name", "description", "sku", "part_code", "mrp", "active", "product_key",
+        "display_name", "request_part_code", "norm_name", "norm_sku", "norm_part_code",
+    )
+
+    def __init__(self, doc: dict):
+        self.id = doc["id"]
+        self.name = doc.get("name", "") or ""
+        self.description = doc.get("description", "") or ""
+        self.sku = doc.get("sku", "") or ""
+        self.part_code = doc.get("part_code", "")
+        self.mrp = doc.get("mrp")
+        self.active = doc.get("active", True)
+        self.product_key = doc.get("product_key") or classify_product(self.name, self.description)
+        # Prefer description over name and SKU over a numeric part_code
+        # (Excel upload sometimes puts wrong values in name/part_code fields)
+        self.display_name = self.description or self.name
+        self.request_part_code = repair_part_code(self.part_code, self.sku)
+        self.norm_name = " ".join(search_tokens(self.name))
+        self.norm_sku = normalize_plan_code(self.sku)
+        self.norm_part_code = normalize_plan_code(self.part_code)
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "sku": self.sku,
+            "part_code": self.part_code,
+            "mrp": self.mrp,
+            "active": self.active,
+        }
+
+class PlanCatalog:
+    """Versioned in-memory copy of the plans collection with lookups by id, SKU and part code"""
+
+    def __init__(self):
+        self.version = -1
+        self.by_id = {}
+        self.by_sku = {}
+        self.by_part_code = {}
+
+    def load(self, docs: List[dict], version: int):
+        self.by_id.clear()
+        self.by_sku.clear()
+        self.by_part_code.clear()
+        for doc in docs:
+            self.upsert(PlanRecord(doc))
+        self.version = version
+
+    def upsert(self, record: PlanRecord):
+        self.remove(record.id)
+        self.by_id[record.id] = record
+        if record.norm_sku:
+            self.by_sku[record.norm_sku] = record
+        if record.norm_part_code:
+            self.by_part_code[record.norm_part_code] = record
+
+    def remove(self, plan_id: str):
+        record = self.by_id.pop(plan_id, None)
+        if record is None:
+            return
+        if self.by_sku.get(record.norm_sku) is record:
+            del self.by_sku[record.norm_sku]
+        if self.by_part_code.get(record.norm_part_code) is record:
+            del self.by_part_code[record.norm_part_code]
+
+    def get(self, plan_id: str) -> Optional[PlanRecord]:
+        return self.by_id.get(plan_id)
+
+    def find_by_sku(self, sku: str) -> Optional[PlanRecord]:
+        return self.by_sku.get(normalize_plan_code(sku))
+
+    def find_by_part_code(self, part_code: str) -> Optional[PlanRecord]:
+        return self.by_part_code.get(normalize_plan_code(part_code))
+
+    def active_records(self):
+        return (record for record in self.by_id.values() if record.active)
+
+plan_catalog = PlanCatalog()
+_plan_catalog_lock = asyncio.Lock()
+
+async def reload_plan_catalog():
+    """Load every plan into plan_catalog and rebuild the typeahead index from it"""
+    async with _plan_catalog_lock:
+        versions = await get_collection_versions()
+        docs = await db.plans.find({}, {"_id": 0}).to_list(None)
+        plan_catalog.load(docs, versions.get("plans", 0))
+        plan_search_index.build([record.as_dict() for record in plan_catalog.active_records()])
+        logger.info(f"Plan catalog loaded: {len(plan_catalog.by_id)} plans (version {plan_catalog.version})")
+
+async def ensure_plan_catalog():
+    """Reload if another worker (or a bulk write) changed plans since the catalog was loaded"""
+    versions = await get_collection_versions()
+    if plan_catalog.version != versions.get("plans", 0):
+        await reload_plan_catalog()
+
+async def apply_plan_change(plan_id: str):
+    """Patch a single plan into the catalog after a local write (call after bumping the version)"""
+    current = collection_versions.get("plans", 0)
+    if plan_catalog.version != current - 1:
+        # Missed a change in between - leave it for ensure_plan_catalog to reload
+        return
+    doc = await db.plans.find_one({"id": plan_id}, {"_id": 0})
+    if doc:
+        record = PlanRecord(doc)
+        plan_catalog.upsert(record)
+        plan_search_index.upsert(record.as_dict())
+    else:
+        plan_catalog.remove(plan_id)
+        plan_search_index.remove(plan_id)
+    plan_catalog.version = current
+
+async def apply_bulk_plan_change():
+    """Adopt catalog records patched in place during a bulk write (call after bumping the version)"""
+    current = collection_versions.get("plans", 0)
+    if plan_catalog.version != current - 1:
+        await reload_plan_catalog()
+        return
+    plan_search_index.build([record.as_dict() for record in plan_catalog.active_records()])
+    plan_catalog.version = current
+
+async def get_catalog_plan(plan_id: str) -> Optional[PlanRecord]:
+    """Plan lookup for the submission hot path - normally served without touching MongoDB"""
+    await ensure_plan_catalog()
+    record = plan_catalog.get(plan_id)
+    if record is None:
+        # Possibly created by another worker within CACHE_VERSION_TTL - check the source of truth
+        doc = await db.plans.find_one({"id": plan_id}, {"_id": 0})
+        if doc:
+            record = PlanRecord(doc)
+            plan_catalog.upsert(record)
+    return record
+
 # ==================== PLANS ROUTES ====================
 
 @api_router.get("/plans", response_model=List[AppleCarePlan])
 async def get_plans(active_only: bool = True, public: bool = False):
     # Public endpoint for form dropdown - no auth required when public=True
     query = {"active": True} if active_only else {}
-    plans = await db.plans.find(query, {"_id": 0}).to_list(1000)
-    for plan in plans:
-        if isinstance(plan.get('created_at'), str):
-            plan['created_at'] = datetime.fromisoformat(plan['created_at'])
-    return plans
+    plans = await db.plans.find(query, plan_documents.projection).to_list(1000)
+    return FastJSONResponse(plan_documents.shape_many(plans))
+
+@api_router.get("/plans/search", response_model=List[PlanSearchResult])
+async def search_plans(q: str = "", limit: int = Query(10, ge=1, le=50)):
+    """Typeahead search over active plans - public, served from the in-memory index"""
+    await ensure_plan_catalog()
+    return plan_search_index.search(q, limit)
 
 @api_router.post("/plans", response_model=AppleCarePlan)
 async def create_plan(data: AppleCarePlanCreate, user: dict = Depends(get_current_user)):
-    plan = AppleCarePlan(**data.model_dump())
+    classification = plan_classification_fields(data.name, data.description)
+    plan = AppleCarePlan(**data.model_dump(), product_key=classification["product_key"])
     doc = plan.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc.update(classification)
     await db.plans.insert_one(doc)
+    await bump_collection_version("plans")
+    await apply_plan_change(plan.id)
     return plan
 
 @api_router.put("/plans/{plan_id}", response_model=AppleCarePlan)
 async def update_plan(plan_id: str, data: AppleCarePlanCreate, user: dict = Depends(get_current_user)):
     update_data = data.model_dump()
+    update_data.update(plan_classification_fields(data.name, data.description))
     result = await db.plans.update_one({"id": plan_id}, {"$set": update_data})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Plan not found")
+    await bump_collection_version("plans")
+    await apply_plan_change(plan_id)
     plan = await db.plans.find_one({"id": plan_id}, {"_id": 0})
-    if isinstance(plan.get('created_at'), str):
-        plan['created_at'] = datetime.fromisoformat(plan['created_at'])
     return plan
 
 @api_router.delete("/plans/{plan_id}")
@@ -289,11 +1018,41 @@ async def delete_plan(plan_id: str, user: dict = Depends(get_current_user)):
     result = await db.plans.update_one({"id": plan_id}, {"$set": {"active": False}})
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Plan not found")
+    await bump_collection_version("plans")
+    await apply_plan_change(plan_id)
     return {"message": "Plan deactivated"}
 
-@api_router.get("/plans/sample")
-async def download_sample_excel(user: dict = Depends(get_current_user)):
-    """Download a sample Excel file for AppleCare+ plans upload"""
+async def reclassify_plans(only_stale: bool = True) -> int:
+    """Recompute product_key for existing plans (all of them, or only those classified by older rules)"""
+    query = {"product_rules_version": {"$ne": PRODUCT_RULES_VERSION}} if only_stale else {}
+    operations = []
+    reclassified = 0
+    async for plan in db.plans.find(query, {"_id": 0, "id": 1, "name": 1, "description": 1}):
+        operations.append(UpdateOne(
+            {"id": plan["id"]},
+            {"$set": plan_classification_fields(plan.get("name", ""), plan.get("description", ""))}
+        ))
+        if len(operations) >= 500:
+            await db.plans.bulk_write(operations, ordered=False)
+            reclassified += len(operations)
+            operations = []
+    if operations:
+        await db.plans.bulk_write(operations, ordered=False)
+        reclassified += len(operations)
+    if reclassified:
+        await bump_collection_version("plans")
+        logger.info(f"Reclassified {reclassified} plans")
+    return reclassified
+
+@api_router.post("/plans/reclassify")
+async def reclassify_all_plans(user: dict = Depends(get_current_user)):
+    """Re-run product classification over every plan"""
+    count = await reclassify_plans(only_stale=False)
+    return {"message": f"Reclassified {count} plans", "reclassified_count": count}
+
+def build_sample_workbook() -> bytes:
+    from openpyxl import Workbook  # loaded on first use; only admins ever touch Excel
+    
     wb = Workbook()
     ws = wb.active
     ws.title = "AppleCare+ Plans"
@@ -324,10 +1083,14 @@ async def download_sample_excel(user: dict = Depends(get_current_user)):
     # Save to bytes buffer
     buffer = io.BytesIO()
     wb.save(buffer)
-    buffer.seek(0)
-    
+    return buffer.getvalue()
+
+@api_router.get("/plans/sample")
+async def download_sample_excel(user: dict = Depends(get_current_user)):
+    """Download a sample Excel file for AppleCare+ plans upload"""
+    content = await offload("cpu", build_sample_workbook)
     return StreamingResponse(
-        buffer,
+        io.BytesIO(content),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={"Content-Disposition": "attachment; filename=applecare_plans_sample.xlsx"}
     )
@@ -338,9 +1101,11 @@ async def upload_plans_excel(file: UploadFile = File(...), user: dict = Depends(
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only Excel files (.xlsx, .xls) are allowed")
     
+    import openpyxl  # loaded on first use; only admins ever touch Excel
+    
     try:
         content = await file.read()
-        wb = openpyxl.load_workbook(io.BytesIO(content))
+        wb = await offload("cpu", openpyxl.load_workbook, io.BytesIO(content))
         ws = wb.active
         
         # Get headers from first row
@@ -350,6 +1115,9 @@ async def upload_plans_excel(file: UploadFile = File(...), user: dict = Depends(
         imported_count = 0
         errors = []
         
+        # Existing-plan matching is done against the in-process catalog instead of a query per row
+        await ensure_plan_catalog()
+        
         for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), 2):
             if not any(row):  # Skip empty rows
                 continue
@@ -374,40 +1142,48 @@ async def upload_plans_excel(file: UploadFile = File(...), user: dict = Depends(
                 if not sku and not part_code:
                     continue
                 
-                # Check if plan with same SKU already exists
-                existing = await db.plans.find_one({"$or": [{"sku": sku}, {"part_code": part_code}]})
+                # Check if plan with same SKU / part code already exists
+                existing = (sku and plan_catalog.find_by_sku(sku)) or (part_code and plan_catalog.find_by_part_code(part_code))
                 
                 if existing:
                     # Update existing plan
-                    await db.plans.update_one(
-                        {"id": existing["id"]},
-                        {"$set": {
-                            "sku": sku or existing.get("sku", ""),
-                            "description": description or existing.get("description", ""),
-                            "mrp": mrp if mrp else existing.get("mrp"),
-                            "part_code": part_code or existing.get("part_code", ""),
-                            "name": plan_name or existing.get("name", ""),
-                            "active": True
-                        }}
-                    )
+                    merged_description = description or existing.description
+                    merged_name = plan_name or existing.name
+                    update_fields = {
+                        "sku": sku or existing.sku,
+                        "description": merged_description,
+                        "mrp": mrp if mrp else existing.mrp,
+                        "part_code": part_code or existing.part_code,
+                        "name": merged_name,
+                        "active": True,
+                        **plan_classification_fields(merged_name, merged_description)
+                    }
+                    await db.plans.update_one({"id": existing.id}, {"$set": update_fields})
+                    plan_catalog.upsert(PlanRecord({**existing.as_dict(), **update_fields}))
                 else:
                     # Create new plan
+                    classification = plan_classification_fields(plan_name, description)
                     plan = AppleCarePlan(
                         sku=sku,
                         description=description,
                         mrp=mrp,
                         part_code=part_code,
-                        name=plan_name
+                        name=plan_name,
+                        product_key=classification["product_key"]
                     )
                     doc = plan.model_dump()
-                    doc['created_at'] = doc['created_at'].isoformat()
+                    doc.update(classification)
                     await db.plans.insert_one(doc)
+                    plan_catalog.upsert(PlanRecord(doc))
                 
                 imported_count += 1
                 
             except Exception as e:
                 errors.append(f"Row {row_num}: {str(e)}")
         
+        await bump_collection_version("plans")
+        await apply_bulk_plan_change()
+        
         return {
             "message": f"Successfully imported {imported_count} plans",
             "imported_count": imported_count,
@@ -426,28 +1202,211 @@ async def get_settings(user: dict = Depends(get_current_user)):
     if not settings:
         default_settings = SettingsModel()
         doc = default_settings.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
         await db.settings.insert_one(doc)
+        await bump_collection_version("settings")
         return default_settings
-    if isinstance(settings.get('updated_at'), str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
     return settings
 
 @api_router.put("/settings", response_model=SettingsModel)
 async def update_settings(data: SettingsUpdate, user: dict = Depends(get_current_user)):
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
-    update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
+    update_data['updated_at'] = datetime.now(timezone.utc)
     
     await db.settings.update_one(
         {"id": "main_settings"},
         {"$set": update_data},
         upsert=True
     )
+    await bump_collection_version("settings")
     settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
-    if isinstance(settings.get('updated_at'), str):
-        settings['updated_at'] = datetime.fromisoformat(settings['updated_at'])
     return settings
 
+# ==================== INVOICE STORAGE ====================
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')  # local | s3
+STORAGE_ROOT = Path(os.environ.get('STORAGE_ROOT', str(ROOT_DIR / 'storage')))
+STORAGE_CHUNK_SIZE = 1024 * 1024
+PDF_MAGIC = b"%PDF-"
+
+def invoice_storage_key(sha256: str) -> str:
+    """Content-addressed key, sharded two levels deep so no directory (or S3 prefix) grows unbounded"""
+    return f"invoices/{sha256[:2]}/{sha256[2:4]}/{sha256}.pdf"
+
+def is_storage_key(ref: Optional[str]) -> bool:
+    # Legacy documents hold absolute file paths; storage keys are always relative
+    return bool(ref) and not os.path.isabs(ref)
+
+async def iter_file_chunks(path, chunk_size: int = STORAGE_CHUNK_SIZE, start: int = 0, length: Optional[int] = None):
+    """Read length bytes (or to EOF) from start without holding more than one chunk in memory"""
+    async with aiofiles.open(path, 'rb') as f:
+        if start:
+            await f.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            chunk = await f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+class LocalStorage:
+    """Storage keys map to files under root; staging lives beside them so commits are atomic renames"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.staging_dir = root / '.staging'
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def staging_path(self) -> Path:
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        return self.staging_dir / f"{uuid.uuid4().hex}.part"
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self.path(key))
+
+    async def size(self, key: str) -> int:
+        return await aiofiles.os.path.getsize(self.path(key))
+
+    async def put_file(self, staged: Path, key: str):
+        target = self.path(key)
+        await aiofiles.os.makedirs(target.parent, exist_ok=True)
+        await aiofiles.os.replace(staged, target)
+
+    async def iter_chunks(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE, start: int = 0, length: Optional[int] = None):
+        async for chunk in iter_file_chunks(self.path(key), chunk_size, start, length):
+            yield chunk
+
+class S3Storage:
+    """S3-compatible object storage (AWS, MinIO, R2); boto3 calls run in worker threads"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, region: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3")
+        self.ClientError = ClientError
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def staging_path(self) -> Path:
+        return Path(tempfile.gettempdir()) / f"invoice-{uuid.uuid4().hex}.part"
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await offload("io", self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except self.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    async def size(self, key: str) -> int:
+        head = await offload("io", self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+        return head['ContentLength']
+
+    async def put_file(self, staged: Path, key: str):
+        # upload_file switches to multipart for large files and reads from disk in parts
+        await offload(
+            "io", self.client.upload_file, str(staged), self.bucket, self.object_key(key),
+            ExtraArgs={"ContentType": "application/pdf"}
+        )
+        await aiofiles.os.remove(staged)
+
+    async def iter_chunks(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE, start: int = 0, length: Optional[int] = None):
+        params = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        if start or length is not None:
+            params["Range"] = f"bytes={start}-{start + length - 1}" if length is not None else f"bytes={start}-"
+        obj = await offload("io", self.client.get_object, **params)
+        body = obj['Body']
+        try:
+            while True:
+                chunk = await offload("io", body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+def create_invoice_storage():
+    if STORAGE_BACKEND == 's3':
+        return S3Storage(
+            bucket=os.environ['S3_BUCKET'],
+            prefix=os.environ.get('S3_PREFIX', ''),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+            region=os.environ.get('S3_REGION') or None
+        )
+    return LocalStorage(STORAGE_ROOT)
+
+invoice_storage = create_invoice_storage()
+
+async def store_invoice_stream(chunks, max_bytes: Optional[int] = None) -> dict:
+    """Stage an async stream of PDF bytes while hashing it, then commit under its content-addressed key"""
+    staged = invoice_storage.staging_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(staged, 'wb') as out:
+            async for chunk in chunks:
+                # PDF readers accept the header anywhere in the first 1024 bytes
+                if size == 0 and PDF_MAGIC not in chunk[:1024]:
+                    raise HTTPException(status_code=400, detail="File is not a valid PDF")
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise HTTPException(status_code=413, detail="Invoice file too large")
+                digest.update(chunk)
+                await out.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+        
+        sha256 = digest.hexdigest()
+        key = invoice_storage_key(sha256)
+        deduplicated = await invoice_storage.exists(key)
+        if deduplicated:
+            await aiofiles.os.remove(staged)
+        else:
+            await invoice_storage.put_file(staged, key)
+    except BaseException:
+        if await aiofiles.os.path.exists(staged):
+            await aiofiles.os.remove(staged)
+        raise
+    return {"key": key, "sha256": sha256, "size": size, "deduplicated": deduplicated}
+
+async def store_invoice_bytes(content: bytes) -> dict:
+    async def single():
+        yield content
+    return await store_invoice_stream(single())
+
+async def invoice_exists(ref: Optional[str]) -> bool:
+    """True if an invoice_path value (storage key, or a legacy absolute path) points at a stored file"""
+    if not ref:
+        return False
+    if is_storage_key(ref):
+        return await invoice_storage.exists(ref)
+    return await aiofiles.os.path.exists(ref)
+
+async def invoice_size(ref: Optional[str]) -> int:
+    if not await invoice_exists(ref):
+        return 0
+    if is_storage_key(ref):
+        return await invoice_storage.size(ref)
+    return await aiofiles.os.path.getsize(ref)
+
+async def iter_invoice(ref: str, chunk_size: int = STORAGE_CHUNK_SIZE):
+    chunks = invoice_storage.iter_chunks(ref, chunk_size) if is_storage_key(ref) else iter_file_chunks(ref, chunk_size)
+    async for chunk in chunks:
+        yield chunk
+
+async def read_invoice(ref: str) -> bytes:
+    return b"".join([chunk async for chunk in iter_invoice(ref)])
+
 # ==================== PDF GENERATION ====================
 
 import random
@@ -509,42 +1468,73 @@ PRODUCT_PRICING = {
     "airpods pro": {"name": "AirPods Pro", "price": 24900}
 }
 
+# Product classification rules - first match wins, so more specific rules come first.
+# Each rule lists the words / two-word phrases that must ALL appear in the plan name + description.
+PRODUCT_RULES = [
+    ("iphone pro max", ("iphone", "pro max")),
+    ("iphone pro", ("iphone", "pro")),
+    ("iphone", ("iphone",)),
+    ("macbook pro", ("macbook pro",)),
+    ("macbook pro", ("mac pro",)),
+    ("macbook air", ("macbook air",)),
+    ("macbook air", ("mac air",)),
+    ("imac", ("imac",)),
+    ("macbook air", ("macbook",)),  # Default Mac
+    ("macbook air", ("mac",)),
+    ("ipad pro", ("ipad pro",)),
+    ("ipad air", ("ipad air",)),
+    ("ipad", ("ipad",)),
+    ("apple watch ultra", ("watch ultra",)),
+    ("apple watch", ("watch",)),
+    ("airpods pro", ("airpods pro",)),
+    ("airpods", ("airpods",)),
+]
+DEFAULT_PRODUCT_KEY = "iphone"
+# Bump whenever PRODUCT_RULES changes so stored classifications get recomputed on startup
+PRODUCT_RULES_VERSION = 1
+
+class ProductClassifier:
+    """Compiled form of PRODUCT_RULES.
+
+    Text is tokenized once into a set of words and adjacent-word phrases; each rule is then a
+    subset check against that set. Matching on whole words means "mac" no longer fires on
+    "macbook"/"imac" and "pro" no longer fires on "protection".
+    """
+
+    _word_re = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, rules, default_key: str):
+        for key, _ in rules:
+            if key not in PRODUCT_PRICING:
+                raise ValueError(f"Unknown product key in PRODUCT_RULES: {key}")
+        self.rules = [(frozenset(phrases), key) for key, phrases in rules]
+        self.default_key = default_key
+
+    def classify(self, text: str) -> str:
+        words = self._word_re.findall(text.lower())
+        grams = set(words)
+        grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for required, key in self.rules:
+            if required <= grams:
+                return key
+        return self.default_key
+
+product_classifier = ProductClassifier(PRODUCT_RULES, DEFAULT_PRODUCT_KEY)
+
+def classify_product(plan_name: str, plan_description: str) -> str:
+    """Return the PRODUCT_PRICING key for an AppleCare+ plan"""
+    return product_classifier.classify(f"{plan_name or ''} {plan_description or ''}")
+
+def plan_classification_fields(plan_name: str, plan_description: str) -> dict:
+    """Fields stored on a plan document so invoice rendering never has to classify"""
+    return {
+        "product_key": classify_product(plan_name, plan_description),
+        "product_rules_version": PRODUCT_RULES_VERSION
+    }
+
 def detect_product_from_plan(plan_name: str, plan_description: str) -> dict:
     """Detect the Apple product from the AppleCare+ plan name/description"""
-    combined = (plan_name + " " + plan_description).lower()
-    
-    # Check for specific products (order matters - more specific first)
-    if "pro max" in combined and "iphone" in combined:
-        return PRODUCT_PRICING["iphone pro max"]
-    elif "iphone" in combined and "pro" in combined:
-        return PRODUCT_PRICING["iphone pro"]
-    elif "iphone" in combined:
-        return PRODUCT_PRICING["iphone"]
-    elif "macbook pro" in combined or "mac pro" in combined:
-        return PRODUCT_PRICING["macbook pro"]
-    elif "macbook air" in combined or "mac air" in combined:
-        return PRODUCT_PRICING["macbook air"]
-    elif "macbook" in combined or "mac" in combined:
-        return PRODUCT_PRICING["macbook air"]  # Default Mac
-    elif "ipad pro" in combined:
-        return PRODUCT_PRICING["ipad pro"]
-    elif "ipad air" in combined:
-        return PRODUCT_PRICING["ipad air"]
-    elif "ipad" in combined:
-        return PRODUCT_PRICING["ipad"]
-    elif "imac" in combined:
-        return PRODUCT_PRICING["imac"]
-    elif "watch ultra" in combined:
-        return PRODUCT_PRICING["apple watch ultra"]
-    elif "watch" in combined:
-        return PRODUCT_PRICING["apple watch"]
-    elif "airpods pro" in combined:
-        return PRODUCT_PRICING["airpods pro"]
-    elif "airpods" in combined:
-        return PRODUCT_PRICING["airpods"]
-    else:
-        # Default to iPhone if can't detect
-        return PRODUCT_PRICING["iphone"]
+    return PRODUCT_PRICING[classify_product(plan_name, plan_description)]
 
 def num_to_words_indian(num: int) -> str:
     """Convert number to Indian currency words"""
@@ -603,8 +1593,16 @@ def format_indian_currency(amount: float) -> str:
     
     return f"₹ {formatted}.{decimal_part}"
 
-async def generate_invoice_pdf(request_data: dict, filename: str) -> str:
-    filepath = INVOICE_DIR / filename
+async def generate_invoice_pdf(request_data: dict) -> str:
+    """Render the invoice PDF and store it; returns the storage key"""
+    # reportlab costs ~100ms to import, so it loads on the first invoice rather than at worker boot
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    
+    buffer = io.BytesIO()
     
     # Random shop details
     shop_name = random.choice(SHOP_NAMES)
@@ -619,10 +1617,12 @@ async def generate_invoice_pdf(request_data: dict, filename: str) -> str:
         parts = invoice_date.split("-")
         invoice_date = f"{parts[2]}-{parts[1]}-{parts[0]}"
     
-    # Detect product from AppleCare+ plan
+    # Product is classified once per plan; older requests without the key fall back to classifying here
     plan_name = request_data.get('plan_name', '')
-    plan_description = request_data.get('plan_description', plan_name)
-    product_info = detect_product_from_plan(plan_name, plan_description)
+    product_info = PRODUCT_PRICING.get(request_data.get('plan_product_key') or '')
+    if not product_info:
+        plan_description = request_data.get('plan_description', plan_name)
+        product_info = detect_product_from_plan(plan_name, plan_description)
     
     # Get AppleCare+ price (MRP)
     applecare_price = request_data.get('plan_mrp', 0) or 14900  # Default AppleCare+ price
@@ -643,7 +1643,7 @@ async def generate_invoice_pdf(request_data: dict, filename: str) -> str:
     sgst = round(total_gst / 2, 2)
     
     # Create PDF
-    doc = SimpleDocTemplate(str(filepath), pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
     elements = []
     styles = getSampleStyleSheet()
     
@@ -836,8 +1836,124 @@ async def generate_invoice_pdf(request_data: dict, filename: str) -> str:
     ]))
     elements.append(footer_table)
     
-    doc.build(elements)
-    return str(filepath)
+    await offload("cpu", doc.build, elements)
+    stored = await store_invoice_bytes(buffer.getvalue())
+    return stored['key']
+
+# ==================== TEMPLATES ====================
+
+_style_block_re = re.compile(r"<style>(.*?)</style>\s*", re.S)
+_css_rule_re = re.compile(r"\.([\w-]+)\s*\{([^}]*)\}")
+_class_tag_re = re.compile(r"<[a-zA-Z][^<>]*?\sclass=\"[^\"]*\"[^<>]*>")
+_class_attr_re = re.compile(r'\sclass="([^"]*)"')
+
+def inline_css(source: str) -> str:
+    """Move `.class { ... }` rules from <style> blocks onto the elements using them.
+
+    Email clients ignore <style>, so this runs once when a template is loaded rather than
+    per message. Only simple class selectors are supported - that's all our templates use.
+    """
+    rules = {}
+    for block in _style_block_re.findall(source):
+        for name, declarations in _css_rule_re.findall(block):
+            rules[name] = " ".join(f"{d.strip()};" for d in declarations.split(";") if d.strip())
+    if not rules:
+        return source
+    source = _style_block_re.sub("", source)
+
+    def inline_tag(match):
+        tag = match.group(0)
+        classes = _class_attr_re.search(tag).group(1).split()
+        missing = [name for name in classes if name not in rules]
+        if missing:
+            raise ValueError(f"Undefined CSS class(es) in template: {', '.join(missing)}")
+        css = " ".join(rules[name] for name in classes)
+        tag = _class_attr_re.sub("", tag, count=1)
+        if ' style="' in tag:
+            return tag.replace(' style="', f' style="{css} ', 1)
+        name_end = re.match(r"<[a-zA-Z0-9]+", tag).end()
+        return f'{tag[:name_end]} style="{css}"{tag[name_end:]}'
+
+    return _class_tag_re.sub(inline_tag, source)
+
+class InliningLoader(FileSystemLoader):
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if template.endswith(".html"):
+            source = inline_css(source)
+        return source, filename, uptodate
+
+class TemplateRegistry:
+    """Compiled Jinja2 templates for outbound email, ticket and HTML responses.
+
+    HTML templates are autoescaped (customer-supplied values can't inject markup) and have
+    their CSS inlined at compile time, so a render is just filling in the context.
+    Render counts and timings are kept per template.
+    """
+
+    def __init__(self, directory: Path):
+        self.env = Environment(
+            loader=InliningLoader(str(directory)),
+            autoescape=select_autoescape(enabled_extensions=("html",), default_for_string=False),
+            keep_trailing_newline=True,
+        )
+        self.directory = directory
+        self.templates = {}
+        self.stats = {}
+
+    def load(self):
+        """Compile every template in the directory (call once at startup)"""
+        for name in self.env.list_templates():
+            self._compile(name)
+        logger.info(f"Compiled {len(self.templates)} templates")
+
+    def _compile(self, name: str):
+        template = self.env.get_template(name)
+        self.templates[name] = template
+        self.stats.setdefault(name, {"renders": 0, "total_ms": 0.0, "max_ms": 0.0})
+        return template
+
+    def render(self, name: str, **context) -> str:
+        template = self.templates.get(name) or self._compile(name)
+        start = time.perf_counter()
+        output = template.render(**context)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats = self.stats[name]
+        stats["renders"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        return output
+
+    def report(self) -> dict:
+        return {
+            name: {
+                "renders": stats["renders"],
+                "avg_ms": round(stats["total_ms"] / stats["renders"], 4) if stats["renders"] else 0.0,
+                "max_ms": round(stats["max_ms"], 4),
+            }
+            for name, stats in sorted(self.stats.items())
+        }
+
+templates = TemplateRegistry(TEMPLATE_DIR)
+
+def render_link_notice(title: str, message: str, color: str = "#dc3545", status: Optional[str] = None, status_code: int = 200) -> HTMLResponse:
+    return HTMLResponse(
+        content=templates.render("link_notice.html", title=title, message=message, color=color, status=status),
+        status_code=status_code
+    )
+
+def render_link_result(outcome: str, customer_name: str) -> HTMLResponse:
+    if outcome == "approved":
+        context = {
+            "icon": "✅", "color": "#28a745", "title": "Request Approved!",
+            "detail": "A TGME ticket will be created and the activation email will be sent to Apple."
+        }
+    else:
+        context = {
+            "icon": "❌", "color": "#dc3545", "title": "Request Declined",
+            "detail": "No further action will be taken on this request."
+        }
+    return HTMLResponse(content=templates.render("link_result.html", outcome=outcome, customer_name=customer_name, **context))
 
 # ==================== EMAIL SERVICE ====================
 
@@ -853,92 +1969,148 @@ async def send_activation_email(request_data: dict, invoice_path: Optional[str]
         logger.warning("No valid Apple email addresses configured")
         return False
     
-    msg = MIMEMultipart()
-    msg['From'] = settings['smtp_email']
-    msg['To'] = ', '.join(apple_emails)  # Join multiple recipients
-    
     # Email subject format: AppleCare+ for (Customer name) #(OSTICKETID)
     customer_name = request_data.get('customer_name', 'Customer')
     if ticket_id:
-        msg['Subject'] = f"AppleCare+ for {customer_name} #{ticket_id}"
+        subject = f"AppleCare+ for {customer_name} #{ticket_id}"
     else:
-        msg['Subject'] = f"AppleCare+ for {customer_name}"
+        subject = f"AppleCare+ for {customer_name}"
     
-    # Build email body with tabular format
-    html_body = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif;">
-    <h2>AppleCare+ Activation Request</h2>
-    <p>Please find the activation details below:</p>
-    <table border="1" cellpadding="8" cellspacing="0" style="border-collapse: collapse;">
-        <tr style="background-color: #f2f2f2;">
-            <th>IMEI/Serial</th>
-            <th>NAME</th>
-            <th>EMAIL ID</th>
-            <th>MOBILE NO</th>
-            <th>Plan Part Code</th>
-            <th>Device DOP</th>
-            <th>Billing Location</th>
-            <th>Payment Type</th>
-            <th>Plan Name</th>
-            <th>Partner Name</th>
-        </tr>
-        <tr>
-            <td>{request_data.get('serial_number', '')}</td>
-            <td>{request_data.get('customer_name', '')}</td>
-            <td>{request_data.get('customer_email', '')}</td>
-            <td>{request_data.get('customer_mobile', '')}</td>
-            <td>{request_data.get('plan_sku', '') or request_data.get('plan_part_code', '')}</td>
-            <td>{request_data.get('device_activation_date', '')}</td>
-            <td>{request_data.get('billing_location', 'F9B4869273B7')}</td>
-            <td>{request_data.get('payment_type', 'Insta')}</td>
-            <td>AppleCare+</td>
-            <td>{settings.get('partner_name', '')}</td>
-        </tr>
-    </table>
-    <br>
-    <p>Best regards,<br>{settings.get('partner_name', 'Partner')}</p>
-    </body>
-    </html>
-    """
+    # Resends reuse the flattened message while nothing that feeds it has changed
+    fingerprint = activation_message_fingerprint(settings, request_data, invoice_path, subject)
+    message = outbound_messages.get(request_data['id'], fingerprint)
+    if message is None:
+        # Attach invoice if exists
+        attachments = []
+        if await invoice_exists(invoice_path):
+            attachments.append(("invoice.pdf", await read_invoice(invoice_path)))
+        message = await offload("cpu", activation_message_bytes, settings, apple_emails, [request_data], subject, attachments)
+        outbound_messages.put(request_data['id'], fingerprint, message)
+    return await send_apple_message(settings, apple_emails, message)
+
+def build_activation_message(settings: dict, apple_emails: List[str], requests: List[dict], subject: str, attachments: List[tuple]) -> "MIMEMultipart":
+    """Build the Apple activation email: one table row per request plus (filename, bytes) PDF attachments"""
+    # The email package is only loaded once a worker actually sends mail
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.mime.base import MIMEBase
+    from email import encoders
+    
+    msg = MIMEMultipart()
+    msg['From'] = settings['smtp_email']
+    msg['To'] = ', '.join(apple_emails)  # Join multiple recipients
+    msg['Subject'] = subject
     
+    # Build email body with tabular format
+    html_body = templates.render(
+        "activation_email.html",
+        requests=requests,
+        partner_name=settings.get('partner_name', '')
+    )
     msg.attach(MIMEText(html_body, 'html'))
     
-    # Attach invoice if exists
-    if invoice_path and os.path.exists(invoice_path):
-        with open(invoice_path, 'rb') as f:
-            part = MIMEBase('application', 'pdf')
-            part.set_payload(f.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', 'attachment; filename=invoice.pdf')
-            msg.attach(part)
+    for filename, content in attachments:
+        part = MIMEBase('application', 'pdf')
+        part.set_payload(content)
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename={filename}')
+        msg.attach(part)
+    return msg
+
+def activation_message_bytes(settings: dict, apple_emails: List[str], requests: List[dict], subject: str, attachments: List[tuple]) -> bytes:
+    """Template rendering and base64-encoding the PDFs is CPU work, so it's run on the cpu pool"""
+    return build_activation_message(settings, apple_emails, requests, subject, attachments).as_bytes()
+
+async def smtp_send(settings: dict, msg: Union["MIMEMultipart", bytes], recipients: List[str]):
+    import aiosmtplib  # loaded on the first outbound email instead of at worker boot
     
+    await aiosmtplib.send(
+        msg,
+        sender=settings['smtp_email'],
+        recipients=recipients,
+        hostname=settings.get('smtp_host', 'smtp.gmail.com'),
+        port=settings.get('smtp_port', 587),
+        username=settings['smtp_email'],
+        password=settings['smtp_password'],
+        start_tls=True
+    )
+
+async def send_apple_message(settings: dict, apple_emails: List[str], msg: Union["MIMEMultipart", bytes]) -> bool:
     try:
-        await aiosmtplib.send(
-            msg,
-            recipients=apple_emails,  # Explicitly pass all recipients
-            hostname=settings.get('smtp_host', 'smtp.gmail.com'),
-            port=settings.get('smtp_port', 587),
-            username=settings['smtp_email'],
-            password=settings['smtp_password'],
-            start_tls=True
-        )
+        await smtp_send(settings, msg, apple_emails)
         logger.info(f"Email sent successfully to {', '.join(apple_emails)}")
         return True
     except Exception as e:
         logger.error(f"Failed to send email: {e}")
         return False
 
-# ==================== APPROVAL EMAIL SERVICE ====================
+# ==================== OUTBOUND MESSAGE CACHE ====================
 
-def generate_approval_token(request_id: str, action: str) -> str:
-    """Generate a secure token for approval/decline links"""
-    secret = f"{JWT_SECRET}-{request_id}-{action}"
-    return hashlib.sha256(secret.encode()).hexdigest()[:32]
+OUTBOUND_CACHE_MAX_BYTES = int(os.environ.get('OUTBOUND_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
 
-def verify_approval_token(request_id: str, action: str, token: str) -> bool:
-    """Verify the approval token"""
-    expected_token = generate_approval_token(request_id, action)
+# Request fields rendered into activation_email.html
+ACTIVATION_EMAIL_FIELDS = (
+    "serial_number", "customer_name", "customer_email", "customer_mobile", "plan_sku", "plan_part_code",
+    "device_activation_date", "billing_location", "payment_type",
+)
+
+def activation_message_fingerprint(settings: dict, request_data: dict, invoice_path: Optional[str], subject: str) -> str:
+    """Hash of everything that goes into an activation email; any change means the cached message is stale"""
+    parts = {
+        "fields": [request_data.get(name) for name in ACTIVATION_EMAIL_FIELDS],
+        "subject": subject,
+        "invoice_path": invoice_path,
+        "invoice_updated_at": request_data.get('invoice_updated_at'),
+        "settings": [settings.get('smtp_email'), settings.get('apple_email'), settings.get('partner_name')],
+    }
+    return hashlib.sha256(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()
+
+class OutboundMessageCache:
+    """Flattened MIME messages per request, evicted least-recently-used beyond max_bytes"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # request_id -> (fingerprint, message bytes)
+    
+    def get(self, request_id: str, fingerprint: str) -> Optional[bytes]:
+        entry = self._entries.get(request_id)
+        if entry is None or entry[0] != fingerprint:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(request_id)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, request_id: str, fingerprint: str, message: bytes):
+        self.invalidate(request_id)
+        if len(message) > self.max_bytes:
+            return
+        self._entries[request_id] = (fingerprint, message)
+        self.size += len(message)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+    
+    def invalidate(self, request_id: str):
+        entry = self._entries.pop(request_id, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+outbound_messages = OutboundMessageCache(OUTBOUND_CACHE_MAX_BYTES)
+
+# ==================== APPROVAL EMAIL SERVICE ====================
+
+def generate_approval_token(request_id: str, action: str) -> str:
+    """Generate a secure token for approval/decline links"""
+    secret = f"{JWT_SECRET}-{request_id}-{action}"
+    return hashlib.sha256(secret.encode()).hexdigest()[:32]
+
+def verify_approval_token(request_id: str, action: str, token: str) -> bool:
+    """Verify the approval token"""
+    expected_token = generate_approval_token(request_id, action)
     return token == expected_token
 
 async def send_approval_email(request_data: dict, base_url: str):
@@ -948,8 +2120,18 @@ async def send_approval_email(request_data: dict, base_url: str):
         logger.warning("SMTP settings not configured for approval email")
         return False
     
+    if settings.get('approval_digest_enabled'):
+        # Digest mode - the request goes out with the next approval digest instead
+        await db.activation_requests.update_one(
+            {"id": request_data.get('id', '')},
+            {"$set": {"approval_notification": "digest"}}
+        )
+        return True
+    
     # Get approval email from settings, fallback to default
     approval_email = settings.get('approval_email', '').strip() or DEFAULT_APPROVAL_EMAIL
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
     
     request_id = request_data.get('id', '')
     approve_token = generate_approval_token(request_id, 'approve')
@@ -963,86 +2145,268 @@ async def send_approval_email(request_data: dict, base_url: str):
     msg['To'] = approval_email
     msg['Subject'] = f"Approval Required: AppleCare+ Activation - {request_data.get('customer_name', '')}"
     
-    html_body = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-        <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 20px; text-align: center;">
-            <h1 style="color: white; margin: 0;">AppleCare+ Activation Request</h1>
-            <p style="color: rgba(255,255,255,0.9); margin: 10px 0 0 0;">Approval Required</p>
-        </div>
-        
-        <div style="padding: 30px; background: #f8f9fa;">
-            <div style="background: white; border-radius: 10px; padding: 25px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <h2 style="color: #333; border-bottom: 2px solid #667eea; padding-bottom: 10px;">Request Details</h2>
-                
-                <h3 style="color: #667eea; margin-top: 20px;">Customer Information</h3>
-                <table style="width: 100%; border-collapse: collapse;">
-                    <tr><td style="padding: 8px 0; color: #666;">Name:</td><td style="padding: 8px 0; font-weight: bold;">{request_data.get('customer_name', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">Email:</td><td style="padding: 8px 0;">{request_data.get('customer_email', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">Mobile:</td><td style="padding: 8px 0;">{request_data.get('customer_mobile', '')}</td></tr>
-                </table>
-                
-                <h3 style="color: #667eea; margin-top: 20px;">Dealer Information</h3>
-                <table style="width: 100%; border-collapse: collapse;">
-                    <tr><td style="padding: 8px 0; color: #666;">Name:</td><td style="padding: 8px 0; font-weight: bold;">{request_data.get('dealer_name', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">Email:</td><td style="padding: 8px 0;">{request_data.get('dealer_email', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">Mobile:</td><td style="padding: 8px 0;">{request_data.get('dealer_mobile', '')}</td></tr>
-                </table>
-                
-                <h3 style="color: #667eea; margin-top: 20px;">Device Information</h3>
-                <table style="width: 100%; border-collapse: collapse;">
-                    <tr><td style="padding: 8px 0; color: #666;">Model:</td><td style="padding: 8px 0; font-weight: bold;">{request_data.get('model_id', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">Serial/IMEI:</td><td style="padding: 8px 0; font-family: monospace;">{request_data.get('serial_number', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">Activation Date:</td><td style="padding: 8px 0;">{request_data.get('device_activation_date', '')}</td></tr>
-                </table>
-                
-                <h3 style="color: #667eea; margin-top: 20px;">Plan Details</h3>
-                <table style="width: 100%; border-collapse: collapse;">
-                    <tr><td style="padding: 8px 0; color: #666;">Plan:</td><td style="padding: 8px 0; font-weight: bold;">{request_data.get('plan_name', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">SKU:</td><td style="padding: 8px 0; font-family: monospace;">{request_data.get('plan_sku', '')}</td></tr>
-                    <tr><td style="padding: 8px 0; color: #666;">MRP:</td><td style="padding: 8px 0;">₹{request_data.get('plan_mrp', 'N/A')}</td></tr>
-                </table>
-            </div>
-            
-            <div style="margin-top: 30px; text-align: center;">
-                <a href="{approve_url}" style="display: inline-block; background: #28a745; color: white; padding: 15px 40px; text-decoration: none; border-radius: 30px; font-weight: bold; font-size: 16px; margin: 10px;">APPROVE</a>
-                <a href="{decline_url}" style="display: inline-block; background: #dc3545; color: white; padding: 15px 40px; text-decoration: none; border-radius: 30px; font-weight: bold; font-size: 16px; margin: 10px;">DECLINE</a>
-            </div>
-            
-            <p style="text-align: center; color: #666; margin-top: 20px; font-size: 12px;">
-                You can also approve/decline from the <a href="{base_url}/admin">Admin Dashboard</a>
-            </p>
-        </div>
-        
-        <div style="background: #333; color: white; padding: 15px; text-align: center; font-size: 12px;">
-            <p style="margin: 0;">AppleCare+ Activation System | {settings.get('partner_name', 'Partner')}</p>
-        </div>
-    </body>
-    </html>
-    """
+    html_body = templates.render(
+        "approval_email.html",
+        request=request_data,
+        approve_url=approve_url,
+        decline_url=decline_url,
+        base_url=base_url,
+        partner_name=settings.get('partner_name', '')
+    )
     
     msg.attach(MIMEText(html_body, 'html'))
     
     try:
-        await aiosmtplib.send(
-            msg,
-            recipients=[approval_email],
-            hostname=settings.get('smtp_host', 'smtp.gmail.com'),
-            port=settings.get('smtp_port', 587),
-            username=settings['smtp_email'],
-            password=settings['smtp_password'],
-            start_tls=True
-        )
+        await smtp_send(settings, msg, [approval_email])
         logger.info(f"Approval email sent to {approval_email}")
         return True
     except Exception as e:
         logger.error(f"Failed to send approval email: {e}")
         return False
 
+# ==================== APPROVAL DIGEST ====================
+
+DIGEST_POLL_SECONDS = 60
+
+async def claim_scheduled_run(job_id: str, interval: timedelta) -> bool:
+    """Claim the next run of a periodic job; exactly one worker wins each run"""
+    now = datetime.now(timezone.utc)
+    # First sight of the job: schedule its first run one interval from now
+    await db.scheduled_jobs.update_one(
+        {"id": job_id},
+        {"$setOnInsert": {"id": job_id, "next_run_at": now + interval}},
+        upsert=True
+    )
+    claimed = await db.scheduled_jobs.find_one_and_update(
+        {"id": job_id, "next_run_at": {"$lte": now}},
+        {"$set": {"next_run_at": now + interval, "last_run_at": now}}
+    )
+    return claimed is not None
+
+async def send_approval_digest(request_ids: Optional[List[str]] = None) -> int:
+    """Send one approval email covering every request queued for the digest (or just request_ids,
+    for a bulk submission); returns the row count"""
+    settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
+    if not settings or not settings.get('smtp_email'):
+        logger.warning("SMTP settings not configured for approval digest")
+        return 0
+    
+    # Claim queued requests for this digest in one update so concurrent runs can't double-send
+    digest_id = str(uuid.uuid4())
+    queued = {"id": {"$in": request_ids}} if request_ids is not None else {"approval_notification": "digest"}
+    await db.activation_requests.update_many(
+        {**queued, "status": "pending_approval", "approval_digest_id": None},
+        {"$set": {"approval_digest_id": digest_id}}
+    )
+    requests = await db.activation_requests.find({"approval_digest_id": digest_id}, {"_id": 0}).sort("created_at", 1).to_list(None)
+    if not requests:
+        return 0
+    
+    base_url = requests[-1].get('approval_base_url', '')
+    rows = []
+    for req in requests:
+        request_id = req['id']
+        rows.append({
+            "request": req,
+            "approve_url": f"{base_url}/api/activation-requests/{request_id}/approve-link?token={generate_approval_token(request_id, 'approve')}",
+            "decline_url": f"{base_url}/api/activation-requests/{request_id}/decline-link?token={generate_approval_token(request_id, 'decline')}",
+        })
+    approve_all_url = f"{base_url}/api/approval-digests/{digest_id}/approve-all?token={generate_approval_token(digest_id, 'approve-all')}"
+    
+    approval_email = settings.get('approval_email', '').strip() or DEFAULT_APPROVAL_EMAIL
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    
+    msg = MIMEMultipart()
+    msg['From'] = settings['smtp_email']
+    msg['To'] = approval_email
+    msg['Subject'] = f"Approval Required: {len(rows)} AppleCare+ Activation Request{'s' if len(rows) != 1 else ''}"
+    msg.attach(MIMEText(templates.render(
+        "approval_digest.html",
+        rows=rows,
+        approve_all_url=approve_all_url,
+        base_url=base_url,
+        partner_name=settings.get('partner_name', '')
+    ), 'html'))
+    
+    request_ids = [req['id'] for req in requests]
+    try:
+        await smtp_send(settings, msg, [approval_email])
+    except Exception as e:
+        logger.error(f"Failed to send approval digest: {e}")
+        # Release the requests so the next digest picks them up again
+        await db.activation_requests.update_many(
+            {"approval_digest_id": digest_id},
+            {"$set": {"approval_digest_id": None}}
+        )
+        return 0
+    
+    await db.approval_digests.insert_one({
+        "id": digest_id,
+        "request_ids": request_ids,
+        "recipient": approval_email,
+        "created_at": datetime.now(timezone.utc)
+    })
+    logger.info(f"Approval digest {digest_id} sent to {approval_email} with {len(request_ids)} requests")
+    return len(request_ids)
+
+async def approval_digest_loop():
+    """Background loop: send an approval digest once per configured window while digest mode is on"""
+    while True:
+        try:
+            settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
+            if settings and settings.get('approval_digest_enabled'):
+                window = timedelta(minutes=max(1, int(settings.get('approval_digest_minutes') or 15)))
+                if await claim_scheduled_run("approval_digest", window):
+                    await send_approval_digest()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Approval digest loop error: {e}")
+        await asyncio.sleep(DIGEST_POLL_SECONDS)
+
+# ==================== APPLE ACTIVATION BATCHES ====================
+
+# Raw PDF bytes per batch email; base64 adds a third, so 18MB stays under the common 25MB SMTP limit
+APPLE_BATCH_MAX_BYTES = int(os.environ.get('APPLE_BATCH_MAX_BYTES', str(18 * 1024 * 1024)))
+
+async def queue_apple_batch(request_id: str, settings: dict):
+    """Queue an approved request for the next Apple batch; flush early once the row cap is reached"""
+    await db.activation_requests.update_one(
+        {"id": request_id, "status": "pending"},
+        {"$set": {"apple_batch_queued": True, "apple_batch_id": None, "updated_at": datetime.now(timezone.utc)}}
+    )
+    await bump_collection_version("activation_requests")
+    max_rows = max(1, int(settings.get('apple_batch_max_rows') or 25))
+    queued = await db.activation_requests.count_documents({"apple_batch_queued": True, "apple_batch_id": None})
+    if queued >= max_rows:
+        await send_apple_batches()
+
+async def split_apple_batch(requests: List[dict], max_bytes: int) -> List[List[dict]]:
+    """Split claimed requests so each email's attachments stay under max_bytes (an oversized invoice goes alone)"""
+    chunks, current, current_bytes = [], [], 0
+    for req in requests:
+        size = await invoice_size(req.get('invoice_path'))
+        if current and current_bytes + size > max_bytes:
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(req)
+        current_bytes += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+async def send_apple_batch_email(settings: dict, apple_emails: List[str], requests: List[dict]) -> bool:
+    """Send one activation email with a row and an invoice attachment per request"""
+    if len(requests) == 1:
+        req = requests[0]
+        subject = f"AppleCare+ for {req.get('customer_name', 'Customer')}"
+    else:
+        subject = f"AppleCare+ for {len(requests)} customers"
+    ticket_ids = [req['tgme_ticket_id'] for req in requests if req.get('tgme_ticket_id')]
+    if ticket_ids:
+        subject += " " + " ".join(f"#{ticket_id}" for ticket_id in ticket_ids)
+    
+    attachments = []
+    for req in requests:
+        if await invoice_exists(req.get('invoice_path')):
+            attachments.append((f"invoice_{req['serial_number']}.pdf", await read_invoice(req['invoice_path'])))
+    
+    msg = await offload("cpu", activation_message_bytes, settings, apple_emails, requests, subject, attachments)
+    return await send_apple_message(settings, apple_emails, msg)
+
+async def send_apple_batches() -> int:
+    """Send every queued request to Apple in batches of at most apple_batch_max_rows; returns the row count sent"""
+    settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
+    if not settings or not settings.get('smtp_email') or not settings.get('apple_email'):
+        logger.warning("Email settings not configured")
+        return 0
+    apple_emails = [e.strip() for e in settings['apple_email'].split(',') if e.strip()]
+    if not apple_emails:
+        logger.warning("No valid Apple email addresses configured")
+        return 0
+    max_rows = max(1, int(settings.get('apple_batch_max_rows') or 25))
+    
+    # Only approved requests go to Apple; anything that moved on while queued leaves the queue instead
+    sendable = "pending"
+    await db.activation_requests.update_many(
+        {"apple_batch_queued": True, "apple_batch_id": None, "status": {"$ne": sendable}},
+        {"$set": {"apple_batch_queued": False}}
+    )
+    
+    sent_rows = 0
+    while True:
+        candidates = await db.activation_requests.find(
+            {"apple_batch_queued": True, "apple_batch_id": None, "status": sendable}, {"_id": 0, "id": 1}
+        ).sort("created_at", 1).limit(max_rows).to_list(max_rows)
+        if not candidates:
+            break
+        
+        # Claim the rows in one update so a concurrent flush on another worker can't send them twice
+        batch_id = str(uuid.uuid4())
+        await db.activation_requests.update_many(
+            {"id": {"$in": [c['id'] for c in candidates]}, "apple_batch_id": None, "status": sendable},
+            {"$set": {"apple_batch_id": batch_id}}
+        )
+        claimed = await db.activation_requests.find({"apple_batch_id": batch_id}, {"_id": 0}).sort("created_at", 1).to_list(None)
+        
+        failed = False
+        for chunk in await split_apple_batch(claimed, APPLE_BATCH_MAX_BYTES):
+            chunk_ids = [req['id'] for req in chunk]
+            if await send_apple_batch_email(settings, apple_emails, chunk):
+                await db.activation_requests.update_many(
+                    {"id": {"$in": chunk_ids}, "status": sendable},
+                    {"$set": {
+                        "status": "email_sent",
+                        "email_sent": True,
+                        "apple_batch_queued": False,
+                        "updated_at": datetime.now(timezone.utc)
+                    }}
+                )
+                # Rows whose status changed while the email was going out keep that status and leave the queue
+                raced = await db.activation_requests.distinct("id", {"id": {"$in": chunk_ids}, "apple_batch_queued": True})
+                if raced:
+                    await db.activation_requests.update_many({"id": {"$in": raced}}, {"$set": {"apple_batch_queued": False}})
+                for req in chunk:
+                    if req['id'] not in raced:
+                        live_updates.publish_local(status_event({**req, "status": "email_sent"}, req.get('status')))
+                sent_rows += len(chunk) - len(raced)
+            else:
+                # Release the rows so the next window retries them
+                await db.activation_requests.update_many(
+                    {"id": {"$in": chunk_ids}},
+                    {"$set": {"apple_batch_id": None}}
+                )
+                failed = True
+        await bump_collection_version("activation_requests")
+        if failed:
+            break
+    
+    if sent_rows:
+        logger.info(f"Apple batch sent: {sent_rows} request(s)")
+    return sent_rows
+
+async def apple_batch_loop():
+    """Background loop: flush queued Apple activation emails once per configured window while batching is on"""
+    while True:
+        try:
+            settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
+            if settings and settings.get('apple_batch_enabled'):
+                window = timedelta(minutes=max(1, int(settings.get('apple_batch_minutes') or 15)))
+                if await claim_scheduled_run("apple_batch", window):
+                    await send_apple_batches()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Apple batch loop error: {e}")
+        await asyncio.sleep(DIGEST_POLL_SECONDS)
+
 # ==================== TGME SUPPORT TICKET SERVICE ====================
 
 async def create_tgme_ticket(request_data: dict):
     """Create a TGME Support Ticket (formerly osTicket) using DEALER details"""
+    import httpx  # loaded on the first ticket instead of at worker boot
+    
     settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
     
     # Support both new and old field names for backward compatibility
@@ -1054,44 +2418,7 @@ async def create_tgme_ticket(request_data: dict):
         return None
     
     # Build comprehensive ticket body with ALL form details
-    ticket_body = f"""
-================================================================================
-                        AppleCare+ ACTIVATION REQUEST
-================================================================================
-
-DEALER INFORMATION (Ticket Raised By)
---------------------------------------------------------------------------------
-Dealer Name:          {request_data.get('dealer_name', '')}
-Dealer Email:         {request_data.get('dealer_email', '')}
-Dealer Mobile:        {request_data.get('dealer_mobile', '')}
-
-CUSTOMER INFORMATION
---------------------------------------------------------------------------------
-Customer Name:        {request_data.get('customer_name', '')}
-Customer Email:       {request_data.get('customer_email', '')}
-Customer Mobile:      {request_data.get('customer_mobile', '')}
-
-DEVICE INFORMATION
---------------------------------------------------------------------------------
-Model ID:             {request_data.get('model_id', '')}
-Serial Number/IMEI:   {request_data.get('serial_number', '')}
-Activation Date:      {request_data.get('device_activation_date', '')}
-
-APPLECARE+ PLAN DETAILS
---------------------------------------------------------------------------------
-Plan Name:            {request_data.get('plan_name', '')}
-Plan SKU:             {request_data.get('plan_sku', '')}
-Plan Part Code:       {request_data.get('plan_part_code', '')}
-Plan MRP:             ₹{request_data.get('plan_mrp', 'N/A')}
-
-INTERNAL REFERENCE
---------------------------------------------------------------------------------
-Billing Location:     {request_data.get('billing_location', 'F9B4869273B7')}
-Payment Type:         {request_data.get('payment_type', 'Insta')}
-Request ID:           {request_data.get('id', '')}
-
-================================================================================
-"""
+    ticket_body = templates.render("tgme_ticket.txt", request=request_data)
     
     # Use DEALER details for ticket creation (not customer)
     ticket_data = {
@@ -1124,89 +2451,562 @@ Request ID:           {request_data.get('id', '')}
         logger.error(f"TGME Support Ticket error: {e}")
         return None
 
+# ==================== RATE LIMITING ====================
+
+def parse_rate(value: str) -> tuple:
+    """'30/3600' -> (burst 30, refill rate 30 tokens per 3600 seconds)"""
+    count, _, seconds = value.partition('/')
+    burst = float(count)
+    return burst, burst / float(seconds or 1)
+
+# Token buckets for POST /api/activation-requests: "<burst>/<seconds>"
+SUBMIT_RATE_LIMITS = {
+    "ip": parse_rate(os.environ.get('SUBMIT_RATE_LIMIT_IP', '120/3600')),
+    "dealer_mobile": parse_rate(os.environ.get('SUBMIT_RATE_LIMIT_DEALER', '60/3600')),
+    "dealer_email": parse_rate(os.environ.get('SUBMIT_RATE_LIMIT_DEALER', '60/3600')),
+}
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')  # memory (per process) | mongo (shared by all workers)
+# Proxies in front of us that append to X-Forwarded-For; the client is that many entries from the right.
+# 0 (the default) ignores the header, which any client can set; deployments behind a proxy must set it.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+
+def take_token(tokens: float, updated: float, now: float, burst: float, rate: float, cost: float = 1) -> tuple:
+    """Refill a bucket and try to take cost tokens; returns (tokens, retry_after seconds or 0)"""
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+class MemoryRateLimitStore:
+    """Buckets in this process only; the least recently used are dropped beyond max_keys"""
+
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+
+    async def hit(self, key: str, burst: float, rate: float, cost: float = 1) -> float:
+        now = time.time()
+        tokens, updated = self._buckets.pop(key, (burst, now))
+        tokens, retry_after = take_token(tokens, updated, now, burst, rate, cost)
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+class MongoRateLimitStore:
+    """Buckets in db.rate_limits shared by every worker, updated with compare-and-set"""
+
+    async def hit(self, key: str, burst: float, rate: float, cost: float = 1) -> float:
+        # Expire idle buckets once they would have refilled completely anyway
+        ttl = timedelta(seconds=burst / rate)
+        for _ in range(5):
+            now = time.time()
+            doc = await db.rate_limits.find_one({"key": key}, {"_id": 0})
+            if doc is None:
+                try:
+                    await db.rate_limits.insert_one({
+                        "key": key, "tokens": burst - cost, "updated": now,
+                        "expires_at": datetime.now(timezone.utc) + ttl
+                    })
+                    return 0.0
+                except DuplicateKeyError:
+                    continue
+            tokens, retry_after = take_token(doc['tokens'], doc['updated'], now, burst, rate, cost)
+            if retry_after:
+                return retry_after
+            result = await db.rate_limits.update_one(
+                {"key": key, "tokens": doc['tokens'], "updated": doc['updated']},
+                {"$set": {"tokens": tokens, "updated": now, "expires_at": datetime.now(timezone.utc) + ttl}}
+            )
+            if result.modified_count:
+                return 0.0
+        # Heavy contention on one key: let the request through rather than fail it
+        return 0.0
+
+rate_limit_store = MongoRateLimitStore() if RATE_LIMIT_STORE == 'mongo' else MemoryRateLimitStore()
+rate_limit_metrics = defaultdict(Counter)  # scope -> {"allowed": n, "limited": n, "errors": n}
+
+def client_ip(request: Request) -> str:
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    if TRUSTED_PROXY_HOPS and len(forwarded) >= TRUSTED_PROXY_HOPS:
+        return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+async def is_admin_request(request: Request) -> bool:
+    """Admins creating requests from the dashboard aren't rate limited.
+
+    Registration is open, so a valid token alone proves nothing: the user must still exist
+    and hold the admin role."""
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return False
+    try:
+        user = await get_current_user(authorization)
+    except HTTPException:
+        return False
+    return user.get("role") == "admin"
+
+async def enforce_submission_rate_limit(request: Request, submissions: List[ActivationRequestCreate]):
+    """Raise 429 with Retry-After once the client IP or a dealer has used up its bucket.
+
+    Each bucket is charged once per submission, one token per row it covers (the IP every row,
+    a dealer only their own), capped at the bucket size so a bulk submission can always go
+    through from full buckets."""
+    if await is_admin_request(request):
+        return
+    charges = Counter({("ip", client_ip(request)): len(submissions)})
+    for data in submissions:
+        charges[("dealer_mobile", re.sub(r'\D', '', data.dealer_mobile)[-10:])] += 1
+        charges[("dealer_email", data.dealer_email.lower())] += 1
+    for (scope, subject), rows in charges.items():
+        if not subject:
+            continue
+        burst, rate = SUBMIT_RATE_LIMITS[scope]
+        try:
+            retry_after = await rate_limit_store.hit(f"submit:{scope}:{subject}", burst, rate, min(rows, burst))
+        except Exception as e:
+            # A shared store outage must not take submissions down with it
+            rate_limit_metrics[scope]["errors"] += 1
+            logger.error(f"Rate limit store error: {e}")
+            continue
+        if retry_after:
+            rate_limit_metrics[scope]["limited"] += 1
+            logger.warning(f"Rate limited submission by {scope} {subject}")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many activation requests, please try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+        rate_limit_metrics[scope]["allowed"] += 1
+
+@api_router.get("/admin/rate-limit-stats")
+async def get_rate_limit_stats(user: dict = Depends(get_current_user)):
+    """Allowed / limited counts per bucket scope since this worker started"""
+    return {
+        "store": RATE_LIMIT_STORE,
+        "limits": {scope: {"burst": burst, "per_second": rate} for scope, (burst, rate) in SUBMIT_RATE_LIMITS.items()},
+        "counters": {scope: dict(counts) for scope, counts in rate_limit_metrics.items()},
+    }
+
+# ==================== SUBMISSION DEDUPLICATION ====================
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# Same serial + plan resubmitted within this window, while the original still awaits approval,
+# returns the original request (0 disables)
+DUPLICATE_WINDOW_MINUTES = int(os.environ.get('DUPLICATE_WINDOW_MINUTES', '30'))
+
+def normalize_serial(serial_number: str) -> str:
+    """Serials are typed by hand: ignore case, spaces and dashes"""
+    return re.sub(r'[\s\-]', '', serial_number).upper()
+
+def submission_fingerprint(data: ActivationRequestCreate) -> str:
+    """Hash of the submitted fields, to tell a retry from an Idempotency-Key reused for something else"""
+    return hashlib.sha256(json.dumps(data.model_dump(), sort_keys=True, default=str).encode()).hexdigest()
+
+def submission_claims(idempotency_key: Optional[str], serial_key: str, plan_id: str) -> List[tuple]:
+    """(key, ttl, pending_only) triples a new submission must own before doing any work.
+
+    pending_only claims stop blocking once the owning request has left pending_approval, so a
+    deliberate resubmission after an approve/decline goes through.
+    """
+    claims = []
+    if idempotency_key:
+        claims.append((f"idem:{idempotency_key}", IDEMPOTENCY_KEY_TTL, False))
+    if DUPLICATE_WINDOW_MINUTES > 0:
+        claims.append((f"dup:{serial_key}:{plan_id}", timedelta(minutes=DUPLICATE_WINDOW_MINUTES), True))
+    return claims
+
+async def claim_submission(claims: List[tuple], request_id: str) -> Optional[str]:
+    """Claim every key for request_id; returns the request that already owns one, or None if all were claimed.
+
+    The unique index on submission_keys.key makes the claim atomic across workers. Expired
+    keys are taken over in place, since the TTL monitor only reaps them about once a minute.
+    """
+    for key, ttl, pending_only in claims:
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                await db.submission_keys.insert_one({"key": key, "request_id": request_id, "expires_at": now + ttl})
+                break
+            except DuplicateKeyError:
+                pass
+            existing = await db.submission_keys.find_one({"key": key}, {"_id": 0})
+            if existing is None:
+                continue  # Reaped between the insert and the lookup: try the insert again
+            replaceable = existing['expires_at'] <= now
+            if not replaceable and pending_only:
+                owner = await db.activation_requests.find_one({"id": existing['request_id']}, {"_id": 0, "status": 1})
+                replaceable = owner is not None and owner.get('status') != "pending_approval"
+            if not replaceable:
+                await release_submission(request_id)
+                return existing['request_id']
+            # Conditional on the owner we saw, so two concurrent takeovers can't both win
+            taken_over = await db.submission_keys.find_one_and_update(
+                {"key": key, "request_id": existing['request_id']},
+                {"$set": {"request_id": request_id, "expires_at": now + ttl}}
+            )
+            if taken_over:
+                break
+    return None
+
+async def release_submission(request_id: str):
+    await db.submission_keys.delete_many({"request_id": request_id})
+
+async def find_near_duplicate(serial_key: str, request_id: str) -> Optional[str]:
+    """Most recent other request for the same device, so the admin list can flag it"""
+    match = await db.activation_requests.find_one(
+        {"serial_normalized": serial_key, "id": {"$ne": request_id}},
+        {"_id": 0, "id": 1},
+        sort=[("created_at", -1)]
+    )
+    return match['id'] if match else None
+
+# ==================== STATUS TRANSITIONS ====================
+
+# Every status change must follow this table: current status -> statuses it may move to.
+# Admins may skip ahead or cancel, but nothing moves backwards except reopening, and
+# approving is pending_approval -> pending only, so exactly one click wins and processing runs once.
+STATUS_TRANSITIONS = {
+    "pending_approval": ("pending", "email_sent", "payment_pending", "activated", "declined", "cancelled"),
+    "pending": ("email_sent", "payment_pending", "activated", "declined", "cancelled"),
+    "email_sent": ("payment_pending", "activated", "cancelled"),
+    "payment_pending": ("activated", "cancelled"),
+    "activated": ("cancelled",),
+    "declined": ("pending_approval",),
+    "cancelled": ("pending_approval",),
+}
+
+def statuses_allowing(target: str) -> List[str]:
+    """Statuses a request may be in to move to target"""
+    return [status for status, targets in STATUS_TRANSITIONS.items() if target in targets]
+
+async def transition_request_status(request_id: str, target: str, extra: Optional[dict] = None) -> Optional[dict]:
+    """Move a request to target in one round trip; returns the request as it was before, or None if the move isn't allowed"""
+    update = {"status": target, "updated_at": datetime.now(timezone.utc), **(extra or {})}
+    if target != "pending":
+        # Only approved requests wait for an Apple batch; declining, cancelling or reopening drops them from it
+        update["apple_batch_queued"] = False
+    before = await db.activation_requests.find_one_and_update(
+        {"id": request_id, "status": {"$in": statuses_allowing(target)}},
+        {"$set": update},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before:
+        live_updates.publish_local(status_event({**before, "status": target}, before.get('status')))
+    return before
+
+async def current_request_status(request_id: str) -> Optional[str]:
+    """Status of a request after a refused transition (None if it doesn't exist)"""
+    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0, "status": 1})
+    return req.get('status') if req else None
+
+# ==================== EXPORT ====================
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))  # rows per cursor fetch
+EXPORT_FLUSH_BYTES = 64 * 1024  # CSV/NDJSON bytes buffered before each chunk is sent
+
+EXPORT_FIELDS = (
+    "id", "created_at", "updated_at", "status", "dealer_name", "dealer_mobile", "dealer_email",
+    "customer_name", "customer_mobile", "customer_email", "model_id", "serial_number",
+    "plan_id", "plan_name", "plan_part_code", "plan_sku", "plan_mrp", "device_activation_date",
+    "tgme_ticket_id", "email_sent", "duplicate_of",
+)
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def export_query(status: Optional[str], date_from: Optional[str], date_to: Optional[str],
+                 dealer: Optional[str], plan_id: Optional[str]) -> dict:
+    query = {}
+    if status:
+        query["status"] = status
+    created = {}
+    try:
+        if date_from:
+            created["$gte"] = datetime.fromisoformat(date_from).replace(tzinfo=timezone.utc)
+        if date_to:
+            # date_to is inclusive: everything before the start of the next day
+            created["$lt"] = datetime.fromisoformat(date_to).replace(tzinfo=timezone.utc) + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if created:
+        query["created_at"] = created
+    if dealer:
+        query["$or"] = [{"dealer_mobile": dealer}, {"dealer_name": {"$regex": f"^{re.escape(dealer)}$", "$options": "i"}}]
+    if plan_id:
+        query["plan_id"] = plan_id
+    return query
+
+async def iter_export_batches(query: dict):
+    """Matching requests in created_at order, EXPORT_BATCH_SIZE documents at a time"""
+    cursor = db.activation_requests.find(query, {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}})
+    cursor = cursor.sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Phone numbers such as +91 98765-43210 start with "+" but can't call anything, so they're left as-is
+_phone_like_re = re.compile(r"^\+?\d[\d\s-]*$")
+
+def csv_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    text = str(value)
+    # Spreadsheet apps run cells starting with these as formulas
+    if text[:1] in ("=", "+", "-", "@", "\t", "\r") and not _phone_like_re.match(text):
+        return "'" + text
+    return text
+
+async def export_csv(query: dict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for batch in iter_export_batches(query):
+        for doc in batch:
+            writer.writerow([csv_cell(doc.get(field)) for field in EXPORT_FIELDS])
+            if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+async def export_ndjson(query: dict):
+    chunk = bytearray()
+    async for batch in iter_export_batches(query):
+        for doc in batch:
+            chunk += dump_json({field: doc.get(field) for field in EXPORT_FIELDS}) + b"\n"
+            if len(chunk) >= EXPORT_FLUSH_BYTES:
+                yield bytes(chunk)
+                chunk.clear()
+    yield bytes(chunk)
+
+def xlsx_cell(value):
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).replace(tzinfo=None)  # Excel has no time zones; columns are UTC
+    return value
+
+async def export_xlsx(query: dict):
+    """Rows go through openpyxl's write_only mode (spooled to disk, not kept in memory); the
+    finished zip is then streamed from a temp file, since XLSX can't be written front to back."""
+    from openpyxl import Workbook  # see generate_invoice_pdf: heavy imports load on first use
+    
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Activation Requests")
+    sheet.append(list(EXPORT_FIELDS))
+    
+    def append_rows(batch):
+        for doc in batch:
+            sheet.append([xlsx_cell(doc.get(field)) for field in EXPORT_FIELDS])
+    
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        async for batch in iter_export_batches(query):
+            await offload("cpu", append_rows, batch)
+        await offload("cpu", workbook.save, path)
+        async for chunk in iter_file_chunks(path):
+            yield chunk
+    finally:
+        await aiofiles.os.remove(path)
+
+@api_router.get("/activation-requests/export")
+async def export_activation_requests(
+    format: str = "csv",
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    dealer: Optional[str] = None,
+    plan_id: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Stream every matching request (no row cap) as CSV, NDJSON or XLSX"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format. Must be one of: {list(EXPORT_FORMATS)}")
+    query = export_query(status, date_from, date_to, dealer, plan_id)
+    generator = {"csv": export_csv, "ndjson": export_ndjson, "xlsx": export_xlsx}[format](query)
+    filename = f"activation_requests_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.{format}"
+    return StreamingResponse(
+        generator,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
 # ==================== ACTIVATION REQUESTS ROUTES ====================
 
+def public_base_url(request: Request) -> str:
+    """Base URL for links in outbound emails"""
+    base_url = str(request.base_url).rstrip('/')
+    # In production, use the forwarded host if available
+    forwarded_host = request.headers.get('x-forwarded-host')
+    forwarded_proto = request.headers.get('x-forwarded-proto', 'https')
+    if forwarded_host:
+        base_url = f"{forwarded_proto}://{forwarded_host}"
+    return base_url
+
 @api_router.get("/activation-requests", response_model=List[ActivationRequest])
 async def get_activation_requests(status: Optional[str] = None, user: dict = Depends(get_current_user)):
     query = {}
     if status:
         query["status"] = status
-    requests = await db.activation_requests.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    for req in requests:
-        if isinstance(req.get('created_at'), str):
-            req['created_at'] = datetime.fromisoformat(req['created_at'])
-        if isinstance(req.get('updated_at'), str):
-            req['updated_at'] = datetime.fromisoformat(req['updated_at'])
-    return requests
+    requests = await db.activation_requests.find(query, activation_request_documents.projection).sort("created_at", -1).to_list(1000)
+    return FastJSONResponse(activation_request_documents.shape_many(requests))
+
+# Delta sync: clients keep a local copy and fetch only rows created/updated since their token.
+# Tokens are "<collection version>.<updated_at ms>.<last id>"; a "p" before the version marks a
+# continuation page. If the version hasn't moved since the token the answer is empty without a query.
+SYNC_PAGE_SIZE = 500
+# Re-read this much before the watermark: covers clock skew between workers and writes that
+# took their timestamp before a later-stamped write committed. Clients merge by id, so repeats are harmless.
+SYNC_OVERLAP = timedelta(seconds=int(os.environ.get('SYNC_OVERLAP_SECONDS', '5')))
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def encode_sync_token(version, updated_at: Optional[datetime], last_id: str = "") -> str:
+    ms = (updated_at - EPOCH) // timedelta(milliseconds=1) if isinstance(updated_at, datetime) else 0
+    return f"{version}.{ms}.{last_id}"
+
+def decode_sync_token(token: str) -> tuple:
+    """(version, watermark, last id, is continuation)"""
+    try:
+        version, ms, last_id = token.split(".", 2)
+        continuation = version.startswith("p")
+        return int(version.lstrip("p")), EPOCH + timedelta(milliseconds=int(ms)), last_id, continuation
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+@api_router.get("/activation-requests/changes")
+async def get_activation_request_changes(
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=1000),
+    user: dict = Depends(get_current_user)
+):
+    """Requests created or updated after `since` (everything when omitted), oldest change first.
+
+    Only rows with a date updated_at are synced: legacy string timestamps sort before dates and
+    can't be compared with a watermark, so they only appear in full syncs once the timestamp migration
+    has converted them."""
+    # Read the version before the rows: a write landing in between bumps it again, so the next sync re-checks
+    current = (await get_collection_versions()).get("activation_requests", 0)
+    query = {}
+    watermark = None
+    if since:
+        version, watermark, last_id, continuation = decode_sync_token(since)
+        if continuation:
+            # Finish the sync against the version it started from, so writes made meanwhile are re-checked next time
+            current = version
+            query = {"$or": [{"updated_at": {"$gt": watermark}}, {"updated_at": watermark, "id": {"$gt": last_id}}]}
+        elif version == current:
+            return FastJSONResponse({"changes": [], "token": since, "has_more": False})
+        else:
+            query = {"updated_at": {"$gte": watermark - SYNC_OVERLAP}}
+    
+    rows = await db.activation_requests.find(
+        {"$and": [{"updated_at": {"$type": "date"}}, query]}, activation_request_documents.projection
+    ).sort(
+        [("updated_at", 1), ("id", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    if has_more:
+        token = encode_sync_token(f"p{current}", rows[-1].get('updated_at'), rows[-1]['id'])
+    else:
+        newest = rows[-1].get('updated_at') if rows else None
+        token = encode_sync_token(current, max(filter(None, (watermark, newest)), default=None))
+    return FastJSONResponse({"changes": activation_request_documents.shape_many(rows), "token": token, "has_more": has_more})
 
 @api_router.get("/activation-requests/{request_id}", response_model=ActivationRequest)
 async def get_activation_request(request_id: str, user: dict = Depends(get_current_user)):
-    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0})
+    req = await db.activation_requests.find_one({"id": request_id}, activation_request_documents.projection)
     if not req:
         raise HTTPException(status_code=404, detail="Request not found")
-    if isinstance(req.get('created_at'), str):
-        req['created_at'] = datetime.fromisoformat(req['created_at'])
-    if isinstance(req.get('updated_at'), str):
-        req['updated_at'] = datetime.fromisoformat(req['updated_at'])
-    return req
+    return FastJSONResponse(activation_request_documents.shape(req))
 
-@api_router.post("/activation-requests", response_model=ActivationRequest)
+def build_activation_request(data: ActivationRequestCreate, plan: PlanRecord) -> ActivationRequest:
+    return ActivationRequest(
+        **{**data.model_dump(), "plan_id": plan.id},
+        plan_name=plan.display_name,
+        plan_part_code=plan.request_part_code,
+        plan_sku=plan.sku,
+        plan_mrp=plan.mrp,
+        plan_product_key=plan.product_key,
+        billing_location="F9B4869273B7",  # Hardcoded
+        payment_type="Insta",  # Hardcoded
+        status="pending_approval"  # NEW: Set initial status to pending_approval
+    )
+
+@api_router.post("/activation-requests", response_model=Union[ActivationRequest, SubmissionReceipt])
 async def create_activation_request(
     data: ActivationRequestCreate,
     background_tasks: BackgroundTasks,
-    request: Request
+    request: Request,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=200)
 ):
     # Public endpoint - no auth required
-    # Get plan details
-    plan = await db.plans.find_one({"id": data.plan_id}, {"_id": 0})
+    await enforce_submission_rate_limit(request, [data])
+    
+    # Get plan details from the in-process catalog (name / part code repair is precomputed there)
+    plan = await get_catalog_plan(data.plan_id)
     if not plan:
         raise HTTPException(status_code=400, detail="Invalid plan selected")
     
-    # Get plan details - prefer description over name, and sku over part_code
-    # (Excel upload sometimes puts wrong values in name/part_code fields)
-    plan_name_value = plan.get('description', '') or plan.get('name', '')
-    plan_sku_value = plan.get('sku', '') or ''
-    # Use SKU as part_code if part_code looks like a number (bad data)
-    plan_part_code_value = plan.get('part_code', '')
-    try:
-        float(plan_part_code_value)  # If it's a number, it's bad data
-        plan_part_code_value = plan_sku_value  # Use SKU instead
-    except (ValueError, TypeError):
-        pass  # It's a valid string, keep it
-    
-    request_obj = ActivationRequest(
-        **data.model_dump(),
-        plan_name=plan_name_value,
-        plan_part_code=plan_part_code_value,
-        plan_sku=plan_sku_value,
-        plan_mrp=plan.get('mrp'),
-        billing_location="F9B4869273B7",  # Hardcoded
-        payment_type="Insta",  # Hardcoded
-        status="pending_approval"  # NEW: Set initial status to pending_approval
+    serial_key = normalize_serial(data.serial_number)
+    request_obj = build_activation_request(data, plan)
+    
+    # A retried or double-tapped submission gets the original request back instead of a second one
+    original_id = await claim_submission(
+        submission_claims(idempotency_key, serial_key, data.plan_id), request_obj.id
     )
+    fingerprint = submission_fingerprint(data)
+    if original_id:
+        original = await db.activation_requests.find_one(
+            {"id": original_id}, {"_id": 0, "id": 1, "status": 1, "created_at": 1, "duplicate_of": 1, "submission_fingerprint": 1}
+        )
+        if not original:
+            raise HTTPException(status_code=409, detail="An identical submission is still being processed")
+        if idempotency_key and original.get('submission_fingerprint') != fingerprint and await db.submission_keys.find_one(
+            {"key": f"idem:{idempotency_key}", "request_id": original_id}, {"_id": 1}
+        ):
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different submission")
+        # The caller may only know the serial and plan, so the original's details aren't echoed back
+        response.headers["Idempotent-Replayed"] = "true"
+        return SubmissionReceipt(**original)
     
     doc = request_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
+    doc['serial_normalized'] = serial_key
+    doc['submission_fingerprint'] = fingerprint
+    doc['duplicate_of'] = await find_near_duplicate(serial_key, request_obj.id)
     
-    # Generate invoice PDF
-    invoice_filename = f"invoice_{request_obj.id}.pdf"
-    invoice_path = await generate_invoice_pdf(doc, invoice_filename)
-    doc['invoice_path'] = invoice_path
+    # Base URL for approval links (kept on the request for approval digests sent later)
+    base_url = public_base_url(request)
+    doc['approval_base_url'] = base_url
     
-    await db.activation_requests.insert_one(doc)
-    
-    # Get base URL for approval links
-    base_url = str(request.base_url).rstrip('/')
-    # In production, use the forwarded host if available
-    forwarded_host = request.headers.get('x-forwarded-host')
-    forwarded_proto = request.headers.get('x-forwarded-proto', 'https')
-    if forwarded_host:
-        base_url = f"{forwarded_proto}://{forwarded_host}"
+    try:
+        # Generate invoice PDF
+        invoice_path = await generate_invoice_pdf(doc)
+        doc['invoice_path'] = invoice_path
+        
+        await db.activation_requests.insert_one(doc)
+    except BaseException:
+        await release_submission(request_obj.id)
+        raise
+    await bump_collection_version("activation_requests")
+    live_updates.publish_local(created_event(doc))
     
     # NEW: Send approval email instead of directly processing
     background_tasks.add_task(send_approval_email, doc, base_url)
     
+    request_obj.duplicate_of = doc['duplicate_of']
     return request_obj
 
 async def process_activation_request(request_id: str):
@@ -1220,162 +3020,429 @@ async def process_activation_request(request_id: str):
     if ticket_id:
         await db.activation_requests.update_one(
             {"id": request_id},
-            {"$set": {"tgme_ticket_id": ticket_id, "updated_at": datetime.now(timezone.utc).isoformat()}}
+            {"$set": {"tgme_ticket_id": ticket_id, "updated_at": datetime.now(timezone.utc)}}
         )
     
+    # In batch mode the request waits for the next multi-row Apple email
+    settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
+    if settings and settings.get('apple_batch_enabled'):
+        await queue_apple_batch(request_id, settings)
+        return
+    
     # Send email to Apple with ticket ID in subject
     email_sent = await send_activation_email(req, req.get('invoice_path'), ticket_id)
     
-    # Update status to "email_sent" if email was sent successfully
-    update_data = {"email_sent": email_sent, "updated_at": datetime.now(timezone.utc).isoformat()}
-    if email_sent:
-        update_data["status"] = "email_sent"
-    
-    await db.activation_requests.update_one(
-        {"id": request_id},
-        {"$set": update_data}
-    )
+    # Move to "email_sent" if the email went out, unless an admin changed the status meanwhile
+    if not email_sent or not await transition_request_status(request_id, "email_sent", {"email_sent": email_sent}):
+        await db.activation_requests.update_one(
+            {"id": request_id},
+            {"$set": {"email_sent": email_sent, "updated_at": datetime.now(timezone.utc)}}
+        )
+    await bump_collection_version("activation_requests")
 
 @api_router.put("/activation-requests/{request_id}/status")
 async def update_request_status(request_id: str, status: str, user: dict = Depends(get_current_user)):
-    valid_statuses = ["pending_approval", "pending", "email_sent", "payment_pending", "activated", "cancelled", "declined"]
+    valid_statuses = list(STATUS_TRANSITIONS)
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
     
-    result = await db.activation_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Request not found")
+    if not await transition_request_status(request_id, status):
+        current = await current_request_status(request_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Request not found")
+        raise HTTPException(status_code=409, detail=f"Cannot change status from {current} to {status}")
+    await bump_collection_version("activation_requests")
     return {"message": "Status updated"}
 
+# ==================== BULK SUBMISSIONS ====================
+
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', '200'))
+BULK_EXCEL_MAX_BYTES = 5 * 1024 * 1024
+BULK_RENDER_CONCURRENCY = int(os.environ.get('BULK_RENDER_CONCURRENCY', '4'))
+
+def excel_cell_text(value) -> str:
+    if value is None:
+        return ""
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # mobile numbers typed as numbers
+    return str(value).strip()
+
+def read_bulk_excel(content: bytes) -> List[dict]:
+    """First-sheet rows keyed by header; headers are ActivationRequestCreate fields ("Plan ID" works too)"""
+    import openpyxl  # loaded on first use, like the plans upload
+    
+    try:
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Could not read the Excel file")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = [str(h or "").strip().lower().replace(" ", "_") for h in next(rows, ())]
+        return [
+            {header: excel_cell_text(value) for header, value in zip(headers, row) if header}
+            for row in rows
+            if any(value not in (None, "") for value in row)
+        ]
+    finally:
+        workbook.close()
+
+def bulk_row_errors(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in error.errors()]
+
+async def notify_bulk_submission(request_ids: List[str], base_url: str):
+    """One approval email for the whole batch; without digest mode nothing retries it later,
+    so a failed batch email falls back to one approval email per request"""
+    if await send_approval_digest(request_ids):
+        return
+    settings = await db.settings.find_one({"id": "main_settings"}, {"_id": 0})
+    if settings and settings.get('approval_digest_enabled'):
+        return
+    requests = await db.activation_requests.find(
+        {"id": {"$in": request_ids}, "status": "pending_approval", "approval_digest_id": None}, {"_id": 0}
+    ).sort("created_at", 1).to_list(None)
+    for req in requests:
+        if await send_approval_email(req, base_url):
+            await db.activation_requests.update_one({"id": req['id']}, {"$set": {"approval_notification": "email"}})
+
+async def submit_bulk(rows: List[dict], request: Request, background_tasks: BackgroundTasks) -> dict:
+    """Validate every row first, then insert the new ones in one insert_many with one approval email"""
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows to submit")
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ROWS} rows per submission")
+    
+    results = [None] * len(rows)
+    valid = []
+    await ensure_plan_catalog()
+    for index, row in enumerate(rows):
+        try:
+            data = ActivationRequestCreate.model_validate(row)
+        except ValidationError as e:
+            results[index] = {"row": index + 1, "status": "invalid", "errors": bulk_row_errors(e)}
+            continue
+        # Plan ID or part code, resolved against the in-process catalog
+        plan = plan_catalog.get(data.plan_id) or plan_catalog.find_by_part_code(data.plan_id) or await get_catalog_plan(data.plan_id)
+        if not plan:
+            results[index] = {"row": index + 1, "status": "invalid", "errors": ["plan_id: Invalid plan selected"]}
+            continue
+        valid.append((index, data, plan))
+    
+    if valid:
+        await enforce_submission_rate_limit(request, [data for _, data, _ in valid])
+    
+    # Repeats within the batch, then against earlier submissions (same claims as the single form)
+    first_in_batch = {}
+    candidates = []
+    for index, data, plan in valid:
+        serial_key = normalize_serial(data.serial_number)
+        request_obj = build_activation_request(data, plan)
+        if (serial_key, plan.id) in first_in_batch:
+            results[index] = {"row": index + 1, "status": "duplicate", "id": first_in_batch[(serial_key, plan.id)]}
+            continue
+        first_in_batch[(serial_key, plan.id)] = request_obj.id
+        candidates.append((index, request_obj, serial_key))
+    originals = await asyncio.gather(*(
+        claim_submission(submission_claims(None, serial_key, request_obj.plan_id), request_obj.id)
+        for _, request_obj, serial_key in candidates
+    ))
+    accepted = []
+    for (index, request_obj, serial_key), original_id in zip(candidates, originals):
+        if original_id:
+            results[index] = {"row": index + 1, "status": "duplicate", "id": original_id}
+        else:
+            accepted.append((index, request_obj, serial_key))
+    
+    near_duplicates = await asyncio.gather(*(find_near_duplicate(serial_key, request_obj.id) for _, request_obj, serial_key in accepted))
+    base_url = public_base_url(request)
+    docs = []
+    for (index, request_obj, serial_key), duplicate_of in zip(accepted, near_duplicates):
+        doc = request_obj.model_dump()
+        doc['serial_normalized'] = serial_key
+        doc['duplicate_of'] = duplicate_of
+        doc['approval_base_url'] = base_url
+        # In digest mode the next periodic digest picks these up if the batch email can't be sent
+        doc['approval_notification'] = "digest"
+        docs.append(doc)
+    
+    render_slots = asyncio.Semaphore(BULK_RENDER_CONCURRENCY)
+    
+    async def render_invoice(doc: dict):
+        async with render_slots:
+            doc['invoice_path'] = await generate_invoice_pdf(doc)
+    
+    try:
+        await asyncio.gather(*(render_invoice(doc) for doc in docs))
+        if docs:
+            await db.activation_requests.insert_many(docs, ordered=False)
+    except BaseException:
+        await asyncio.gather(*(release_submission(doc['id']) for doc in docs))
+        raise
+    
+    if docs:
+        await bump_collection_version("activation_requests")
+        for doc in docs:
+            live_updates.publish_local(created_event(doc))
+        background_tasks.add_task(notify_bulk_submission, [doc['id'] for doc in docs], base_url)
+        logger.info(f"Bulk submission: {len(docs)} request(s) created from {len(rows)} row(s)")
+    
+    for (index, _, _), doc in zip(accepted, docs):
+        results[index] = {"row": index + 1, "status": "created", "id": doc['id'], "duplicate_of": doc['duplicate_of']}
+    counts = Counter(result["status"] for result in results)
+    return {
+        "created": counts["created"],
+        "duplicates": counts["duplicate"],
+        "invalid": counts["invalid"],
+        "results": results,
+    }
+
+@api_router.post("/activation-requests/bulk")
+async def create_activation_requests_bulk(rows: List[dict], request: Request, background_tasks: BackgroundTasks):
+    """Public bulk submission: a JSON array of ActivationRequestCreate objects, with per-row results"""
+    return await submit_bulk(rows, request, background_tasks)
+
+@api_router.post("/activation-requests/bulk/excel")
+async def create_activation_requests_bulk_excel(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """Public bulk submission from an .xlsx sheet with one header per ActivationRequestCreate field"""
+    if not file.filename.endswith('.xlsx'):
+        raise HTTPException(status_code=400, detail="Only Excel files (.xlsx) are allowed")
+    content = await file.read(BULK_EXCEL_MAX_BYTES + 1)
+    if len(content) > BULK_EXCEL_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Excel file exceeds {BULK_EXCEL_MAX_BYTES // (1024 * 1024)}MB")
+    rows = await offload("cpu", read_bulk_excel, content)
+    return await submit_bulk(rows, request, background_tasks)
+
+# ==================== APPLE RECONCILIATION ====================
+
+RECONCILE_BATCH_SIZE = int(os.environ.get('RECONCILE_BATCH_SIZE', '500'))  # confirmation rows joined per query
+RECONCILE_SLA_DAYS = int(os.environ.get('RECONCILE_SLA_DAYS', '3'))
+RECONCILE_REPORT_LIMIT = 500  # serials / requests listed per report section (counts are always complete)
+WAITING_STATUSES = ("pending", "email_sent", "payment_pending")
+
+def iter_confirmation_rows(file, filename: str):
+    """(serial, part code or "") per row of Apple's confirmation sheet, read without loading it whole"""
+    if filename.lower().endswith('.csv'):
+        rows = csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+        workbook = None
+    else:
+        import openpyxl  # loaded on first use, like the plans upload
+        try:
+            workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Could not read the Excel file")
+        rows = workbook.active.iter_rows(values_only=True)
+    try:
+        headers = [excel_cell_text(h).lower() for h in next(rows, ())]
+        serial_col = next((i for i, h in enumerate(headers) if "serial" in h), None)
+        part_col = next((i for i, h in enumerate(headers) if "part" in h), None)
+        if serial_col is None:
+            raise HTTPException(status_code=400, detail="No serial number column found")
+        for row in rows:
+            serial = excel_cell_text(row[serial_col]) if serial_col < len(row) else ""
+            if serial:
+                part_code = excel_cell_text(row[part_col]) if part_col is not None and part_col < len(row) else ""
+                yield serial, part_code
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+def next_confirmation_batch(rows, size: int) -> list:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            break
+    return batch
+
+async def reconcile_batch(batch: list, report: dict, now: datetime):
+    """Hash-join one batch of confirmations against requests by normalized serial and activate the matches"""
+    confirmed = {}
+    for serial, part_code in batch:
+        confirmed.setdefault(normalize_serial(serial), (serial, set()))[1].add(normalize_plan_code(part_code) if part_code else None)
+    
+    by_serial = defaultdict(list)
+    async for doc in db.activation_requests.find(
+        {"serial_normalized": {"$in": list(confirmed)}},
+        {"_id": 0, "id": 1, "status": 1, "serial_normalized": 1, "plan_part_code": 1}
+    ):
+        by_serial[doc['serial_normalized']].append(doc)
+    
+    activatable = statuses_allowing("activated")
+    operations = []
+    events = []
+    for serial_key, (serial, part_codes) in confirmed.items():
+        requests = by_serial.get(serial_key, [])
+        if None not in part_codes:
+            # The sheet names the plan: only that plan's request is confirmed
+            requests = [req for req in requests if normalize_plan_code(req.get('plan_part_code')) in part_codes]
+        if not requests:
+            report["unknown_serials"] += 1
+            if len(report["unknown"]) < RECONCILE_REPORT_LIMIT:
+                report["unknown"].append(serial)
+            continue
+        for req in requests:
+            if req['status'] == "activated":
+                report["already_activated"] += 1
+            elif req['status'] in activatable:
+                operations.append(UpdateOne(
+                    {"id": req['id'], "status": {"$in": activatable}},
+                    {"$set": {"status": "activated", "activated_at": now, "updated_at": now}}
+                ))
+                events.append(status_event({**req, "status": "activated"}, req['status']))
+            else:
+                report["not_activatable"] += 1
+                if len(report["skipped"]) < RECONCILE_REPORT_LIMIT:
+                    report["skipped"].append({"id": req['id'], "serial_number": serial, "status": req['status']})
+    
+    if operations:
+        result = await db.activation_requests.bulk_write(operations, ordered=False)
+        report["matched"] += result.modified_count
+        # Rows an admin changed between the read and the write fail the status precondition
+        report["already_activated"] += len(operations) - result.modified_count
+        for event in events:
+            live_updates.publish_local(event)
+
+async def overdue_requests(now: datetime) -> dict:
+    """Requests still waiting for Apple (approved but not activated) past the SLA"""
+    query = {"status": {"$in": list(WAITING_STATUSES)}, "created_at": {"$lt": now - timedelta(days=RECONCILE_SLA_DAYS)}}
+    count = await db.activation_requests.count_documents(query)
+    docs = await db.activation_requests.find(
+        query, {"_id": 0, "id": 1, "serial_number": 1, "customer_name": 1, "status": 1, "created_at": 1}
+    ).sort("created_at", 1).limit(RECONCILE_REPORT_LIMIT).to_list(RECONCILE_REPORT_LIMIT)
+    for doc in docs:
+        doc['days_waiting'] = (now - doc['created_at']).days
+    return {"sla_days": RECONCILE_SLA_DAYS, "count": count, "requests": docs}
+
+@api_router.post("/activation-requests/reconcile")
+async def reconcile_apple_confirmations(file: UploadFile = File(...), user: dict = Depends(get_current_user)):
+    """Mark requests in Apple's confirmation sheet (.xlsx or .csv) as activated and report what didn't match"""
+    if not file.filename.lower().endswith(('.xlsx', '.csv')):
+        raise HTTPException(status_code=400, detail="Only .xlsx or .csv files are allowed")
+    
+    now = datetime.now(timezone.utc)
+    report = {
+        "rows": 0, "matched": 0, "already_activated": 0, "not_activatable": 0, "unknown_serials": 0,
+        "unknown": [], "skipped": [],
+    }
+    rows = iter_confirmation_rows(file.file, file.filename)
+    while True:
+        # Parsing is blocking file I/O, so each batch is read off the event loop
+        batch = await offload("cpu", next_confirmation_batch, rows, RECONCILE_BATCH_SIZE)
+        if not batch:
+            break
+        report["rows"] += len(batch)
+        await reconcile_batch(batch, report, now)
+    
+    if report["matched"]:
+        await bump_collection_version("activation_requests")
+    report["overdue"] = await overdue_requests(now)
+    logger.info(
+        f"Apple reconciliation by {user['email']}: {report['rows']} rows, {report['matched']} activated, "
+        f"{report['already_activated']} already activated, {report['unknown_serials']} unknown serials"
+    )
+    return FastJSONResponse(report)
+
 # ==================== APPROVAL WORKFLOW ENDPOINTS ====================
 
 @api_router.get("/activation-requests/{request_id}/approve-link")
 async def approve_via_link(request_id: str, token: str, background_tasks: BackgroundTasks):
     """Approve request via email link"""
     if not verify_approval_token(request_id, 'approve', token):
-        return HTMLResponse(content="""
-            <html>
-            <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: #dc3545;">Invalid or Expired Link</h1>
-                <p>This approval link is invalid or has already been used.</p>
-            </body>
-            </html>
-        """, status_code=400)
+        return render_link_notice(
+            "Invalid or Expired Link",
+            "This approval link is invalid or has already been used.",
+            status_code=400
+        )
     
-    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0})
+    req = await transition_request_status(request_id, "pending")
     if not req:
-        return HTMLResponse(content="""
-            <html>
-            <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: #dc3545;">Request Not Found</h1>
-                <p>The activation request was not found.</p>
-            </body>
-            </html>
-        """, status_code=404)
-    
-    if req.get('status') not in ['pending_approval', 'pending']:
-        return HTMLResponse(content=f"""
-            <html>
-            <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: #ffc107;">Already Processed</h1>
-                <p>This request has already been processed. Current status: <strong>{req.get('status')}</strong></p>
-            </body>
-            </html>
-        """, status_code=200)
-    
-    # Update status to pending (approved, ready for processing)
-    await db.activation_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": "pending", "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+        current = await current_request_status(request_id)
+        if current is None:
+            return render_link_notice("Request Not Found", "The activation request was not found.", status_code=404)
+        return render_link_notice(
+            "Already Processed",
+            "This request has already been processed.",
+            color="#ffc107",
+            status=current
+        )
+    await bump_collection_version("activation_requests")
     
     # Process the request (create TGME ticket and send email to Apple)
     background_tasks.add_task(process_activation_request, request_id)
     
-    return HTMLResponse(content=f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px; background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);">
-            <div style="background: white; padding: 40px; border-radius: 15px; box-shadow: 0 4px 20px rgba(0,0,0,0.1); max-width: 500px; margin: 0 auto;">
-                <div style="font-size: 60px; margin-bottom: 20px;">✅</div>
-                <h1 style="color: #28a745; margin-bottom: 15px;">Request Approved!</h1>
-                <p style="color: #666; margin-bottom: 20px;">The AppleCare+ activation request for <strong>{req.get('customer_name', '')}</strong> has been approved.</p>
-                <p style="color: #888; font-size: 14px;">A TGME ticket will be created and the activation email will be sent to Apple.</p>
-            </div>
-        </body>
-        </html>
-    """)
+    return render_link_result("approved", req.get('customer_name', ''))
 
 @api_router.get("/activation-requests/{request_id}/decline-link")
 async def decline_via_link(request_id: str, token: str):
     """Decline request via email link"""
     if not verify_approval_token(request_id, 'decline', token):
-        return HTMLResponse(content="""
-            <html>
-            <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: #dc3545;">Invalid or Expired Link</h1>
-                <p>This decline link is invalid or has already been used.</p>
-            </body>
-            </html>
-        """, status_code=400)
+        return render_link_notice(
+            "Invalid or Expired Link",
+            "This decline link is invalid or has already been used.",
+            status_code=400
+        )
     
-    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0})
+    req = await transition_request_status(request_id, "declined")
     if not req:
-        return HTMLResponse(content="""
-            <html>
-            <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: #dc3545;">Request Not Found</h1>
-                <p>The activation request was not found.</p>
-            </body>
-            </html>
-        """, status_code=404)
-    
-    if req.get('status') not in ['pending_approval', 'pending']:
-        return HTMLResponse(content=f"""
-            <html>
-            <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px;">
-                <h1 style="color: #ffc107;">Already Processed</h1>
-                <p>This request has already been processed. Current status: <strong>{req.get('status')}</strong></p>
-            </body>
-            </html>
-        """, status_code=200)
-    
-    # Update status to declined
-    await db.activation_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": "declined", "updated_at": datetime.now(timezone.utc).isoformat()}}
+        current = await current_request_status(request_id)
+        if current is None:
+            return render_link_notice("Request Not Found", "The activation request was not found.", status_code=404)
+        return render_link_notice(
+            "Already Processed",
+            "This request has already been processed.",
+            color="#ffc107",
+            status=current
+        )
+    await bump_collection_version("activation_requests")
+    
+    return render_link_result("declined", req.get('customer_name', ''))
+
+@api_router.get("/approval-digests/{digest_id}/approve-all")
+async def approve_digest_via_link(digest_id: str, token: str, background_tasks: BackgroundTasks):
+    """Approve every still-pending request in an approval digest with one update"""
+    if not verify_approval_token(digest_id, 'approve-all', token):
+        return render_link_notice(
+            "Invalid or Expired Link",
+            "This approval link is invalid or has already been used.",
+            status_code=400
+        )
+    
+    digest = await db.approval_digests.find_one({"id": digest_id}, {"_id": 0})
+    if not digest:
+        return render_link_notice("Digest Not Found", "This approval digest was not found.", status_code=404)
+    
+    # Tag the rows this click approved so we know which ones to process
+    batch_id = str(uuid.uuid4())
+    await db.activation_requests.update_many(
+        {"id": {"$in": digest["request_ids"]}, "status": {"$in": statuses_allowing("pending")}},
+        {"$set": {"status": "pending", "approval_batch_id": batch_id, "updated_at": datetime.now(timezone.utc)}}
     )
+    approved = await db.activation_requests.find({"approval_batch_id": batch_id}, {"_id": 0, "id": 1}).to_list(None)
+    if approved:
+        await bump_collection_version("activation_requests")
+    
+    for req in approved:
+        live_updates.publish_local(status_event({"id": req["id"], "status": "pending"}, "pending_approval"))
+        background_tasks.add_task(process_activation_request, req["id"])
     
-    return HTMLResponse(content=f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px; background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);">
-            <div style="background: white; padding: 40px; border-radius: 15px; box-shadow: 0 4px 20px rgba(0,0,0,0.1); max-width: 500px; margin: 0 auto;">
-                <div style="font-size: 60px; margin-bottom: 20px;">❌</div>
-                <h1 style="color: #dc3545; margin-bottom: 15px;">Request Declined</h1>
-                <p style="color: #666; margin-bottom: 20px;">The AppleCare+ activation request for <strong>{req.get('customer_name', '')}</strong> has been declined.</p>
-                <p style="color: #888; font-size: 14px;">No further action will be taken on this request.</p>
-            </div>
-        </body>
-        </html>
-    """)
+    total = len(digest["request_ids"])
+    return HTMLResponse(content=templates.render(
+        "digest_result.html",
+        approved=len(approved),
+        total=total,
+        skipped=total - len(approved)
+    ))
 
 @api_router.post("/activation-requests/{request_id}/approve")
 async def approve_request_dashboard(request_id: str, background_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
     """Approve request from dashboard"""
-    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0})
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
-    if req.get('status') not in ['pending_approval', 'pending']:
-        raise HTTPException(status_code=400, detail=f"Request cannot be approved. Current status: {req.get('status')}")
-    
-    # Update status to pending (approved, ready for processing)
-    await db.activation_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": "pending", "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    if not await transition_request_status(request_id, "pending"):
+        current = await current_request_status(request_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Request not found")
+        raise HTTPException(status_code=400, detail=f"Request cannot be approved. Current status: {current}")
+    await bump_collection_version("activation_requests")
     
     # Process the request (create TGME ticket and send email to Apple)
     background_tasks.add_task(process_activation_request, request_id)
@@ -1385,18 +3452,12 @@ async def approve_request_dashboard(request_id: str, background_tasks: Backgroun
 @api_router.post("/activation-requests/{request_id}/decline")
 async def decline_request_dashboard(request_id: str, user: dict = Depends(get_current_user)):
     """Decline request from dashboard"""
-    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0})
-    if not req:
-        raise HTTPException(status_code=404, detail="Request not found")
-    
-    if req.get('status') not in ['pending_approval', 'pending']:
-        raise HTTPException(status_code=400, detail=f"Request cannot be declined. Current status: {req.get('status')}")
-    
-    # Update status to declined
-    await db.activation_requests.update_one(
-        {"id": request_id},
-        {"$set": {"status": "declined", "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    if not await transition_request_status(request_id, "declined"):
+        current = await current_request_status(request_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Request not found")
+        raise HTTPException(status_code=400, detail=f"Request cannot be declined. Current status: {current}")
+    await bump_collection_version("activation_requests")
     
     return {"message": "Request declined"}
 
@@ -1411,54 +3472,387 @@ async def resend_email(request_id: str, background_tasks: BackgroundTasks, user:
     background_tasks.add_task(send_activation_email, req, req.get('invoice_path'), ticket_id)
     return {"message": "Email resend queued"}
 
-@api_router.get("/activation-requests/{request_id}/invoice")
-async def download_invoice(request_id: str, authorization: str = None):
-    # Accept token from query parameter for file downloads (browsers can't send headers for direct links)
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Authorization required")
-    
+# ==================== LIVE UPDATES ====================
+
+LIVE_EVENTS_URL_TTL = int(os.environ.get('LIVE_EVENTS_URL_TTL', '300'))  # only checked when a stream connects
+LIVE_EVENTS_BUFFER = int(os.environ.get('LIVE_EVENTS_BUFFER', '500'))  # recent events kept for Last-Event-ID replay
+LIVE_EVENTS_QUEUE = 100  # events a slow client may fall behind before it is disconnected
+LIVE_EVENTS_HEARTBEAT = 15.0
+
+# Fields a dashboard row needs - new requests are pushed with these so clients don't refetch the list
+LIVE_EVENT_FIELDS = (
+    "id", "status", "customer_name", "customer_email", "serial_number", "duplicate_of", "plan_name",
+    "plan_part_code", "dealer_name", "device_activation_date", "tgme_ticket_id", "osticket_id", "created_at",
+)
+
+def created_event(doc: dict) -> dict:
+    return {"type": "created", "request": {field: doc.get(field) for field in LIVE_EVENT_FIELDS}}
+
+def status_event(doc: dict, previous_status: Optional[str]) -> dict:
+    return {
+        "type": "status",
+        "id": doc.get('id'),
+        "status": doc.get('status'),
+        "previous_status": previous_status,  # None when unknown (change streams carry no pre-image)
+        "tgme_ticket_id": doc.get('tgme_ticket_id'),
+    }
+
+class RequestEventHub:
+    """Activation request changes from one upstream source, fanned out to every connected dashboard.
+
+    The source is a MongoDB change stream (one per worker, resumed by token after errors) so
+    changes made by any worker are seen. On a standalone mongod without change streams the
+    hub falls back to events published in-process by this worker's own writes.
+    """
+
+    def __init__(self, buffer_size: int = LIVE_EVENTS_BUFFER):
+        self.subscribers = set()
+        self.recent = deque(maxlen=buffer_size)  # (event id, encoded event)
+        self.mode = "local"
+        self.resume_token = None
+        self.sequence = 0
+        self.published = 0
+        self.disconnected = 0
+
+    def subscribe(self, last_event_id: Optional[str] = None):
+        """Register a client; returns its queue and the events it missed (None if too old to replay)"""
+        missed = []
+        if last_event_id:
+            ids = [event_id for event_id, _ in self.recent]
+            missed = list(self.recent)[ids.index(last_event_id) + 1:] if last_event_id in ids else None
+        queue = asyncio.Queue(maxsize=LIVE_EVENTS_QUEUE)
+        self.subscribers.add(queue)
+        return queue, missed
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event_id: str, event: dict):
+        data = dump_json(event).decode()
+        self.recent.append((event_id, data))
+        self.published += 1
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((event_id, data))
+            except asyncio.QueueFull:
+                # Stalled client: end its stream, it reconnects with Last-Event-ID and replays from the buffer
+                self.subscribers.discard(queue)
+                self.disconnected += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def publish_local(self, event: dict):
+        """Called after our own writes; ignored while the change stream is delivering them"""
+        if self.mode != "local":
+            return
+        self.sequence += 1
+        self.publish(f"{WORKER_ID}-{self.sequence}", event)
+
+    async def watch(self):
+        pipeline = [{"$match": {"$or": [
+            {"operationType": "insert"},
+            {"operationType": "update", "updateDescription.updatedFields.status": {"$exists": True}},
+        ]}}]
+        backoff = 1
+        while True:
+            try:
+                async with db.activation_requests.watch(pipeline, full_document="updateLookup", resume_after=self.resume_token) as stream:
+                    if self.mode != "change_stream":
+                        logger.info("Live updates: following activation_requests change stream")
+                    self.mode = "change_stream"
+                    backoff = 1
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        doc = change.get("fullDocument") or {}
+                        if change["operationType"] == "insert":
+                            event = created_event(doc)
+                        else:
+                            event = status_event({**doc, "status": change["updateDescription"]["updatedFields"]["status"]}, None)
+                        self.publish(self.resume_token["_data"], event)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == 40573:  # change streams need a replica set
+                    logger.info("Live updates: change streams unavailable, publishing this worker's writes only")
+                    self.mode = "local"
+                    return
+                if e.code == 286:  # resume token fell off the oplog - clients must resync
+                    self.resume_token = None
+                    self.publish(f"{WORKER_ID}-reset-{time.time_ns()}", {"type": "reset"})
+                logger.warning(f"Live updates: change stream failed ({e}), retrying in {backoff}s")
+            except Exception as e:
+                logger.warning(f"Live updates: change stream failed ({e}), retrying in {backoff}s")
+            # Our own writes still reach this worker's dashboards while the stream is down
+            self.mode = "local"
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def report(self) -> dict:
+        return {
+            "mode": self.mode,
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "buffered": len(self.recent),
+            "disconnected_slow_clients": self.disconnected,
+        }
+
+live_updates = RequestEventHub()
+
+def sign_live_events(user_id: str, expires: int) -> str:
+    return hmac.new(JWT_SECRET.encode(), f"live-events\n{user_id}\n{expires}".encode(), hashlib.sha256).hexdigest()
+
+async def live_event_stream(last_event_id: Optional[str]):
+    queue, missed = live_updates.subscribe(last_event_id)
     try:
-        token = authorization.replace("Bearer ", "")
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-    except InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        yield "retry: 3000\n\n"
+        if missed is None:
+            yield "event: reset\ndata: {}\n\n"
+        for event_id, data in missed or []:
+            yield f"id: {event_id}\ndata: {data}\n\n"
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), LIVE_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"  # keeps proxies from closing an idle stream
+                continue
+            if item is None:
+                return
+            event_id, data = item
+            yield f"id: {event_id}\ndata: {data}\n\n"
+    finally:
+        live_updates.unsubscribe(queue)
+
+@api_router.post("/activation-events-url")
+async def create_live_events_url(user: dict = Depends(get_current_user)):
+    """Signed URL for the event stream (EventSource can't send an Authorization header)"""
+    expires = int(time.time()) + LIVE_EVENTS_URL_TTL
+    query = urlencode({"user": user['id'], "expires": expires, "sig": sign_live_events(user['id'], expires)})
+    return {"url": f"/api/activation-events?{query}", "expires_at": datetime.fromtimestamp(expires, timezone.utc)}
+
+@api_router.get("/activation-events")
+async def stream_live_events(
+    user: str,
+    expires: int,
+    sig: str,
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Server-Sent Events: new requests and status changes as they happen"""
+    if expires < int(time.time()):
+        raise HTTPException(status_code=403, detail="Event stream link expired")
+    if not hmac.compare_digest(sig, sign_live_events(user, expires)):
+        raise HTTPException(status_code=403, detail="Invalid event stream link")
     
-    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0})
+    return StreamingResponse(
+        live_event_stream(last_event_id_header or last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/admin/live-updates-stats")
+async def get_live_updates_stats(user: dict = Depends(get_current_user)):
+    return live_updates.report()
+
+# ==================== INVOICE DOWNLOADS ====================
+
+INVOICE_URL_TTL = int(os.environ.get('INVOICE_URL_TTL', '300'))
+INVOICE_DOWNLOAD_MODE = os.environ.get('INVOICE_DOWNLOAD_MODE', 'stream')  # stream | accel (nginx X-Accel-Redirect)
+INVOICE_ACCEL_PREFIX = os.environ.get('INVOICE_ACCEL_PREFIX', '/protected-invoices/')
+
+def sign_invoice_download(key: str, filename: str, expires: int) -> str:
+    message = f"{key}\n{filename}\n{expires}".encode()
+    return hmac.new(JWT_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+def invoice_download_url(key: str, filename: str, ttl: int = INVOICE_URL_TTL) -> dict:
+    """Short-lived signed URL; the signature alone authorizes the download, no DB lookups"""
+    expires = int(time.time()) + ttl
+    query = urlencode({"filename": filename, "expires": expires, "sig": sign_invoice_download(key, filename, expires)})
+    return {"url": f"/api/invoice-files/{key}?{query}", "expires_at": datetime.fromtimestamp(expires, timezone.utc)}
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """Single 'bytes=' range as (start, end) inclusive; None means send the whole file"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1  # suffix range: the last N bytes
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+@api_router.post("/activation-requests/{request_id}/invoice-url")
+async def create_invoice_url(request_id: str, user: dict = Depends(get_current_user)):
+    req = await db.activation_requests.find_one({"id": request_id}, {"_id": 0, "invoice_path": 1})
     if not req or not req.get('invoice_path'):
         raise HTTPException(status_code=404, detail="Invoice not found")
+    if not await invoice_exists(req['invoice_path']):
+        raise HTTPException(status_code=404, detail="Invoice file not found")
+    
+    key = req['invoice_path']
+    if not is_storage_key(key):
+        # Not migrated yet: move this one into storage now so it can be served by key
+        stored = await store_invoice_stream(iter_invoice(key))
+        key = stored['key']
+        result = await db.activation_requests.update_one(
+            {"id": request_id, "invoice_path": req['invoice_path']},
+            {"$set": {
+                "invoice_path": key,
+                "invoice_sha256": stored['sha256'],
+                "invoice_size": stored['size'],
+                "updated_at": datetime.now(timezone.utc)
+            }}
+        )
+        if result.modified_count:
+            # invoice_path is part of the request, so cached lists and sync clients need to see the new key
+            await bump_collection_version("activation_requests")
+    return invoice_download_url(key, f"invoice_{request_id}.pdf")
+
+@api_router.get("/invoice-files/{key:path}")
+async def download_invoice_file(key: str, request: Request, filename: str, expires: int, sig: str):
+    remaining = expires - int(time.time())
+    if remaining <= 0:
+        raise HTTPException(status_code=403, detail="Download link expired")
+    if not hmac.compare_digest(sig, sign_invoice_download(key, filename, expires)):
+        raise HTTPException(status_code=403, detail="Invalid download signature")
     
-    if not os.path.exists(req['invoice_path']):
+    # Keys are content-addressed, so the hash in the key is a strong ETag
+    etag = f'"{Path(key).stem}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={remaining}",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    
+    if INVOICE_DOWNLOAD_MODE == "accel" and isinstance(invoice_storage, LocalStorage):
+        # nginx serves the bytes (sendfile, Range) from an internal location mapped to STORAGE_ROOT
+        headers["X-Accel-Redirect"] = f"{INVOICE_ACCEL_PREFIX}{key}"
+        return Response(media_type="application/pdf", headers=headers)
+    
+    if not await invoice_storage.exists(key):
         raise HTTPException(status_code=404, detail="Invoice file not found")
+    size = await invoice_storage.size(key)
+    
+    # If-Range with a different validator means the client's partial copy is stale: send it all
+    if_range = request.headers.get("if-range")
+    byte_range = parse_byte_range(request.headers.get("range"), size) if not if_range or if_range == etag else None
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(invoice_storage.iter_chunks(key), media_type="application/pdf", headers=headers)
     
-    return FileResponse(
-        req['invoice_path'],
-        media_type='application/pdf',
-        filename=f"invoice_{request_id}.pdf"
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        invoice_storage.iter_chunks(key, start=start, length=end - start + 1),
+        status_code=206,
+        media_type="application/pdf",
+        headers=headers
     )
 
 # ==================== FILE UPLOAD ====================
 
+INVOICE_UPLOAD_MAX_BYTES = int(os.environ.get('INVOICE_UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MULTIPART_OVERHEAD = 64 * 1024  # Boundaries and part headers on top of the file itself
+
+# Upload routes (path prefix) and the most request body each may send, multipart overhead included
+UPLOAD_BODY_LIMITS = [
+    ("/api/upload-invoice/", INVOICE_UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD, "Invoice file too large"),
+    ("/api/plans/upload", BULK_EXCEL_MAX_BYTES + MULTIPART_OVERHEAD, "Excel file too large"),
+    ("/api/activation-requests/bulk/excel", BULK_EXCEL_MAX_BYTES + MULTIPART_OVERHEAD, "Excel file too large"),
+]
+
+class RequestBodyTooLarge(Exception):
+    pass
+
+class UploadSizeLimitMiddleware:
+    """Reject oversized uploads: up front from Content-Length, and while the body streams in for chunked requests"""
+
+    def __init__(self, app, limits=UPLOAD_BODY_LIMITS):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = next((entry for entry in self.limits if scope["type"] == "http" and scope["path"].startswith(entry[0])), None)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        _, max_bytes, detail = limit
+        too_large = JSONResponse(status_code=413, content={"detail": detail})
+        length = Headers(scope=scope).get("content-length", "")
+        if length.isdigit() and int(length) > max_bytes:
+            await too_large(scope, receive, send)
+            return
+        
+        received = 0
+        exceeded = False
+        started = False
+        
+        async def counting_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise RequestBodyTooLarge()
+            return message
+        
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return  # The app's reply to a cut-off body (e.g. a form parse error) is replaced by the 413
+            started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, counting_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await too_large(scope, receive, send)
+
+async def read_upload_chunks(file: UploadFile):
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
 @api_router.post("/upload-invoice/{request_id}")
 async def upload_invoice(request_id: str, file: UploadFile = File(...), user: dict = Depends(get_current_user)):
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files allowed")
     
-    filename = f"uploaded_invoice_{request_id}.pdf"
-    filepath = UPLOAD_DIR / filename
-    
-    async with aiofiles.open(filepath, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    stored = await store_invoice_stream(read_upload_chunks(file), INVOICE_UPLOAD_MAX_BYTES)
     
+    # invoice_updated_at is what invalidates cached activation emails on every worker
+    now = datetime.now(timezone.utc)
     await db.activation_requests.update_one(
         {"id": request_id},
-        {"$set": {"invoice_path": str(filepath), "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {
+            "invoice_path": stored['key'],
+            "invoice_sha256": stored['sha256'],
+            "invoice_size": stored['size'],
+            "invoice_updated_at": now,
+            "updated_at": now
+        }}
     )
+    outbound_messages.invalidate(request_id)
+    await bump_collection_version("activation_requests")
     
-    return {"message": "Invoice uploaded", "path": str(filepath)}
+    return {"message": "Invoice uploaded", **stored}
 
 # ==================== DASHBOARD STATS ====================
 
@@ -1480,15 +3874,339 @@ async def get_stats(user: dict = Depends(get_current_user)):
         "declined": declined
     }
 
+_utc_offset_re = re.compile(r"^[+-]\d{2}(:?\d{2})?$")
+
+def valid_timezone(tz: str) -> bool:
+    """An Olson name or UTC offset that $dateTrunc accepts; anything else would fail the aggregation"""
+    if _utc_offset_re.match(tz):
+        return True
+    try:
+        ZoneInfo(tz)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+@api_router.get("/stats/timeline")
+async def get_stats_timeline(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    unit: str = Query("day", pattern="^(day|week|month)$"),
+    tz: str = "UTC",
+    user: dict = Depends(get_current_user)
+):
+    """Request counts per day/week/month and status over a date range (default: last 30 days)"""
+    if not valid_timezone(tz):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=30)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    
+    pipeline = [
+        {"$match": {"created_at": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {
+                "period": {"$dateTrunc": {"date": "$created_at", "unit": unit, "timezone": tz}},
+                "status": "$status"
+            },
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id.period": 1}}
+    ]
+    
+    periods = OrderedDict()
+    async for row in db.activation_requests.aggregate(pipeline):
+        period = periods.setdefault(row["_id"]["period"], {"period": row["_id"]["period"], "total": 0, "by_status": {}})
+        period["total"] += row["count"]
+        period["by_status"][row["_id"]["status"]] = row["count"]
+    
+    return FastJSONResponse({"start": start, "end": end, "unit": unit, "timezone": tz, "periods": list(periods.values())})
+
+# ==================== TIMESTAMP MIGRATION ====================
+
+# Fields that used to be stored as ISO strings and are now native BSON dates
+TIMESTAMP_FIELDS = {
+    "users": ("created_at",),
+    "plans": ("created_at",),
+    "activation_requests": ("created_at", "updated_at"),
+    "settings": ("updated_at",),
+}
+MIGRATION_BATCH_SIZE = 500
+MIGRATION_BATCH_PAUSE = 0.05  # seconds between batches so the migration doesn't starve live traffic
+
+def parse_stored_timestamp(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+async def migrate_timestamps(batch_size: int = MIGRATION_BATCH_SIZE) -> dict:
+    """Convert string timestamps to BSON dates in batches; safe to run while serving and to re-run.
+
+    Each update is conditional on the field still holding the string we read, so a concurrent
+    write (which now stores a date) is never overwritten.
+    """
+    converted = {}
+    for collection_name, fields in TIMESTAMP_FIELDS.items():
+        collection = db[collection_name]
+        count = 0
+        for field in fields:
+            unparseable = []
+            while True:
+                query = {field: {"$type": "string"}}
+                if unparseable:
+                    query["_id"] = {"$nin": unparseable}
+                batch = await collection.find(query, {"_id": 1, field: 1}).limit(batch_size).to_list(batch_size)
+                if not batch:
+                    break
+                operations = []
+                for doc in batch:
+                    parsed = parse_stored_timestamp(doc[field])
+                    if parsed is None:
+                        unparseable.append(doc["_id"])
+                        continue
+                    operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: parsed}}))
+                if operations:
+                    result = await collection.bulk_write(operations, ordered=False)
+                    count += result.modified_count
+                await asyncio.sleep(MIGRATION_BATCH_PAUSE)
+            if unparseable:
+                logger.warning(f"Timestamp migration: {len(unparseable)} unparseable {collection_name}.{field} values left as-is")
+        converted[collection_name] = count
+        if count and collection_name != "users":
+            await bump_collection_version(collection_name)
+    logger.info(f"Timestamp migration finished: {converted}")
+    return converted
+
+@api_router.post("/admin/migrate-timestamps")
+async def run_timestamp_migration(user: dict = Depends(get_current_user)):
+    """Run (or re-run) the string -> date timestamp migration and report converted counts"""
+    converted = await migrate_timestamps()
+    return {"message": "Timestamp migration completed", "converted": converted}
+
+# ==================== SERIAL KEY BACKFILL ====================
+
+async def backfill_serial_keys(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """Add serial_normalized to requests created before duplicate detection"""
+    updated = 0
+    while True:
+        batch = await db.activation_requests.find(
+            {"serial_normalized": {"$exists": False}}, {"_id": 1, "serial_number": 1}
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        result = await db.activation_requests.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"serial_normalized": normalize_serial(doc.get("serial_number") or "")}})
+            for doc in batch
+        ], ordered=False)
+        updated += result.modified_count
+        await asyncio.sleep(MIGRATION_BATCH_PAUSE)
+    return updated
+
+# ==================== INVOICE STORAGE MIGRATION ====================
+
+def locate_legacy_invoice(path: str) -> Optional[str]:
+    """Absolute paths from another host still resolve if the file was copied into a legacy directory"""
+    if os.path.exists(path):
+        return path
+    for directory in (INVOICE_DIR, UPLOAD_DIR):
+        candidate = directory / os.path.basename(path)
+        if candidate.exists():
+            return str(candidate)
+    return None
+
+async def migrate_invoice_paths(batch_size: int = MIGRATION_BATCH_SIZE) -> dict:
+    """Copy legacy invoice files into invoice storage and rewrite invoice_path to the storage key.
+
+    Updates are conditional on invoice_path still holding the old path, so a concurrent
+    upload is never overwritten. Files that can't be found are left for a later run.
+    """
+    migrated = 0
+    missing = []
+    while True:
+        query = {"invoice_path": {"$regex": "^/"}}
+        if missing:
+            query["_id"] = {"$nin": missing}
+        batch = await db.activation_requests.find(query, {"_id": 1, "invoice_path": 1}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        operations = []
+        for doc in batch:
+            path = await offload("io", locate_legacy_invoice, doc["invoice_path"])
+            if path is None:
+                missing.append(doc["_id"])
+                continue
+            try:
+                stored = await store_invoice_stream(iter_invoice(path))
+            except HTTPException as e:
+                logger.warning(f"Invoice migration: skipping {path}: {e.detail}")
+                missing.append(doc["_id"])
+                continue
+            operations.append(UpdateOne(
+                {"_id": doc["_id"], "invoice_path": doc["invoice_path"]},
+                {"$set": {
+                    "invoice_path": stored['key'],
+                    "invoice_sha256": stored['sha256'],
+                    "invoice_size": stored['size'],
+                    "updated_at": datetime.now(timezone.utc)
+                }}
+            ))
+        if operations:
+            result = await db.activation_requests.bulk_write(operations, ordered=False)
+            migrated += result.modified_count
+            # Per batch, so delta sync and cached lists pick up the new keys while a long migration runs
+            if result.modified_count:
+                await bump_collection_version("activation_requests")
+        await asyncio.sleep(MIGRATION_BATCH_PAUSE)
+    if missing:
+        logger.warning(f"Invoice migration: {len(missing)} invoice files not found, left as-is")
+    logger.info(f"Invoice migration finished: {migrated} migrated")
+    return {"migrated": migrated, "missing": len(missing)}
+
+@api_router.post("/admin/migrate-invoices")
+async def run_invoice_migration(user: dict = Depends(get_current_user)):
+    """Run (or re-run) the legacy invoice path -> storage key migration"""
+    result = await migrate_invoice_paths()
+    return {"message": "Invoice migration completed", **result}
+
+# ==================== TEMPLATE STATS ====================
+
+@api_router.get("/admin/template-stats")
+async def get_template_stats(user: dict = Depends(get_current_user)):
+    """Render counts and timings per template since this worker started"""
+    return templates.report()
+
+# ==================== OFFLOAD STATS ====================
+
+@api_router.get("/admin/offload-stats")
+async def get_offload_stats(user: dict = Depends(get_current_user)):
+    """Queue depth and wait / run times per offload pool, plus blocking calls caught on the loop in debug mode"""
+    return {
+        "debug": OFFLOAD_DEBUG,
+        "pools": {name: pool.report() for name, pool in offload_pools.items()},
+        "blocking_calls_on_loop": dict(blocking_call_counts),
+    }
+
+# ==================== LOAD SHEDDING ====================
+
+SHED_LOOP_LAG_MS = float(os.environ.get('SHED_LOOP_LAG_MS', '250'))  # event-loop lag that counts as overloaded
+SHED_MAX_INFLIGHT = int(os.environ.get('SHED_MAX_INFLIGHT', '200'))  # total in-flight requests that counts as overloaded
+SHED_LOW_MAX_INFLIGHT = int(os.environ.get('SHED_LOW_MAX_INFLIGHT', '8'))  # concurrent low-priority requests allowed at all
+SHED_BATCH_MAX_INFLIGHT = int(os.environ.get('SHED_BATCH_MAX_INFLIGHT', '4'))  # concurrent exports / bulk imports allowed at all
+LAG_SAMPLE_INTERVAL = 0.1
+
+# Never shed: health/readiness and the approval actions admins are waiting on
+CRITICAL_ROUTES = re.compile(r"^/api/(health|ready)$|^/api/activation-requests/[^/]+/(approve|decline)(-link)?$|^/api/approval-digests/[^/]+/approve-all$")
+# Shed first: expensive work that can be retried later
+LOW_PRIORITY_ROUTES = re.compile(r"^/api/stats(/.*)?$|^/api/plans/(upload|sample)$|^/api/admin/migrate-")
+# Also shed first, but with their own cap: exports stream for minutes and bulk imports run long,
+# so they mustn't use up the low-priority slots public submissions need
+BATCH_ROUTES = re.compile(r"^/api/activation-requests/(export|bulk(/excel)?|reconcile)$")
+
+# Long-lived streams: never shed, and not counted as in-flight load
+STREAM_ROUTES = re.compile(r"^/api/activation-events$")
+
+def route_class(method: str, path: str) -> str:
+    if STREAM_ROUTES.search(path):
+        return "stream"
+    if CRITICAL_ROUTES.search(path):
+        return "critical"
+    if BATCH_ROUTES.search(path):
+        return "batch"
+    if LOW_PRIORITY_ROUTES.search(path) or (method == "POST" and path == "/api/activation-requests"):
+        return "low"
+    return "normal"
+
+class LoadMonitor:
+    """Event-loop lag (sampled by a background task) and in-flight requests per route class"""
+
+    def __init__(self):
+        self.lag = 0.0  # seconds; jumps up immediately, decays slowly
+        self.inflight = Counter()
+        self.shed = Counter()
+
+    async def run(self, interval: float = LAG_SAMPLE_INTERVAL):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - start - interval)
+            self.lag = lag if lag > self.lag else self.lag * 0.9 + lag * 0.1
+
+    def overloaded(self) -> bool:
+        busy = sum(count for cls, count in self.inflight.items() if cls != "stream")
+        return self.lag * 1000 > SHED_LOOP_LAG_MS or busy >= SHED_MAX_INFLIGHT
+
+    def should_shed(self, cls: str) -> bool:
+        caps = {"low": SHED_LOW_MAX_INFLIGHT, "batch": SHED_BATCH_MAX_INFLIGHT}
+        return cls in caps and (self.inflight[cls] >= caps[cls] or self.overloaded())
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.lag * 10))
+
+    def report(self) -> dict:
+        return {
+            "loop_lag_ms": round(self.lag * 1000, 1),
+            "inflight": {cls: count for cls, count in self.inflight.items() if count},
+            "shed": dict(self.shed),
+            "overloaded": self.overloaded(),
+        }
+
+load_monitor = LoadMonitor()
+
+class LoadShedMiddleware:
+    """Answer low-priority requests with 503 + Retry-After while the worker is overloaded"""
+
+    def __init__(self, app, monitor: LoadMonitor = load_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cls = route_class(scope["method"], scope["path"])
+        if self.monitor.should_shed(cls):
+            self.monitor.shed[cls] += 1
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": "Server busy, please retry shortly"},
+                headers={"Retry-After": str(self.monitor.retry_after())}
+            )
+            await response(scope, receive, send)
+            return
+        self.monitor.inflight[cls] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.inflight[cls] -= 1
+
 # ==================== HEALTH CHECK ====================
 
 @api_router.get("/health")
 async def health():
     return {"status": "healthy", "service": "applecare-activation"}
 
+@api_router.get("/ready")
+async def ready():
+    """Readiness for the load balancer: 503 while this worker is overloaded so traffic goes elsewhere"""
+    report = load_monitor.report()
+    if report["overloaded"]:
+        return JSONResponse(status_code=503, content={"status": "overloaded", **report},
+                            headers={"Retry-After": str(load_monitor.retry_after())})
+    return {"status": "ready", **report}
+
 # Include router
 app.include_router(api_router)
 
+# Added before CORS so that 304 responses still carry CORS headers
+app.add_middleware(HTTPCacheMiddleware)
+app.add_middleware(UploadSizeLimitMiddleware)
+app.add_middleware(LoadShedMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1497,33 +4215,153 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.on_event("startup")
-async def startup():
-    # Create default admin if not exists
-    admin = await db.users.find_one({"email": "ck@motta.in"})
-    if not admin:
-        await db.users.insert_one({
+# Strong references to fire-and-forget startup jobs so they aren't garbage collected mid-run
+background_jobs = set()
+
+def start_background_job(coro):
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+# ==================== STARTUP ====================
+
+STARTUP_LEADER_LEASE = timedelta(minutes=5)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+async def acquire_startup_leadership() -> bool:
+    """One worker per deployment runs seeding, indexes and migrations; the lease covers a crashed leader"""
+    # The unique key is what makes the insert a lock, so it has to exist before anyone tries it
+    await db.startup_locks.create_index("id", unique=True)
+    now = datetime.now(timezone.utc)
+    lease = {"holder": WORKER_ID, "expires_at": now + STARTUP_LEADER_LEASE}
+    try:
+        await db.startup_locks.insert_one({"id": "startup", **lease})
+        return True
+    except DuplicateKeyError:
+        pass
+    taken_over = await db.startup_locks.find_one_and_update(
+        {"id": "startup", "expires_at": {"$lte": now}},
+        {"$set": lease}
+    )
+    return taken_over is not None
+
+async def release_startup_leadership():
+    await db.startup_locks.delete_one({"id": "startup", "holder": WORKER_ID})
+
+async def wait_for_startup_leader(poll: float = 0.5):
+    """Followers start serving once the leader has seeded, so nobody loads an empty plan catalog"""
+    deadline = time.monotonic() + STARTUP_LEADER_LEASE.total_seconds()
+    while time.monotonic() < deadline:
+        if not await db.startup_locks.find_one({"id": "startup", "expires_at": {"$gt": datetime.now(timezone.utc)}}):
+            return
+        await asyncio.sleep(poll)
+    logger.warning("Startup leader did not finish within its lease; continuing")
+
+async def ensure_indexes():
+    # Unique keys that make seeding safe to repeat
+    try:
+        await db.users.create_index("email", unique=True)
+    except OperationFailure as e:
+        logger.warning(f"users.email unique index not created (duplicate emails exist?): {e}")
+    
+    # Indexes for sorting and date-range queries on native dates
+    await db.activation_requests.create_index([("created_at", -1)])
+    await db.activation_requests.create_index([("status", 1), ("created_at", -1)])
+    await db.activation_requests.create_index([("plan_id", 1), ("created_at", -1)])
+    await db.activation_requests.create_index([("updated_at", 1), ("id", 1)])
+    await db.activation_requests.create_index("approval_digest_id", sparse=True)
+    await db.activation_requests.create_index("approval_batch_id", sparse=True)
+    await db.activation_requests.create_index("apple_batch_id", sparse=True)
+    await db.scheduled_jobs.create_index("id", unique=True)
+    await db.activation_requests.create_index("serial_normalized")
+    await db.submission_keys.create_index("key", unique=True)
+    await db.submission_keys.create_index("expires_at", expireAfterSeconds=0)
+    await db.rate_limits.create_index("key", unique=True)
+    await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+
+async def seed_defaults():
+    # Create default admin if not exists; upsert so concurrent starts can't create two
+    result = await db.users.update_one(
+        {"email": "ck@motta.in"},
+        {"$setOnInsert": {
             "id": str(uuid.uuid4()),
             "email": "ck@motta.in",
             "name": "Admin",
-            "password": hash_password("Charu@123@"),
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
+            "password": await hash_password("Charu@123@"),
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    if result.upserted_id is not None:
         logger.info("Admin user created")
+    # Self-registered accounts get no role; only the seeded admin is exempt from submission rate limits
+    await db.users.update_one({"email": "ck@motta.in", "role": {"$exists": False}}, {"$set": {"role": "admin"}})
     
     # Create some default plans if none exist
     plans_count = await db.plans.count_documents({})
     if plans_count == 0:
         default_plans = [
-            {"id": str(uuid.uuid4()), "name": "AppleCare+", "part_code": "SR182HN/A", "description": "Standard AppleCare+ Protection", "active": True, "created_at": datetime.now(timezone.utc).isoformat()},
-            {"id": str(uuid.uuid4()), "name": "AppleCare+ with Theft and Loss", "part_code": "SR183HN/A", "description": "AppleCare+ with Theft and Loss coverage", "active": True, "created_at": datetime.now(timezone.utc).isoformat()},
-            {"id": str(uuid.uuid4()), "name": "AppleCare+ for Mac", "part_code": "SR184HN/A", "description": "AppleCare+ for Mac computers", "active": True, "created_at": datetime.now(timezone.utc).isoformat()},
-            {"id": str(uuid.uuid4()), "name": "AppleCare+ for iPad", "part_code": "SR185HN/A", "description": "AppleCare+ for iPad devices", "active": True, "created_at": datetime.now(timezone.utc).isoformat()},
-            {"id": str(uuid.uuid4()), "name": "AppleCare+ for Apple Watch", "part_code": "SR186HN/A", "description": "AppleCare+ for Apple Watch", "active": True, "created_at": datetime.now(timezone.utc).isoformat()},
+            {"name": "AppleCare+", "part_code": "SR182HN/A", "description": "Standard AppleCare+ Protection"},
+            {"name": "AppleCare+ with Theft and Loss", "part_code": "SR183HN/A", "description": "AppleCare+ with Theft and Loss coverage"},
+            {"name": "AppleCare+ for Mac", "part_code": "SR184HN/A", "description": "AppleCare+ for Mac computers"},
+            {"name": "AppleCare+ for iPad", "part_code": "SR185HN/A", "description": "AppleCare+ for iPad devices"},
+            {"name": "AppleCare+ for Apple Watch", "part_code": "SR186HN/A", "description": "AppleCare+ for Apple Watch"},
         ]
-        await db.plans.insert_many(default_plans)
+        for plan in default_plans:
+            await db.plans.update_one(
+                {"part_code": plan["part_code"]},
+                {"$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    **plan,
+                    **plan_classification_fields(plan["name"], plan["description"]),
+                    "active": True,
+                    "created_at": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+        await bump_collection_version("plans")
         logger.info("Default AppleCare+ plans created")
 
+@app.on_event("startup")
+async def startup():
+    if OFFLOAD_DEBUG:
+        enable_offload_debug()
+    connect_db()
+    
+    # Compile outbound message templates once
+    templates.load()
+    
+    if await acquire_startup_leadership():
+        try:
+            await ensure_indexes()
+            await seed_defaults()
+            # Classify any plans created before (or under older) PRODUCT_RULES
+            await reclassify_plans(only_stale=True)
+        finally:
+            await release_startup_leadership()
+        
+        # Convert legacy data in the background; reads handle both until they finish
+        start_background_job(migrate_timestamps())
+        start_background_job(migrate_invoice_paths())
+        start_background_job(backfill_serial_keys())
+    else:
+        await wait_for_startup_leader()
+    
+    # Per worker: event-loop lag sampling, and the periodic loops (each run is claimed by one worker)
+    start_background_job(load_monitor.run())
+    start_background_job(live_updates.watch())
+    start_background_job(approval_digest_loop())
+    start_background_job(apple_batch_loop())
+    
+    # Warm the plan catalog / typeahead index so the first request doesn't pay for the load
+    await reload_plan_catalog()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    for job in list(background_jobs):
+        job.cancel()
+    for pool in offload_pools.values():
+        pool.executor.shutdown(wait=False, cancel_futures=True)
+    if client is not None:
+        client.close()
@@ -0,0 +1,85 @@
+"""
+AppleCare+ Activation System - Bulk Submission Tests
+Tests for: JSON and Excel bulk submission, per-row results, in-batch duplicates, row limits
+"""
+import pytest
+import requests
+import os
+import io
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+FIELDS = ["dealer_name", "dealer_mobile", "dealer_email", "customer_name", "customer_mobile",
+          "customer_email", "model_id", "serial_number", "plan_id", "device_activation_date"]
+
+
+@pytest.fixture(scope="module")
+def plan_id():
+    plans = requests.get(f"{BASE_URL}/api/plans").json()
+    if not plans:
+        pytest.skip("No plans available")
+    return plans[0]["id"]
+
+
+def bulk_row(plan_id, serial_number, **overrides):
+    return {
+        "dealer_name": "TEST_Bulk_Dealer",
+        "dealer_mobile": "9876543216",
+        "dealer_email": "test_bulk_dealer@test.com",
+        "customer_name": "TEST_Bulk_Customer",
+        "customer_mobile": "9123456789",
+        "customer_email": "test_bulk_customer@test.com",
+        "model_id": "iPhone 15 Pro",
+        "serial_number": serial_number,
+        "plan_id": plan_id,
+        "device_activation_date": "2026-01-15",
+        **overrides
+    }
+
+
+class TestBulkSubmission:
+    """POST /api/activation-requests/bulk and /bulk/excel"""
+
+    def test_json_bulk_with_per_row_results(self, plan_id):
+        """Valid rows are created; repeats and invalid rows are reported per row"""
+        serial = f"TEST_BULK_{uuid.uuid4().hex[:8]}"
+        rows = [
+            bulk_row(plan_id, serial),
+            bulk_row(plan_id, f"{serial}_2"),
+            bulk_row(plan_id, serial.lower()),
+            bulk_row(plan_id, f"{serial}_3", customer_email="not-an-email"),
+        ]
+        response = requests.post(f"{BASE_URL}/api/activation-requests/bulk", json=rows)
+        assert response.status_code == 200
+        data = response.json()
+        assert (data["created"], data["duplicates"], data["invalid"]) == (2, 1, 1)
+        statuses = [result["status"] for result in data["results"]]
+        assert statuses == ["created", "created", "duplicate", "invalid"]
+        assert data["results"][2]["id"] == data["results"][0]["id"]
+        print("SUCCESS: Bulk submission returned per-row results")
+
+    def test_excel_bulk(self, plan_id):
+        """An .xlsx sheet with field-name headers is accepted"""
+        openpyxl = pytest.importorskip("openpyxl")
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(FIELDS)
+        row = bulk_row(plan_id, f"TEST_BULK_XL_{uuid.uuid4().hex[:8]}")
+        sheet.append([row[field] for field in FIELDS])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        response = requests.post(
+            f"{BASE_URL}/api/activation-requests/bulk/excel",
+            files={"file": ("bulk.xlsx", buffer.getvalue())}
+        )
+        assert response.status_code == 200
+        assert response.json()["created"] == 1
+        print("SUCCESS: Excel bulk submission created the request")
+
+    def test_empty_and_oversized_batches_rejected(self, plan_id):
+        assert requests.post(f"{BASE_URL}/api/activation-requests/bulk", json=[]).status_code == 400
+        too_many = [bulk_row(plan_id, f"TEST_BULK_MAX_{i}") for i in range(201)]
+        assert requests.post(f"{BASE_URL}/api/activation-requests/bulk", json=too_many).status_code == 400
+        print("SUCCESS: Empty and oversized batches rejected")
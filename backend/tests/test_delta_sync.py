@@ -0,0 +1,102 @@
+"""
+AppleCare+ Activation System - Delta Sync Tests
+Tests for: GET /api/activation-requests/changes paging, idle tokens, deltas after updates
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def legacy_request():
+    """A request stored before the timestamp migration, with a string updated_at"""
+    pymongo = pytest.importorskip("pymongo")
+    if not os.environ.get('MONGO_URL') or not os.environ.get('DB_NAME'):
+        pytest.skip("MONGO_URL / DB_NAME not set")
+    client = pymongo.MongoClient(os.environ['MONGO_URL'], serverSelectionTimeoutMS=2000)
+    collection = client[os.environ['DB_NAME']].activation_requests
+    request_id = f"TEST_LEGACY_{uuid.uuid4().hex[:8]}"
+    collection.insert_one({
+        "id": request_id,
+        "status": "pending_approval",
+        "serial_number": request_id,
+        "created_at": "2024-01-01T00:00:00",
+        "updated_at": "not a timestamp",
+    })
+    yield request_id
+    collection.delete_one({"id": request_id})
+    client.close()
+
+
+def full_sync(auth_headers, page_size=50):
+    """Page through every request; returns (rows by id, final token)"""
+    rows, token = {}, None
+    while True:
+        params = {"limit": page_size, **({"since": token} if token else {})}
+        response = requests.get(f"{BASE_URL}/api/activation-requests/changes", params=params, headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        rows.update({row["id"]: row for row in data["changes"]})
+        token = data["token"]
+        if not data["has_more"]:
+            return rows, token
+
+
+class TestDeltaSync:
+    """GET /api/activation-requests/changes"""
+
+    def test_requires_auth(self):
+        response = requests.get(f"{BASE_URL}/api/activation-requests/changes")
+        assert response.status_code == 401
+        print("SUCCESS: changes endpoint requires auth")
+
+    def test_invalid_token_rejected(self, auth_headers):
+        response = requests.get(f"{BASE_URL}/api/activation-requests/changes?since=not-a-token", headers=auth_headers)
+        assert response.status_code == 400
+        print("SUCCESS: Invalid sync token rejected")
+
+    def test_delta_contains_updated_request(self, auth_headers):
+        """After a full sync, only the request changed since is returned with its new status"""
+        plans = requests.get(f"{BASE_URL}/api/plans").json()
+        created = requests.post(f"{BASE_URL}/api/activation-requests", json={
+            "dealer_name": "TEST_Sync_Dealer",
+            "dealer_mobile": "9876543217",
+            "dealer_email": "test_sync_dealer@test.com",
+            "customer_name": "TEST_Sync_Customer",
+            "customer_mobile": "9123456789",
+            "customer_email": "test_sync_customer@test.com",
+            "model_id": "iPhone 15 Pro",
+            "serial_number": f"TEST_SYNC_{uuid.uuid4().hex[:8]}",
+            "plan_id": plans[0]["id"],
+            "device_activation_date": "2026-01-15"
+        }).json()
+
+        rows, token = full_sync(auth_headers)
+        assert created["id"] in rows
+
+        requests.post(f"{BASE_URL}/api/activation-requests/{created['id']}/decline", headers=auth_headers)
+        response = requests.get(f"{BASE_URL}/api/activation-requests/changes", params={"since": token}, headers=auth_headers)
+        changes = {row["id"]: row for row in response.json()["changes"]}
+        assert changes[created["id"]]["status"] == "declined"
+        print(f"SUCCESS: Delta returned {len(changes)} of {len(rows)} requests")
+
+    def test_string_updated_at_does_not_break_sync(self, auth_headers, legacy_request):
+        """Unmigrated string timestamps are skipped instead of failing the sync"""
+        rows, _ = full_sync(auth_headers, page_size=1)
+        assert legacy_request not in rows
+        print(f"SUCCESS: Full sync of {len(rows)} requests skipped the legacy row")
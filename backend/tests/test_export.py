@@ -0,0 +1,89 @@
+"""
+AppleCare+ Activation System - Export Tests
+Tests for: streamed CSV / NDJSON / XLSX export of activation requests with filters
+"""
+import pytest
+import requests
+import os
+import io
+import csv
+import json
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestExport:
+    """GET /api/activation-requests/export"""
+
+    def test_export_requires_auth(self):
+        response = requests.get(f"{BASE_URL}/api/activation-requests/export")
+        assert response.status_code == 401
+        print("SUCCESS: Export requires auth")
+
+    def test_csv_export(self, auth_headers):
+        """CSV has a header row and one row per request"""
+        response = requests.get(f"{BASE_URL}/api/activation-requests/export?format=csv", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["Content-Type"].startswith("text/csv")
+        assert "attachment" in response.headers["Content-Disposition"]
+        rows = list(csv.reader(io.StringIO(response.text)))
+        assert rows[0][:4] == ["id", "created_at", "updated_at", "status"]
+        print(f"SUCCESS: CSV export with {len(rows) - 1} rows")
+
+    def test_csv_guards_formulas_but_not_phone_numbers(self, auth_headers):
+        """Formula-like text is prefixed with a quote; +91 phone numbers are exported untouched"""
+        plans = requests.get(f"{BASE_URL}/api/plans").json()
+        requests.post(f"{BASE_URL}/api/activation-requests", json={
+            "dealer_name": "=HYPERLINK(\"http://example.com\")",
+            "dealer_mobile": "+91 98765-43210",
+            "dealer_email": "test_export_dealer@test.com",
+            "customer_name": "TEST_Export_Customer",
+            "customer_mobile": "+919123456789",
+            "customer_email": "test_export_customer@test.com",
+            "model_id": "iPhone 15 Pro",
+            "serial_number": f"TEST_EXPORT_{uuid.uuid4().hex[:8]}",
+            "plan_id": plans[0]["id"],
+            "device_activation_date": "2026-01-15"
+        })
+        response = requests.get(f"{BASE_URL}/api/activation-requests/export?format=csv", headers=auth_headers)
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        row = next(row for row in rows if row.get("customer_mobile") == "+919123456789")
+        assert row["dealer_mobile"] == "+91 98765-43210"
+        assert row["dealer_name"].startswith("'=")
+        print("SUCCESS: Formulas guarded, phone numbers kept")
+
+    def test_ndjson_export_with_status_filter(self, auth_headers):
+        """Filters apply to the streamed rows"""
+        response = requests.get(
+            f"{BASE_URL}/api/activation-requests/export?format=ndjson&status=declined",
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines() if line]
+        assert all(row["status"] == "declined" for row in rows)
+        print(f"SUCCESS: NDJSON export with {len(rows)} declined rows")
+
+    def test_xlsx_export(self, auth_headers):
+        """XLSX export is a zip-based workbook"""
+        response = requests.get(f"{BASE_URL}/api/activation-requests/export?format=xlsx", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.content[:2] == b"PK"
+        print("SUCCESS: XLSX export returned a workbook")
+
+    def test_invalid_format_and_dates(self, auth_headers):
+        assert requests.get(f"{BASE_URL}/api/activation-requests/export?format=pdf", headers=auth_headers).status_code == 400
+        assert requests.get(f"{BASE_URL}/api/activation-requests/export?date_from=yesterday", headers=auth_headers).status_code == 400
+        print("SUCCESS: Invalid export parameters rejected")
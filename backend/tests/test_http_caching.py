@@ -0,0 +1,95 @@
+"""
+AppleCare+ Activation System - HTTP Caching Tests
+Tests for: ETag / If-None-Match on read endpoints, Cache-Control, JSON compression
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class TestPlansConditionalGet:
+    """Public plans endpoint caching"""
+
+    def test_plans_returns_etag_and_cache_control(self):
+        """GET /api/plans should carry a strong ETag and a public Cache-Control"""
+        response = requests.get(f"{BASE_URL}/api/plans?public=true")
+        assert response.status_code == 200
+        etag = response.headers.get("ETag")
+        assert etag and etag.startswith('"') and not etag.startswith("W/")
+        assert "public" in response.headers.get("Cache-Control", "")
+        print(f"SUCCESS: Plans ETag {etag}")
+
+    def test_plans_if_none_match_returns_304(self):
+        """Repeating the request with the ETag should return 304 with no body"""
+        first = requests.get(f"{BASE_URL}/api/plans?public=true")
+        etag = first.headers["ETag"]
+        second = requests.get(f"{BASE_URL}/api/plans?public=true", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers.get("ETag") == etag
+        print("SUCCESS: Plans revalidation returned 304")
+
+    def test_plans_etag_changes_after_write(self, auth_headers):
+        """Creating a plan must invalidate the plans ETag"""
+        etag = requests.get(f"{BASE_URL}/api/plans?active_only=false").headers["ETag"]
+        create = requests.post(f"{BASE_URL}/api/plans", json={
+            "name": "TEST_Cache_Plan",
+            "part_code": "TEST_CACHE_PC",
+            "sku": "TEST_CACHE_SKU",
+            "description": "TEST cache invalidation plan"
+        }, headers=auth_headers)
+        assert create.status_code == 200
+        plan_id = create.json()["id"]
+
+        response = requests.get(f"{BASE_URL}/api/plans?active_only=false", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+        requests.delete(f"{BASE_URL}/api/plans/{plan_id}", headers=auth_headers)
+        print("SUCCESS: Plans ETag invalidated by write")
+
+    def test_plans_gzip_encoding(self):
+        """Large JSON bodies should be compressed when the client accepts gzip"""
+        response = requests.get(f"{BASE_URL}/api/plans?active_only=false", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        if len(response.content) >= 1024:
+            assert response.headers.get("Content-Encoding") == "gzip"
+        assert "Accept-Encoding" in response.headers.get("Vary", "")
+        print(f"SUCCESS: Plans encoding {response.headers.get('Content-Encoding')}")
+
+
+class TestPrivateConditionalGet:
+    """Authenticated dashboard endpoints caching"""
+
+    @pytest.mark.parametrize("path", ["/api/activation-requests", "/api/stats", "/api/settings"])
+    def test_private_endpoint_304(self, path, auth_headers):
+        """Dashboard reads should revalidate to 304 for the same token"""
+        first = requests.get(f"{BASE_URL}{path}", headers=auth_headers)
+        assert first.status_code == 200
+        assert "private" in first.headers.get("Cache-Control", "")
+        etag = first.headers["ETag"]
+
+        second = requests.get(f"{BASE_URL}{path}", headers={**auth_headers, "If-None-Match": etag})
+        assert second.status_code == 304
+        print(f"SUCCESS: {path} revalidation returned 304")
+
+    def test_private_etag_requires_token(self, auth_headers):
+        """A private ETag must not produce a 304 without the matching token"""
+        etag = requests.get(f"{BASE_URL}/api/stats", headers=auth_headers).headers["ETag"]
+        response = requests.get(f"{BASE_URL}/api/stats", headers={"If-None-Match": etag})
+        assert response.status_code == 401
+        print("SUCCESS: Private ETag bound to token")
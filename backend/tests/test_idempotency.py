@@ -0,0 +1,84 @@
+"""
+AppleCare+ Activation System - Idempotent Submission Tests
+Tests for: Idempotency-Key replay, duplicate (serial, plan) window, near-duplicate flag
+"""
+import pytest
+import requests
+import os
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def plan_ids():
+    """Two active plans"""
+    plans = requests.get(f"{BASE_URL}/api/plans").json()
+    if len(plans) < 2:
+        pytest.skip("Need at least two plans")
+    return plans[0]["id"], plans[1]["id"]
+
+
+def request_payload(serial_number, plan_id):
+    return {
+        "dealer_name": "TEST_Idem_Dealer",
+        "dealer_mobile": "9876543210",
+        "dealer_email": "test_idem_dealer@test.com",
+        "customer_name": "TEST_Idem_Customer",
+        "customer_mobile": "9123456789",
+        "customer_email": "test_idem_customer@test.com",
+        "model_id": "iPhone 15 Pro",
+        "serial_number": serial_number,
+        "plan_id": plan_id,
+        "device_activation_date": "2026-01-15"
+    }
+
+
+class TestIdempotentSubmission:
+    """POST /api/activation-requests duplicate handling"""
+
+    def test_idempotency_key_replays_original(self, plan_ids):
+        """The same Idempotency-Key should return the original request"""
+        key = str(uuid.uuid4())
+        payload = request_payload(f"TEST_IDEM_{uuid.uuid4().hex[:8]}", plan_ids[0])
+        first = requests.post(f"{BASE_URL}/api/activation-requests", json=payload, headers={"Idempotency-Key": key})
+        second = requests.post(f"{BASE_URL}/api/activation-requests", json=payload, headers={"Idempotency-Key": key})
+        assert first.status_code == 200 and second.status_code == 200
+        assert second.json()["id"] == first.json()["id"]
+        assert second.headers.get("Idempotent-Replayed") == "true"
+        print("SUCCESS: Idempotency-Key replayed original request")
+
+    def test_replay_omits_contact_details(self, plan_ids):
+        """A duplicate submission must not echo the original customer's details"""
+        serial = f"TEST_PII_{uuid.uuid4().hex[:8]}"
+        requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(serial, plan_ids[0]))
+        second = requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(serial, plan_ids[0]))
+        assert second.status_code == 200
+        assert set(second.json()) <= {"id", "status", "created_at", "duplicate_of"}
+        print("SUCCESS: Replay returned only a receipt")
+
+    def test_idempotency_key_reused_for_other_payload(self, plan_ids):
+        """Reusing an Idempotency-Key with a different body is rejected"""
+        key = str(uuid.uuid4())
+        first = requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(f"TEST_IDEM_{uuid.uuid4().hex[:8]}", plan_ids[0]), headers={"Idempotency-Key": key})
+        second = requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(f"TEST_IDEM_{uuid.uuid4().hex[:8]}", plan_ids[0]), headers={"Idempotency-Key": key})
+        assert first.status_code == 200
+        assert second.status_code == 422
+        print("SUCCESS: Reused Idempotency-Key rejected")
+
+    def test_duplicate_serial_and_plan_returns_original(self, plan_ids):
+        """Same serial (differently formatted) and plan within the window should not create a new request"""
+        serial = f"TEST-DUP-{uuid.uuid4().hex[:8]}"
+        first = requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(serial, plan_ids[0]))
+        second = requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(serial.lower().replace("-", " "), plan_ids[0]))
+        assert second.json()["id"] == first.json()["id"]
+        print("SUCCESS: Duplicate submission returned original request")
+
+    def test_same_serial_other_plan_is_flagged(self, plan_ids):
+        """A different plan for the same serial is created but flagged as a possible duplicate"""
+        serial = f"TEST_NEAR_{uuid.uuid4().hex[:8]}"
+        first = requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(serial, plan_ids[0]))
+        second = requests.post(f"{BASE_URL}/api/activation-requests", json=request_payload(serial, plan_ids[1]))
+        assert second.json()["id"] != first.json()["id"]
+        assert second.json()["duplicate_of"] == first.json()["id"]
+        print("SUCCESS: Near-duplicate flagged")
@@ -0,0 +1,145 @@
+"""
+AppleCare+ Activation System - Invoice Upload Tests
+Tests for: streamed invoice upload, PDF validation, SHA-256 dedupe, signed downloads with Range/ETag
+"""
+import pytest
+import requests
+import os
+import hashlib
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+SAMPLE_PDF = b"%PDF-1.4\n% TEST invoice upload\n" + os.urandom(256 * 1024)
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def request_id():
+    """Create an activation request to attach invoices to"""
+    plans = requests.get(f"{BASE_URL}/api/plans").json()
+    if not plans:
+        pytest.skip("No plans available")
+    response = requests.post(f"{BASE_URL}/api/activation-requests", json={
+        "dealer_name": "TEST_Upload_Dealer",
+        "dealer_mobile": "9876543210",
+        "dealer_email": "test_upload_dealer@test.com",
+        "customer_name": "TEST_Upload_Customer",
+        "customer_mobile": "9123456789",
+        "customer_email": "test_upload_customer@test.com",
+        "model_id": "iPhone 15 Pro",
+        "serial_number": "TEST_UPLOAD_001",
+        "plan_id": plans[0]["id"],
+        "device_activation_date": "2026-01-15"
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+class TestInvoiceUpload:
+    """POST /api/upload-invoice/{request_id}"""
+
+    def test_upload_returns_hash_and_size(self, auth_headers, request_id):
+        """Upload should report the SHA-256 and byte size of the stored file"""
+        response = requests.post(
+            f"{BASE_URL}/api/upload-invoice/{request_id}",
+            files={"file": ("invoice.pdf", SAMPLE_PDF, "application/pdf")},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["sha256"] == hashlib.sha256(SAMPLE_PDF).hexdigest()
+        assert data["size"] == len(SAMPLE_PDF)
+        print(f"SUCCESS: Invoice stored as {data['sha256'][:12]}")
+
+    def test_reupload_is_deduplicated(self, auth_headers, request_id):
+        """Uploading identical content again should reuse the stored file"""
+        response = requests.post(
+            f"{BASE_URL}/api/upload-invoice/{request_id}",
+            files={"file": ("copy.pdf", SAMPLE_PDF, "application/pdf")},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+        assert response.json()["deduplicated"] is True
+        print("SUCCESS: Identical upload deduplicated")
+
+    def test_rejects_non_pdf_content(self, auth_headers, request_id):
+        """A .pdf filename without PDF magic bytes should be rejected"""
+        response = requests.post(
+            f"{BASE_URL}/api/upload-invoice/{request_id}",
+            files={"file": ("fake.pdf", b"not really a pdf", "application/pdf")},
+            headers=auth_headers
+        )
+        assert response.status_code == 400
+        print("SUCCESS: Non-PDF content rejected")
+
+    def test_chunked_upload_over_limit_rejected(self, auth_headers, request_id):
+        """Without a Content-Length the size cap is enforced while the body streams in"""
+        boundary = "TESTBOUNDARY"
+
+        def body():
+            yield f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="big.pdf"\r\n\r\n'.encode()
+            yield SAMPLE_PDF[:1024]
+            for _ in range(22 * 4):
+                yield b"0" * (256 * 1024)
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        response = requests.post(
+            f"{BASE_URL}/api/upload-invoice/{request_id}",
+            data=body(),
+            headers={**auth_headers, "Content-Type": f"multipart/form-data; boundary={boundary}"}
+        )
+        assert response.status_code == 413
+        print("SUCCESS: Chunked oversized upload rejected")
+
+
+class TestSignedInvoiceDownload:
+    """POST /api/activation-requests/{id}/invoice-url and GET /api/invoice-files/..."""
+
+    @pytest.fixture(scope="class")
+    def download_url(self, auth_headers, request_id):
+        response = requests.post(f"{BASE_URL}/api/activation-requests/{request_id}/invoice-url", headers=auth_headers)
+        assert response.status_code == 200
+        return f"{BASE_URL}{response.json()['url']}"
+
+    def test_invoice_url_requires_auth(self, request_id):
+        """Signed URLs are only issued to logged-in users"""
+        response = requests.post(f"{BASE_URL}/api/activation-requests/{request_id}/invoice-url")
+        assert response.status_code == 401
+        print("SUCCESS: invoice-url requires auth")
+
+    def test_signed_download_with_etag(self, download_url):
+        """The signed URL serves the PDF with a strong ETag and revalidates to 304"""
+        response = requests.get(download_url)
+        assert response.status_code == 200
+        assert response.content.startswith(b"%PDF")
+        etag = response.headers["ETag"]
+        assert not etag.startswith("W/")
+
+        cached = requests.get(download_url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        print("SUCCESS: Signed download with ETag revalidation")
+
+    def test_range_request(self, download_url):
+        """A byte range returns 206 with Content-Range"""
+        response = requests.get(download_url, headers={"Range": "bytes=0-3"})
+        assert response.status_code == 206
+        assert response.content == b"%PDF"
+        assert response.headers["Content-Range"].startswith("bytes 0-3/")
+        print("SUCCESS: Range request returned 206")
+
+    def test_tampered_signature_rejected(self, download_url):
+        """Changing any signed parameter invalidates the URL"""
+        response = requests.get(download_url.replace("filename=invoice_", "filename=other_"))
+        assert response.status_code == 403
+        print("SUCCESS: Tampered download URL rejected")
@@ -0,0 +1,103 @@
+"""
+AppleCare+ Activation System - Live Update Stream Tests
+Tests for: signed SSE URL, created/status events, Last-Event-ID replay
+"""
+import pytest
+import requests
+import os
+import json
+import uuid
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def events_url(auth_headers):
+    response = requests.post(f"{BASE_URL}/api/activation-events-url", headers=auth_headers)
+    assert response.status_code == 200
+    return f"{BASE_URL}{response.json()['url']}"
+
+
+def read_events(stream, wanted):
+    """Collect (id, event) pairs from an open SSE response until wanted(event) matches"""
+    events, event_id = [], None
+    for line in stream.iter_lines(decode_unicode=True):
+        if line.startswith("id: "):
+            event_id = line[4:]
+        elif line.startswith("data: "):
+            event = json.loads(line[6:])
+            events.append((event_id, event))
+            if wanted(event):
+                return events
+    return events
+
+
+def create_request():
+    plans = requests.get(f"{BASE_URL}/api/plans").json()
+    response = requests.post(f"{BASE_URL}/api/activation-requests", json={
+        "dealer_name": "TEST_Live_Dealer",
+        "dealer_mobile": "9876543218",
+        "dealer_email": "test_live_dealer@test.com",
+        "customer_name": "TEST_Live_Customer",
+        "customer_mobile": "9123456789",
+        "customer_email": "test_live_customer@test.com",
+        "model_id": "iPhone 15 Pro",
+        "serial_number": f"TEST_LIVE_{uuid.uuid4().hex[:8]}",
+        "plan_id": plans[0]["id"],
+        "device_activation_date": "2026-01-15"
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+class TestLiveUpdates:
+    """POST /api/activation-events-url and GET /api/activation-events"""
+
+    def test_events_url_requires_auth(self):
+        """Stream URLs are only signed for logged-in users"""
+        response = requests.post(f"{BASE_URL}/api/activation-events-url")
+        assert response.status_code == 401
+        print("SUCCESS: activation-events-url requires auth")
+
+    def test_tampered_url_rejected(self, auth_headers):
+        """A modified signature is refused before the stream opens"""
+        response = requests.get(events_url(auth_headers).replace("sig=", "sig=0"))
+        assert response.status_code == 403
+        print("SUCCESS: Tampered stream URL rejected")
+
+    def test_created_and_status_events(self, auth_headers):
+        """New requests and approvals are pushed to an open stream"""
+        with requests.get(events_url(auth_headers), stream=True, timeout=30) as stream:
+            assert stream.headers["Content-Type"].startswith("text/event-stream")
+            request_id = create_request()
+            requests.post(f"{BASE_URL}/api/activation-requests/{request_id}/approve", headers=auth_headers)
+            events = read_events(stream, lambda e: e.get("type") == "status" and e.get("id") == request_id)
+
+        created = [e for _, e in events if e["type"] == "created" and e["request"]["id"] == request_id]
+        assert created and created[0]["request"]["status"] == "pending_approval"
+        assert events[-1][1]["status"] == "pending"
+        print("SUCCESS: Created and status events received")
+
+    def test_resume_with_last_event_id(self, auth_headers):
+        """Reconnecting with Last-Event-ID replays the events missed in between"""
+        with requests.get(events_url(auth_headers), stream=True, timeout=30) as stream:
+            first_id = create_request()
+            events = read_events(stream, lambda e: e.get("type") == "created" and e["request"]["id"] == first_id)
+        last_event_id = events[-1][0]
+
+        missed_id = create_request()
+        with requests.get(events_url(auth_headers), headers={"Last-Event-ID": last_event_id}, stream=True, timeout=30) as stream:
+            replayed = read_events(stream, lambda e: e.get("type") == "created" and e["request"]["id"] == missed_id)
+        assert replayed[-1][1]["request"]["id"] == missed_id
+        print("SUCCESS: Missed events replayed after reconnect")
@@ -0,0 +1,59 @@
+"""
+AppleCare+ Activation System - Blocking Call Offload Tests
+Tests for: GET /api/admin/offload-stats pool metrics, bcrypt and Excel work on the offload pools
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def offload_stats(auth_headers):
+    response = requests.get(f"{BASE_URL}/api/admin/offload-stats", headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+class TestOffload:
+    """GET /api/admin/offload-stats"""
+
+    def test_stats_require_auth(self):
+        response = requests.get(f"{BASE_URL}/api/admin/offload-stats")
+        assert response.status_code == 401
+        print("SUCCESS: offload-stats requires auth")
+
+    def test_named_pools_reported(self, auth_headers):
+        pools = offload_stats(auth_headers)["pools"]
+        assert set(pools) == {"cpu", "io", "crypto"}
+        for stats in pools.values():
+            assert stats["workers"] >= 1
+            assert {"queue_depth", "max_queue_depth", "avg_wait_ms", "max_wait_ms", "completed"} <= set(stats)
+        print("SUCCESS: cpu, io and crypto pools reported")
+
+    def test_login_runs_on_crypto_pool(self, auth_headers):
+        """Password checks are counted on the crypto pool"""
+        before = offload_stats(auth_headers)["pools"]["crypto"]["completed"]
+        requests.post(f"{BASE_URL}/api/auth/login", json={"email": "ck@motta.in", "password": "wrong-password"})
+        after = offload_stats(auth_headers)["pools"]["crypto"]["completed"]
+        assert after > before
+        print("SUCCESS: bcrypt ran on the crypto pool")
+
+    def test_sample_excel_runs_on_cpu_pool(self, auth_headers):
+        before = offload_stats(auth_headers)["pools"]["cpu"]["completed"]
+        response = requests.get(f"{BASE_URL}/api/plans/sample", headers=auth_headers)
+        assert response.status_code == 200
+        assert offload_stats(auth_headers)["pools"]["cpu"]["completed"] > before
+        print("SUCCESS: Sample workbook built on the cpu pool")
@@ -0,0 +1,85 @@
+"""
+AppleCare+ Activation System - Plan Search Tests
+Tests for: GET /api/plans/search typeahead endpoint and incremental index updates
+"""
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def search_plan(auth_headers):
+    """Create a plan with distinctive codes for search tests"""
+    response = requests.post(f"{BASE_URL}/api/plans", json={
+        "name": "TEST Search Plan Zephyrtron",
+        "part_code": "ZQ901HN/A",
+        "sku": "ZQ902ZM/A",
+        "description": "AppleCare+ for Zephyrtron search test",
+        "mrp": 9900
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    plan = response.json()
+    yield plan
+    requests.delete(f"{BASE_URL}/api/plans/{plan['id']}", headers=auth_headers)
+
+
+class TestPlanSearch:
+    """Typeahead plan search"""
+
+    def test_search_is_public(self):
+        """Search must work without authentication"""
+        response = requests.get(f"{BASE_URL}/api/plans/search?q=apple")
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+        print("SUCCESS: Plan search is public")
+
+    def test_search_by_name_prefix(self, search_plan):
+        """A name prefix should find a newly created plan without a restart"""
+        response = requests.get(f"{BASE_URL}/api/plans/search?q=zephyr")
+        assert response.status_code == 200
+        ids = [p["id"] for p in response.json()]
+        assert search_plan["id"] in ids
+        print("SUCCESS: Found plan by name prefix")
+
+    def test_search_by_sku_without_separator(self, search_plan):
+        """SKU typed without the slash should still match"""
+        response = requests.get(f"{BASE_URL}/api/plans/search?q=zq902zma")
+        assert response.status_code == 200
+        results = response.json()
+        assert results and results[0]["id"] == search_plan["id"]
+        print("SUCCESS: Found plan by compact SKU")
+
+    def test_search_respects_limit(self):
+        """limit caps the number of results"""
+        response = requests.get(f"{BASE_URL}/api/plans/search?q=a&limit=2")
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        print("SUCCESS: Search limit respected")
+
+    def test_search_excludes_deactivated_plan(self, auth_headers):
+        """Deactivated plans must drop out of the index"""
+        create = requests.post(f"{BASE_URL}/api/plans", json={
+            "name": "TEST Search Plan Quokkatron",
+            "sku": "QK100ZM/A",
+            "description": "Temporary search plan"
+        }, headers=auth_headers)
+        plan_id = create.json()["id"]
+        requests.delete(f"{BASE_URL}/api/plans/{plan_id}", headers=auth_headers)
+
+        response = requests.get(f"{BASE_URL}/api/plans/search?q=quokkatron")
+        assert plan_id not in [p["id"] for p in response.json()]
+        print("SUCCESS: Deactivated plan removed from search")
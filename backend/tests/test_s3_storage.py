@@ -0,0 +1,103 @@
+"""
+AppleCare+ Activation System - S3 Invoice Storage Tests
+Tests for: S3Storage put / exists / dedupe / ranged streaming against an S3 stand-in
+(an in-memory stub client, and moto when it is installed) - no server or bucket needed
+"""
+import pytest
+import asyncio
+import io
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+# server needs these to import but storage never connects to MongoDB; restored so other modules
+# don't mistake them for a configured database
+_saved_env = {name: os.environ.get(name) for name in ('MONGO_URL', 'DB_NAME')}
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+
+import server  # noqa: E402
+
+for _name, _value in _saved_env.items():
+    if _value is None:
+        os.environ.pop(_name)
+from botocore.exceptions import ClientError  # noqa: E402
+
+PDF = b"%PDF-1.4\n" + b"0123456789" * 100
+
+
+class StubS3Client:
+    """In-memory stand-in for the boto3 calls S3Storage makes"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
+
+    def upload_file(self, filename, bucket, key, ExtraArgs=None):
+        self.uploads += 1
+        self.objects[(bucket, key)] = Path(filename).read_bytes()
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[(Bucket, Key)]
+        if Range:
+            first, _, last = Range[len("bytes="):].partition("-")
+            data = data[int(first):int(last) + 1] if last else data[int(first):]
+        return {"Body": io.BytesIO(data)}
+
+
+@pytest.fixture(params=["stub", "moto"])
+def s3_storage(request, monkeypatch):
+    """S3Storage wired in as the invoice storage, backed by the stub or by moto"""
+    if request.param == "moto":
+        moto = pytest.importorskip("moto")
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+        with moto.mock_aws():
+            storage = server.S3Storage(bucket="invoices", prefix="test", region="us-east-1")
+            storage.client.create_bucket(Bucket="invoices")
+            monkeypatch.setattr(server, "invoice_storage", storage)
+            yield storage
+    else:
+        # Creating a boto3 client needs neither credentials nor network
+        storage = server.S3Storage(bucket="invoices", prefix="test", region="us-east-1")
+        storage.client = StubS3Client()
+        monkeypatch.setattr(server, "invoice_storage", storage)
+        yield storage
+
+
+async def read_all(storage, key, **kwargs):
+    return b"".join([chunk async for chunk in storage.iter_chunks(key, chunk_size=100, **kwargs)])
+
+
+class TestS3Storage:
+    """S3Storage behind store_invoice_bytes / iter_chunks"""
+
+    def test_put_and_exists(self, s3_storage):
+        stored = asyncio.run(server.store_invoice_bytes(PDF))
+        assert stored["size"] == len(PDF) and not stored["deduplicated"]
+        assert asyncio.run(s3_storage.exists(stored["key"]))
+        assert asyncio.run(s3_storage.size(stored["key"])) == len(PDF)
+        assert not asyncio.run(s3_storage.exists("invoices/00/00/missing.pdf"))
+        print("SUCCESS: Invoice stored under its content key")
+
+    def test_same_bytes_are_deduplicated(self, s3_storage):
+        first = asyncio.run(server.store_invoice_bytes(PDF + b"dedupe"))
+        second = asyncio.run(server.store_invoice_bytes(PDF + b"dedupe"))
+        assert second["key"] == first["key"]
+        assert second["deduplicated"]
+        if isinstance(s3_storage.client, StubS3Client):
+            assert s3_storage.client.uploads == 1
+        print("SUCCESS: Identical invoice not uploaded twice")
+
+    def test_stream_whole_and_range(self, s3_storage):
+        key = asyncio.run(server.store_invoice_bytes(PDF + b"stream"))["key"]
+        assert asyncio.run(read_all(s3_storage, key)) == PDF + b"stream"
+        assert asyncio.run(read_all(s3_storage, key, start=5, length=20)) == (PDF + b"stream")[5:25]
+        assert asyncio.run(read_all(s3_storage, key, start=len(PDF))) == b"stream"
+        print("SUCCESS: Whole and ranged reads streamed")
@@ -0,0 +1,81 @@
+"""
+AppleCare+ Activation System - Status Transition Tests
+Tests for: single-winner approve/decline under concurrent clicks, transition table on manual status changes
+"""
+import pytest
+import requests
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    """Get authentication headers"""
+    response = requests.post(f"{BASE_URL}/api/auth/login", json={
+        "email": "ck@motta.in",
+        "password": "Charu@123@"
+    })
+    if response.status_code != 200:
+        pytest.skip("Authentication failed")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def request_id():
+    """A fresh request in pending_approval"""
+    plans = requests.get(f"{BASE_URL}/api/plans").json()
+    if not plans:
+        pytest.skip("No plans available")
+    response = requests.post(f"{BASE_URL}/api/activation-requests", json={
+        "dealer_name": "TEST_Transition_Dealer",
+        "dealer_mobile": "9876543219",
+        "dealer_email": "test_transition_dealer@test.com",
+        "customer_name": "TEST_Transition_Customer",
+        "customer_mobile": "9123456789",
+        "customer_email": "test_transition_customer@test.com",
+        "model_id": "iPhone 15 Pro",
+        "serial_number": f"TEST_TRANSITION_{uuid.uuid4().hex[:8]}",
+        "plan_id": plans[0]["id"],
+        "device_activation_date": "2026-01-15"
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+class TestStatusTransitions:
+    """Approve/decline and PUT /api/activation-requests/{id}/status"""
+
+    def test_concurrent_approvals_have_one_winner(self, auth_headers, request_id):
+        """Simultaneous approve clicks should approve (and process) the request once"""
+        url = f"{BASE_URL}/api/activation-requests/{request_id}/approve"
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            codes = list(pool.map(lambda _: requests.post(url, headers=auth_headers).status_code, range(5)))
+        assert codes.count(200) == 1
+        assert codes.count(400) == 4
+        print("SUCCESS: Exactly one concurrent approval won")
+
+    def test_approve_then_decline_is_refused(self, auth_headers, request_id):
+        """Approving twice or declining a declined request is refused"""
+        decline = requests.post(f"{BASE_URL}/api/activation-requests/{request_id}/decline", headers=auth_headers)
+        assert decline.status_code == 200
+        again = requests.post(f"{BASE_URL}/api/activation-requests/{request_id}/decline", headers=auth_headers)
+        assert again.status_code == 400
+        assert "declined" in again.json()["detail"]
+        print("SUCCESS: Second decline refused")
+
+    def test_backwards_status_change_is_refused(self, auth_headers, request_id):
+        """activated -> pending is not in the transition table"""
+        url = f"{BASE_URL}/api/activation-requests/{request_id}/status"
+        assert requests.put(f"{url}?status=activated", headers=auth_headers).status_code == 200
+        response = requests.put(f"{url}?status=pending", headers=auth_headers)
+        assert response.status_code == 409
+        print("SUCCESS: Backwards status change refused")
+
+    def test_unknown_request_is_404(self, auth_headers):
+        """Transitions on a missing request report 404, not a status conflict"""
+        response = requests.put(f"{BASE_URL}/api/activation-requests/{uuid.uuid4()}/status?status=activated", headers=auth_headers)
+        assert response.status_code == 404
+        print("SUCCESS: Missing request returns 404")
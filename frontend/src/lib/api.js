@@ -39,16 +39,27 @@ export const updateSettings = (data) => api.put("/settings", data);
 export const getActivationRequests = (status) => 
   api.get(`/activation-requests${status ? `?status=${status}` : ""}`);
 export const getActivationRequest = (id) => api.get(`/activation-requests/${id}`);
-export const createActivationRequest = (data) => api.post("/activation-requests", data);
+export const createActivationRequest = (data, idempotencyKey) =>
+  api.post("/activation-requests", data, { headers: { "Idempotency-Key": idempotencyKey } });
 export const updateRequestStatus = (id, status) => 
   api.put(`/activation-requests/${id}/status?status=${status}`);
 export const resendEmail = (id) => api.post(`/activation-requests/${id}/resend-email`);
-export const getInvoiceUrl = (id) => `${API_URL}/api/activation-requests/${id}/invoice`;
+export const getInvoiceUrl = async (id) => {
+  const { data } = await api.post(`/activation-requests/${id}/invoice-url`);
+  return `${API_URL}${data.url}`;
+};
 
 // Approval Workflow API
 export const approveRequest = (id) => api.post(`/activation-requests/${id}/approve`);
 export const declineRequest = (id) => api.post(`/activation-requests/${id}/decline`);
 
+// Live updates API (EventSource can't send headers, so the stream URL is signed)
+export const getLiveEventsUrl = async (lastEventId) => {
+  const { data } = await api.post("/activation-events-url");
+  const resume = lastEventId ? `&last_event_id=${encodeURIComponent(lastEventId)}` : "";
+  return `${API_URL}${data.url}${resume}`;
+};
+
 // Stats API
 export const getStats = () => api.get("/stats");
 
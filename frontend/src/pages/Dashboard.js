@@ -1,7 +1,7 @@
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 import { Link } from "react-router-dom";
 import DashboardLayout from "@/components/DashboardLayout";
-import { getActivationRequests, getStats, updateRequestStatus, approveRequest, declineRequest } from "@/lib/api";
+import { getActivationRequests, getActivationRequest, getStats, getLiveEventsUrl, updateRequestStatus, approveRequest, declineRequest } from "@/lib/api";
 import { toast } from "sonner";
 import { Button } from "@/components/ui/button";
 import { Badge } from "@/components/ui/badge";
@@ -72,13 +72,98 @@ export default function Dashboard() {
     fetchData();
   }, [fetchData]);
 
+  // Live updates: patch the table and counters from pushed events instead of refetching
+  const requestsRef = useRef(requests);
+  requestsRef.current = requests;
+  const statsTimer = useRef(null);
+  const refreshStatsSoon = useCallback(() => {
+    clearTimeout(statsTimer.current);
+    statsTimer.current = setTimeout(async () => {
+      try {
+        setStats((await getStats()).data);
+      } catch (error) {
+        // keep the current counters; the next event or reload will correct them
+      }
+    }, 2000);
+  }, []);
+
+  const applyEvent = useCallback((event) => {
+    const matchesFilter = (status) => statusFilter === "all" || statusFilter === status;
+    if (event.type === "created") {
+      if (matchesFilter(event.request.status)) {
+        setRequests(prev => prev.some(r => r.id === event.request.id) ? prev : [event.request, ...prev]);
+      }
+      setStats(prev => ({ ...prev, total: prev.total + 1, [event.request.status]: (prev[event.request.status] || 0) + 1 }));
+    } else if (event.type === "status") {
+      if (requestsRef.current.some(r => r.id === event.id)) {
+        setRequests(prev => prev
+          .filter(r => r.id !== event.id || matchesFilter(event.status))
+          .map(r => r.id === event.id ? { ...r, status: event.status, tgme_ticket_id: event.tgme_ticket_id || r.tgme_ticket_id } : r));
+      } else if (matchesFilter(event.status)) {
+        // Moved into the current filter: fetch just this row
+        getActivationRequest(event.id).then(res => setRequests(prev =>
+          prev.some(r => r.id === event.id) ? prev : [res.data, ...prev]
+        )).catch(() => {});
+      }
+      if (event.previous_status) {
+        setStats(prev => ({
+          ...prev,
+          [event.previous_status]: Math.max((prev[event.previous_status] || 0) - 1, 0),
+          [event.status]: (prev[event.status] || 0) + 1
+        }));
+      } else {
+        refreshStatsSoon();
+      }
+    } else if (event.type === "reset") {
+      // The server lost its change stream position, so some changes were never pushed - reload
+      fetchData();
+    }
+  }, [statusFilter, refreshStatsSoon, fetchData]);
+
+  useEffect(() => {
+    let source = null;
+    let closed = false;
+    let retryTimer = null;
+    let lastEventId = null;
+
+    const connect = async () => {
+      try {
+        const url = await getLiveEventsUrl(lastEventId);
+        if (closed) return;
+        source = new EventSource(url);
+        source.onmessage = (e) => {
+          lastEventId = e.lastEventId || lastEventId;
+          applyEvent(JSON.parse(e.data));
+        };
+        // Too far behind to replay - reload once
+        source.addEventListener("reset", () => fetchData());
+        source.onerror = () => {
+          // The signed URL is only checked on connect; once the browser gives up, sign a new one
+          if (source.readyState === EventSource.CLOSED && !closed) {
+            retryTimer = setTimeout(connect, 3000);
+          }
+        };
+      } catch (error) {
+        if (!closed) retryTimer = setTimeout(connect, 10000);
+      }
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      clearTimeout(statsTimer.current);
+      if (source) source.close();
+    };
+  }, [applyEvent, fetchData]);
+
   const handleStatusChange = async (requestId, newStatus) => {
     try {
       await updateRequestStatus(requestId, newStatus);
       toast.success("Status updated");
       fetchData();
     } catch (error) {
-      toast.error("Failed to update status");
+      toast.error(error.response?.data?.detail || "Failed to update status");
     }
   };
 
@@ -232,6 +317,13 @@ export default function Dashboard() {
                         <code className="font-mono text-sm text-[#1D1D1F] bg-[#F5F5F7] px-2 py-1 rounded">
                           {request.serial_number}
                         </code>
+                        {request.duplicate_of && (
+                          <Link to={`/admin/request/${request.duplicate_of}`} className="block mt-1">
+                            <Badge className="bg-amber-100 text-amber-700 hover:bg-amber-100 font-medium" data-testid={`duplicate-badge-${request.id}`}>
+                              Possible duplicate
+                            </Badge>
+                          </Link>
+                        )}
                       </TableCell>
                       <TableCell>
                         <div>
@@ -65,6 +65,9 @@ export default function NewRequest() {
     fetchPlans();
   }, []);
 
+  // One key per form fill: a retried or double-clicked submit returns the same request
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -92,7 +95,7 @@ export default function NewRequest() {
         plan_id: planId,
         device_activation_date: format(activationDate, "yyyy-MM-dd"),
       };
-      await createActivationRequest(submitData);
+      await createActivationRequest(submitData, idempotencyKey);
       toast.success("Activation request created successfully");
       navigate("/admin");
     } catch (error) {
@@ -53,19 +53,30 @@ export default function PublicForm() {
   const [modelId, setModelId] = useState("");
   const [serialNumber, setSerialNumber] = useState("");
   const [planId, setPlanId] = useState("");
+  const [selectedPlan, setSelectedPlan] = useState(null);
+  const [planQuery, setPlanQuery] = useState("");
   const [activationDate, setActivationDate] = useState(null);
+  // One key per form fill: a retried or double-tapped submit returns the same request
+  const [idempotencyKey, setIdempotencyKey] = useState(() => crypto.randomUUID());
 
+  // Typeahead: ask the server for the top matches instead of downloading the whole catalog
   useEffect(() => {
-    const fetchPlans = async () => {
+    let cancelled = false;
+    const timer = setTimeout(async () => {
       try {
-        const response = await axios.get(`${API_URL}/api/plans?public=true`);
-        setPlans(response.data);
+        const response = await axios.get(`${API_URL}/api/plans/search`, {
+          params: { q: planQuery, limit: 20 },
+        });
+        if (!cancelled) setPlans(response.data);
       } catch (error) {
-        toast.error("Failed to load plans");
+        if (!cancelled) toast.error("Failed to load plans");
       }
+    }, 150);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
     };
-    fetchPlans();
-  }, []);
+  }, [planQuery]);
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -94,8 +105,11 @@ export default function PublicForm() {
         plan_id: planId,
         device_activation_date: format(activationDate, "yyyy-MM-dd"),
       };
-      const response = await axios.post(`${API_URL}/api/activation-requests`, submitData);
-      setSubmittedData(response.data);
+      const response = await axios.post(`${API_URL}/api/activation-requests`, submitData, {
+        headers: { "Idempotency-Key": idempotencyKey },
+      });
+      // A replayed submission only returns id and status, so show the details that were entered
+      setSubmittedData({ ...submitData, ...response.data });
       setSubmitted(true);
       toast.success("Activation request submitted successfully!");
     } catch (error) {
@@ -115,12 +129,13 @@ export default function PublicForm() {
     setModelId("");
     setSerialNumber("");
     setPlanId("");
+    setSelectedPlan(null);
+    setPlanQuery("");
     setActivationDate(null);
+    setIdempotencyKey(crypto.randomUUID());
     setSubmitted(false);
   }, []);
 
-  const selectedPlan = plans.find((p) => p.id === planId);
-
   if (submitted) {
     return (
       <div className="min-h-screen bg-[#F5F5F7] flex items-center justify-center p-4">
@@ -368,17 +383,23 @@ export default function PublicForm() {
                     </Button>
                   </PopoverTrigger>
                   <PopoverContent className="w-full p-0" align="start">
-                    <Command>
-                      <CommandInput placeholder="Search plans..." data-testid="public-plan-search-input" />
+                    <Command shouldFilter={false}>
+                      <CommandInput
+                        placeholder="Search plans..."
+                        value={planQuery}
+                        onValueChange={setPlanQuery}
+                        data-testid="public-plan-search-input"
+                      />
                       <CommandList>
                         <CommandEmpty>No plan found.</CommandEmpty>
                         <CommandGroup>
                           {plans.map((plan) => (
                             <CommandItem
                               key={plan.id}
-                              value={`${plan.sku || plan.part_code} ${plan.description || plan.name} ${plan.mrp || ''}`}
+                              value={plan.id}
                               onSelect={() => {
                                 setPlanId(plan.id);
+                                setSelectedPlan(plan);
                                 setPlanOpen(false);
                               }}
                               data-testid={`public-plan-option-${plan.id}`}
@@ -2,7 +2,6 @@ import { useState, useEffect } from "react";
 import { useParams, useNavigate, Link } from "react-router-dom";
 import DashboardLayout from "@/components/DashboardLayout";
 import { getActivationRequest, updateRequestStatus, resendEmail, getInvoiceUrl } from "@/lib/api";
-import { useAuth } from "@/context/AuthContext";
 import { toast } from "sonner";
 import { Button } from "@/components/ui/button";
 import { Badge } from "@/components/ui/badge";
@@ -42,7 +41,6 @@ const statusConfig = {
 export default function RequestDetail() {
   const { id } = useParams();
   const navigate = useNavigate();
-  const { token } = useAuth();
   const [request, setRequest] = useState(null);
   const [loading, setLoading] = useState(true);
   const [resending, setResending] = useState(false);
@@ -70,7 +68,7 @@ export default function RequestDetail() {
       toast.success("Status updated");
       fetchRequest();
     } catch (error) {
-      toast.error("Failed to update status");
+      toast.error(error.response?.data?.detail || "Failed to update status");
     }
   };
 
@@ -86,9 +84,15 @@ export default function RequestDetail() {
     }
   };
 
-  const handleDownloadInvoice = () => {
-    const url = getInvoiceUrl(id);
-    window.open(`${url}?authorization=Bearer ${token}`, "_blank");
+  const handleDownloadInvoice = async () => {
+    // Open the tab synchronously so popup blockers allow it, then point it at the signed URL
+    const win = window.open("", "_blank");
+    try {
+      win.location.href = await getInvoiceUrl(id);
+    } catch (error) {
+      win.close();
+      toast.error("Failed to download invoice");
+    }
   };
 
   if (loading) {
@@ -8,6 +8,7 @@ import { Input } from "@/components/ui/input";
 import { Label } from "@/components/ui/label";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { Textarea } from "@/components/ui/textarea";
+import { Switch } from "@/components/ui/switch";
 import {
   Dialog,
   DialogContent,
@@ -48,6 +49,11 @@ export default function Settings() {
   // Individual state for each settings field to prevent re-render issues
   const [appleEmail, setAppleEmail] = useState("");
   const [approvalEmail, setApprovalEmail] = useState("");
+  const [approvalDigestEnabled, setApprovalDigestEnabled] = useState(false);
+  const [approvalDigestMinutes, setApprovalDigestMinutes] = useState(15);
+  const [appleBatchEnabled, setAppleBatchEnabled] = useState(false);
+  const [appleBatchMinutes, setAppleBatchMinutes] = useState(15);
+  const [appleBatchMaxRows, setAppleBatchMaxRows] = useState(25);
   const [smtpHost, setSmtpHost] = useState("smtp.gmail.com");
   const [smtpPort, setSmtpPort] = useState(587);
   const [smtpEmail, setSmtpEmail] = useState("");
@@ -88,6 +94,11 @@ export default function Settings() {
       const s = settingsRes.data;
       setAppleEmail(s.apple_email || "");
       setApprovalEmail(s.approval_email || "");
+      setApprovalDigestEnabled(!!s.approval_digest_enabled);
+      setApprovalDigestMinutes(s.approval_digest_minutes || 15);
+      setAppleBatchEnabled(!!s.apple_batch_enabled);
+      setAppleBatchMinutes(s.apple_batch_minutes || 15);
+      setAppleBatchMaxRows(s.apple_batch_max_rows || 25);
       setSmtpHost(s.smtp_host || "smtp.gmail.com");
       setSmtpPort(s.smtp_port || 587);
       setSmtpEmail(s.smtp_email || "");
@@ -113,6 +124,11 @@ export default function Settings() {
       await updateSettings({
         apple_email: appleEmail,
         approval_email: approvalEmail,
+        approval_digest_enabled: approvalDigestEnabled,
+        approval_digest_minutes: parseInt(approvalDigestMinutes) || 15,
+        apple_batch_enabled: appleBatchEnabled,
+        apple_batch_minutes: parseInt(appleBatchMinutes) || 15,
+        apple_batch_max_rows: parseInt(appleBatchMaxRows) || 25,
         smtp_host: smtpHost,
         smtp_port: smtpPort,
         smtp_email: smtpEmail,
@@ -343,6 +359,62 @@ export default function Settings() {
                     </div>
                     <p className="text-xs text-[#86868B]">Email to receive approval requests (default: contact@thegoodmen.in)</p>
                   </div>
+                  <div className="space-y-2">
+                    <Label className="text-xs font-medium text-[#86868B] uppercase tracking-wider">
+                      Approval Digest
+                    </Label>
+                    <div className="flex items-center gap-4">
+                      <Switch
+                        checked={approvalDigestEnabled}
+                        onCheckedChange={setApprovalDigestEnabled}
+                        data-testid="approval-digest-switch"
+                      />
+                      <Input
+                        type="number"
+                        min={1}
+                        value={approvalDigestMinutes}
+                        onChange={(e) => setApprovalDigestMinutes(e.target.value)}
+                        disabled={!approvalDigestEnabled}
+                        className="w-24 bg-[#F5F5F7] border-transparent focus:border-[#0071E3] focus:ring-0 rounded-lg h-11"
+                        data-testid="approval-digest-minutes-input"
+                      />
+                      <span className="text-sm text-[#86868B]">minutes</span>
+                    </div>
+                    <p className="text-xs text-[#86868B]">Send one approval email per window instead of one per request</p>
+                  </div>
+                  <div className="space-y-2">
+                    <Label className="text-xs font-medium text-[#86868B] uppercase tracking-wider">
+                      Apple Email Batching
+                    </Label>
+                    <div className="flex items-center gap-4">
+                      <Switch
+                        checked={appleBatchEnabled}
+                        onCheckedChange={setAppleBatchEnabled}
+                        data-testid="apple-batch-switch"
+                      />
+                      <Input
+                        type="number"
+                        min={1}
+                        value={appleBatchMinutes}
+                        onChange={(e) => setAppleBatchMinutes(e.target.value)}
+                        disabled={!appleBatchEnabled}
+                        className="w-24 bg-[#F5F5F7] border-transparent focus:border-[#0071E3] focus:ring-0 rounded-lg h-11"
+                        data-testid="apple-batch-minutes-input"
+                      />
+                      <span className="text-sm text-[#86868B]">minutes</span>
+                      <Input
+                        type="number"
+                        min={1}
+                        value={appleBatchMaxRows}
+                        onChange={(e) => setAppleBatchMaxRows(e.target.value)}
+                        disabled={!appleBatchEnabled}
+                        className="w-24 bg-[#F5F5F7] border-transparent focus:border-[#0071E3] focus:ring-0 rounded-lg h-11"
+                        data-testid="apple-batch-rows-input"
+                      />
+                      <span className="text-sm text-[#86868B]">rows</span>
+                    </div>
+                    <p className="text-xs text-[#86868B]">Send approved requests to Apple as one email per window, or sooner once the row limit is reached</p>
+                  </div>
                   <div className="space-y-2">
                     <Label className="text-xs font-medium text-[#86868B] uppercase tracking-wider">
                       Partner Name